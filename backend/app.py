@@ -1,13 +1,76 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context, g
 from flask_cors import CORS
-from mongo_utils import MongoDBClient
-from map_reduce.ville_stats import execute_ville_stats
+from mongo_utils import (
+    MongoDBClient,
+    CITY_SORT_KEYS,
+    DERIVED_FIELDS,
+    DUPLICATE_ERROR,
+    DUPLICATE_POLICIES,
+    DUPLICATE_POLICY,
+    INDEX_SPECS,
+    STREAM_BATCH_SIZE,
+    change_stamp,
+    derived_fields
+)
+from map_reduce.ville_stats import execute_ville_stats, VILLE_STATS_ENGINE
+from map_reduce.ville_stats_summary import (
+    affects_ville_stats,
+    check_ville_stats_summary,
+    read_ville_stats_summary,
+    rebuild_ville_stats_summary,
+    record_bulk_insert,
+    record_employee_change
+)
 from map_reduce.doublons_detect import execute_doublons_detect
+from map_reduce.doublons_fuzzy import (
+    DEFAULT_THRESHOLD,
+    FUZZY_JOB_TYPE,
+    read_doublons_fuzzy,
+    run_doublons_fuzzy_job
+)
+from map_reduce.dashboard import DASHBOARD_TOP_LIMIT, execute_dashboard
+from cache_utils import create_cache
+from json_utils import MongoJSONProvider, dumps_bytes
+from metrics import (
+    CommandMetrics,
+    REQUEST_LATENCY,
+    REQUESTS_IN_FLIGHT,
+    RESPONSE_SIZE,
+    current_route,
+    render_metrics
+)
+from slow_queries import SlowQueryRecorder
+from pymongo import monitoring
+from ingest import PARSERS, bulk_insert, clean_employee
+from batch_ops import BATCH_MAX_OPS, execute_batch
+from export_utils import EXPORT_COLUMNS, EXPORT_FORMATS, export_projection, gzip_chunks, iter_export
+from change_feed import current_token, ensure_change_feed_indexes, get_changes, record_delete, start_token
+from jobs import (
+    create_job,
+    ensure_job_indexes,
+    find_active_job,
+    find_completed_job,
+    format_job,
+    get_job,
+    run_increment_prime_job,
+    start_job
+)
+from name_search import (
+    NAME_FIELDS,
+    ensure_name_index,
+    index_employee,
+    index_employees,
+    rebuild_name_index,
+    search_names,
+    unindex_employee
+)
 import os
 from dotenv import load_dotenv
 from bson import ObjectId
 import logging
 import datetime
+import hashlib
+import time
 
 load_dotenv()
 
@@ -16,6 +79,8 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Sérialisation en une passe des types BSON (ObjectId, dates, Decimal128)
+app.json = MongoJSONProvider(app)
 
 # Configuration CORS très permissive pour tous les environnements
 CORS(app, resources={
@@ -23,12 +88,48 @@ CORS(app, resources={
         "origins": "*",  # Permettre toutes les origines
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
         "allow_headers": ["Content-Type", "Authorization", "Accept"],
-        "expose_headers": ["Content-Type", "Authorization"],
+        "expose_headers": ["Content-Type", "Authorization", "ETag"],
         "supports_credentials": False,
         "max_age": 86400
     }
 })
 
+# Métriques Prometheus (/api/metrics), valeurs propres à chaque worker.
+# Ces hooks sont enregistrés en premier : ils s'exécutent même si un autre
+# before_request répond directement (OPTIONS, 304)
+monitoring.register(CommandMetrics())
+
+# Commandes lentes avec explain échantillonné (/api/admin/slow-queries)
+slow_queries = SlowQueryRecorder(lambda: mongo_client.client, get_route=current_route.get)
+monitoring.register(slow_queries)
+
+@app.before_request
+def start_request_metrics():
+    """Démarrer la mesure de la requête et marquer la route pour les commandes MongoDB"""
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_started_at = time.perf_counter()
+    current_route.set(g.metrics_route)
+    REQUESTS_IN_FLIGHT.inc((g.metrics_route,))
+
+@app.after_request
+def record_request_metrics(response):
+    """Latence (jusqu'aux headers pour les réponses en streaming) et taille de la réponse"""
+    route = g.get('metrics_route')
+    if route:
+        elapsed = time.perf_counter() - g.metrics_started_at
+        REQUEST_LATENCY.observe(elapsed, (request.method, route, str(response.status_code)))
+        if response.content_length is not None:
+            RESPONSE_SIZE.observe(response.content_length, (request.method, route))
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exception=None):
+    """Fin de la requête, streaming compris"""
+    route = g.pop('metrics_route', None)
+    if route:
+        REQUESTS_IN_FLIGHT.dec((route,))
+        current_route.set('none')
+
 # Middleware pour ajouter les headers CORS
 @app.after_request
 def after_request(response):
@@ -50,14 +151,197 @@ def handle_options_request():
         return response
 
 # Initialiser le client MongoDB
+# Aucune connexion à l'import : avec gunicorn --preload, le maître ne crée pas
+# de client, chaque worker crée le sien (et les index) à sa première requête.
 try:
     mongo_client = MongoDBClient()
-    mongo_client.connect()
-    logger.info("✅ MongoDB connected successfully")
+    # Index des trigrammes, du flux des modifications et des travaux
+    mongo_client.setup_hooks += [ensure_name_index, ensure_change_feed_indexes, ensure_job_indexes]
+    logger.info("✅ MongoDB client configured")
 except Exception as e:
-    logger.error(f"❌ MongoDB connection failed: {e}")
+    logger.error(f"❌ MongoDB client configuration failed: {e}")
     mongo_client = None
 
+# Cache des analytics, invalidé par les routes d'écriture
+# La séquence du flux des modifications (compteur partagé, incrémenté par
+# chaque écriture) versionne le cache et les ETag de tous les workers.
+data_version = (lambda: current_token(mongo_client.collection)) if mongo_client else None
+try:
+    analytics_cache = create_cache((lambda: mongo_client.db) if mongo_client else None, data_version)
+except Exception as e:
+    logger.error(f"❌ Shared cache unavailable, using in-process cache: {e}")
+    analytics_cache = create_cache(get_version=data_version)
+
+# ETag / GET conditionnel : version commune à tous les workers (séquence des
+# écritures), ETAG_WINDOW borne la durée de validité (écritures faites hors de l'API).
+ETAG_WINDOW = int(os.getenv('ETAG_WINDOW', 300))
+ETAG_PREFIXES = ('/api/employees', '/api/analytics')
+
+def etag_for(full_path, accept, encoding):
+    """ETag fort d'une requête (chemin + paramètres) pour la version actuelle de la collection
+
+    None sans version partagée : un worker ne doit pas valider (304) une
+    réponse alors qu'une écriture a été reçue par un autre.
+    """
+    data = analytics_cache.get_version()
+    if data is None:
+        return None
+    version = f"{data}:{int(time.time() // ETAG_WINDOW)}"
+    digest = hashlib.sha1(f"{version}|{full_path}|{accept}|{encoding}".encode()).hexdigest()
+    return digest[:32]
+
+def compute_etag():
+    """ETag de la requête Flask courante"""
+    # Corps gzip et identité distincts (export) : encodage inclus dans l'ETag
+    encoding = 'gzip' if 'gzip' in request.accept_encodings else 'identity'
+    return etag_for(request.full_path, request.headers.get('Accept', ''), encoding)
+
+@app.before_request
+def check_if_none_match():
+    """Répondre 304 sans interroger MongoDB si le client a déjà la bonne version"""
+    if request.method != 'GET' or not request.path.startswith(ETAG_PREFIXES):
+        return None
+    if request.args.get('mode') == 'fuzzy':
+        # Résultat d'un travail de fond : change sans écriture sur les employés
+        return None
+    try:
+        g.etag = compute_etag()
+    except Exception as e:
+        logger.error(f"Error while computing ETag: {e}")
+        return None
+    if g.etag and g.etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(g.etag)
+        return response
+    return None
+
+@app.after_request
+def add_etag(response):
+    """Ajouter l'ETag calculé avant la requête aux réponses 200"""
+    etag = g.get('etag')
+    if etag and response.status_code == 200:
+        response.set_etag(etag)
+        # Le navigateur revalide à chaque fois (If-None-Match)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Pagination keyset (_id) pour les routes qui retournent des listes
+DEFAULT_PAGE_LIMIT = int(os.getenv('API_DEFAULT_PAGE_LIMIT', 1000))
+MAX_PAGE_LIMIT = int(os.getenv('API_MAX_PAGE_LIMIT', 5000))
+
+def get_positive_int_arg(name, default=None):
+    """Entier strictement positif du paramètre name (ValueError si invalide)"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        value = 0
+    if value <= 0:
+        raise ValueError(f"'{name}' must be a positive integer")
+    return value
+
+def get_pagination_args(stream=False, sort_cursor=False):
+    """Lire les paramètres after, limit et fields de la requête
+    
+    En mode streaming, la limite n'est appliquée que si elle est demandée.
+    Avec sort_cursor, after est un curseur de tri opaque et non un _id.
+    """
+    after = request.args.get('after') or None
+    if after is not None and not sort_cursor and not ObjectId.is_valid(after):
+        raise ValueError("Invalid 'after' cursor")
+    
+    limit = get_positive_int_arg('limit', None if stream else DEFAULT_PAGE_LIMIT)
+    if limit and not stream:
+        limit = min(limit, MAX_PAGE_LIMIT)
+    
+    fields_param = request.args.get('fields', '')
+    fields = [field.strip() for field in fields_param.split(',') if field.strip()] or None
+    return after, limit, fields
+
+def get_duplicate_policy():
+    """Politique des doublons de la requête (?on_duplicate=allow|reject)
+
+    ?allow_duplicate=1 reste accepté ; sans paramètre, DUPLICATE_POLICY s'applique.
+    """
+    policy = request.args.get('on_duplicate')
+    if policy is None:
+        if request.args.get('allow_duplicate', '').lower() in ['true', '1', 'yes']:
+            return 'allow'
+        return DUPLICATE_POLICY
+    if policy not in DUPLICATE_POLICIES:
+        raise ValueError(f"'on_duplicate' must be one of {', '.join(DUPLICATE_POLICIES)}")
+    return policy
+
+def next_cursor(documents, limit):
+    """Curseur de la page suivante (dernier _id) ou None si la page est incomplète"""
+    if limit and len(documents) == limit:
+        return str(documents[-1]['_id'])
+    return None
+
+def sync_ville_stats(before=None, after=None):
+    """Mettre à jour le résumé par ville après une écriture"""
+    try:
+        record_employee_change(mongo_client.collection, before, after)
+    except Exception as e:
+        # L'écriture principale a réussi : le résumé sera réparé par un rebuild
+        logger.error(f"Error while updating ville stats summary: {e}")
+
+def invalidate_cache():
+    """Nouvelle génération de la collection : les résultats en cache sont périmés"""
+    try:
+        analytics_cache.bump_generation()
+    except Exception as e:
+        logger.error(f"Error while invalidating analytics cache: {e}")
+
+def sync_name_index(employee=None, employee_id=None):
+    """Mettre à jour l'index des trigrammes après une écriture"""
+    try:
+        if employee:
+            index_employee(mongo_client.collection, employee)
+        else:
+            unindex_employee(mongo_client.collection, employee_id)
+    except Exception as e:
+        logger.error(f"Error while updating name index: {e}")
+
+# Réponses en streaming (NDJSON ou tableau JSON envoyé par morceaux)
+def get_stream_format():
+    """Format de streaming demandé ('ndjson', 'json') ou None"""
+    stream = request.args.get('stream', '').lower()
+    if stream in ('1', 'true', 'yes', 'ndjson'):
+        return 'ndjson'
+    if stream == 'json':
+        return 'json'
+    if request.accept_mimetypes.best == 'application/x-ndjson':
+        return 'ndjson'
+    return None
+
+def serialize_document(document):
+    """Sérialiser un document MongoDB (ObjectId, dates...) en JSON (octets UTF-8)"""
+    return dumps_bytes(document)
+
+def stream_response(cursor, stream_format, key='employees'):
+    """Envoyer les documents d'un curseur au fur et à mesure de leur lecture"""
+    def generate():
+        try:
+            if stream_format == 'json':
+                yield b'{"%s": [' % key.encode('utf-8')
+                for index, document in enumerate(cursor):
+                    yield (b',' if index else b'') + serialize_document(document)
+                yield b']}'
+            else:
+                for document in cursor:
+                    yield serialize_document(document) + b'\n'
+        except Exception as e:
+            # Les headers sont déjà envoyés : on ne peut que journaliser
+            logger.error(f"Error while streaming {key}: {e}")
+        finally:
+            cursor.close()
+    
+    mimetype = 'application/json' if stream_format == 'json' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
 @app.route('/')
 def index():
     """Page d'accueil de l'API"""
@@ -68,8 +352,10 @@ def index():
         "timestamp": datetime.datetime.utcnow().isoformat(),
         "endpoints": {
             "health": "/api/health",
+            "metrics": "/api/metrics",
             "employees": "/api/employees",
             "analytics": "/api/analytics/*",
+            "jobs": "/api/jobs/<id>",
             "collections": "/api/collections"
         },
         "cors": "enabled"
@@ -77,15 +363,27 @@ def index():
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Endpoint de santé"""
-    status = "healthy" if mongo_client and mongo_client.client else "unhealthy"
+    """Endpoint de santé (ping réel du serveur MongoDB)"""
+    ping_ms = None
+    if mongo_client:
+        try:
+            ping_ms = mongo_client.ping()
+        except Exception as e:
+            logger.error(f"MongoDB ping failed: {e}")
+    status = "healthy" if ping_ms is not None else "unhealthy"
     return jsonify({
         "status": status,
         "service": "MongoDB Employees API",
         "timestamp": datetime.datetime.utcnow().isoformat(),
-        "mongo_connected": mongo_client is not None and mongo_client.client is not None
+        "mongo_connected": ping_ms is not None,
+        "mongo_ping_ms": ping_ms
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Métriques au format texte Prometheus (routes HTTP et commandes MongoDB)"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/test', methods=['GET'])
 def test_endpoint():
     """Endpoint de test simple"""
@@ -119,21 +417,75 @@ def get_all_employees():
         if not mongo_client:
             return jsonify({"error": "MongoDB not connected"}), 500
             
-        employees = mongo_client.get_all_documents()
-        # Convertir ObjectId en string pour la sérialisation JSON
-        for emp in employees:
-            if '_id' in emp:
-                emp['_id'] = str(emp['_id'])
+        stream_format = get_stream_format()
+        try:
+            after, limit, fields = get_pagination_args(stream_format is not None)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+            
+        if stream_format:
+            return stream_response(
+                mongo_client.get_all_documents(after, limit, fields, stream=True),
+                stream_format
+            )
         
+        employees = mongo_client.get_all_documents(after, limit, fields)
+        cursor = next_cursor(employees, limit)
         return jsonify({
             "employees": employees,
             "count": len(employees),
+            "limit": limit,
+            "next": cursor,
             "timestamp": datetime.datetime.utcnow().isoformat()
         })
     except Exception as e:
         logger.error(f"Error in get_all_employees: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/employees/export', methods=['GET'])
+def export_employees():
+    """Export en flux (CSV, Parquet ou Arrow) avec adresse.* en colonnes"""
+    try:
+        if not mongo_client:
+            return jsonify({"error": "MongoDB not connected"}), 500
+            
+        export_format = request.args.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({"error": f"Unsupported format: {export_format}"}), 400
+        
+        fields_param = request.args.get('fields', '')
+        columns = [field.strip() for field in fields_param.split(',') if field.strip()] or EXPORT_COLUMNS
+        
+        cursor = mongo_client.collection.find({}, export_projection(columns)).batch_size(STREAM_BATCH_SIZE)
+        try:
+            chunks = iter_export(cursor, columns, export_format)
+        except RuntimeError as e:
+            cursor.close()
+            return jsonify({"error": str(e)}), 501
+        
+        mimetype, extension = EXPORT_FORMATS[export_format]
+        headers = {
+            "Content-Disposition": f"attachment; filename=employees.{extension}",
+            "Vary": "Accept-Encoding"
+        }
+        # Parquet est déjà compressé : gzip seulement pour CSV et Arrow
+        if export_format != 'parquet' and 'gzip' in request.accept_encodings:
+            chunks = gzip_chunks(chunks)
+            headers["Content-Encoding"] = "gzip"
+        
+        def generate():
+            try:
+                yield from chunks
+            except Exception as e:
+                logger.error(f"Error while streaming export: {e}")
+            finally:
+                cursor.close()
+        
+        return Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
+    except Exception as e:
+        logger.error(f"Error in export_employees: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/employees/count', methods=['GET'])
 def count_employees():
     """c. Compter le nombre de documents"""
@@ -141,7 +493,7 @@ def count_employees():
         if not mongo_client:
             return jsonify({"error": "MongoDB not connected"}), 500
             
-        count = mongo_client.count_documents()
+        count = analytics_cache.get_or_compute("count", None, mongo_client.count_documents)
         return jsonify({
             "count": count,
             "message": f"Total employees: {count}"
@@ -150,6 +502,40 @@ def count_employees():
         logger.error(f"Error in count_employees: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/employees/changes', methods=['GET'])
+def get_employee_changes():
+    """Modifications (insertions, mises à jour, suppressions) depuis un jeton"""
+    try:
+        if not mongo_client:
+            return jsonify({"error": "MongoDB not connected"}), 500
+            
+        since = request.args.get('since')
+        if not since:
+            # Sans jeton : position actuelle, à prendre avant un chargement complet
+            return jsonify({
+                "changes": [],
+                "token": start_token(mongo_client.collection),
+                "has_more": False
+            })
+        
+        try:
+            limit = get_positive_int_arg('limit', DEFAULT_PAGE_LIMIT)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            result = get_changes(mongo_client.collection, since, min(limit, MAX_PAGE_LIMIT))
+        except ValueError:
+            return jsonify({"error": "Invalid 'since' token"}), 400
+        except LookupError as e:
+            # Jeton sorti de l'historique : le client doit recharger puis reprendre
+            return jsonify({"error": str(e)}), 410
+        
+        result['count'] = len(result['changes'])
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in get_employee_changes: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/employees', methods=['POST'])
 def add_employee():
     """d. Insérer un employé"""
@@ -161,21 +547,27 @@ def add_employee():
         if not data:
             return jsonify({"error": "No data provided"}), 400
         
-        required_fields = ['nom', 'prenom']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({"error": f"Missing required field: {field}"}), 400
-        
-        # Nettoyer les données
-        employee_data = {
-            "nom": data.get('nom', '').strip(),
-            "prenom": data.get('prenom', '').strip(),
-            "anciennete": float(data.get('anciennete', 0)) if data.get('anciennete') else 0,
-            "prime": float(data.get('prime', 0)) if data.get('prime') else 0,
-            "adresse": data.get('adresse', {})
-        }
+        # Valider et nettoyer les données
+        try:
+            employee_data = clean_employee(data)
+            duplicate_policy = get_duplicate_policy()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Vérification des doublons avant insertion (?on_duplicate=reject)
+        if duplicate_policy == 'reject':
+            duplicate = mongo_client.find_duplicate(employee_data)
+            if duplicate:
+                return jsonify({
+                    "error": DUPLICATE_ERROR,
+                    "duplicate_id": str(duplicate['_id'])
+                }), 409
         
         inserted_id = mongo_client.insert_employee(employee_data)
+        sync_ville_stats(after=employee_data)
+        sync_name_index(employee_data)
+        invalidate_cache()
+        employee_data['_id'] = str(inserted_id)
         return jsonify({
             "message": "Employee added successfully",
             "id": str(inserted_id),
@@ -185,6 +577,106 @@ def add_employee():
         logger.error(f"Error in add_employee: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/employees/bulk', methods=['POST'])
+def bulk_add_employees():
+    """Insertion en masse (tableau JSON, NDJSON ou CSV) par lots insert_many
+
+    Les doublons nom + prénom suivent la même politique que POST /api/employees
+    (?on_duplicate=reject : lignes refusées et listées dans errors).
+    """
+    try:
+        if not mongo_client:
+            return jsonify({"error": "MongoDB not connected"}), 500
+            
+        # Format : ?format=json|ndjson|csv, sinon déduit du Content-Type
+        body_format = request.args.get('format')
+        if not body_format:
+            body_format = {
+                'application/x-ndjson': 'ndjson',
+                'text/csv': 'csv'
+            }.get(request.mimetype, 'json')
+        if body_format not in PARSERS:
+            return jsonify({"error": f"Unsupported format: {body_format}"}), 400
+        
+        try:
+            batch_size = get_positive_int_arg('batch_size')
+            duplicate_policy = get_duplicate_policy()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        def on_inserted(employees):
+            try:
+                record_bulk_insert(mongo_client.collection, employees)
+                index_employees(mongo_client.collection, employees)
+            except Exception as e:
+                logger.error(f"Error while updating summaries after bulk insert: {e}")
+        
+        rows = PARSERS[body_format](request.stream)
+        report = bulk_insert(
+            mongo_client.collection, rows,
+            **({"batch_size": batch_size} if batch_size else {}),
+            on_inserted=on_inserted,
+            reject_duplicates=(duplicate_policy == 'reject')
+        )
+        if report["inserted"]:
+            invalidate_cache()
+        
+        report["format"] = body_format
+        report["on_duplicate"] = duplicate_policy
+        status = 201 if report["inserted"] else 400
+        return jsonify(report), status
+    except Exception as e:
+        logger.error(f"Error in bulk_add_employees: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/employees/batch', methods=['POST'])
+def batch_employees():
+    """Opérations en lot (update, replace, delete, upsert) via bulk_write"""
+    try:
+        if not mongo_client:
+            return jsonify({"error": "MongoDB not connected"}), 500
+            
+        data = request.get_json()
+        operations = data.get('operations') if isinstance(data, dict) else data
+        if not isinstance(operations, list) or not operations:
+            return jsonify({"error": "No operations provided"}), 400
+        if len(operations) > BATCH_MAX_OPS:
+            return jsonify({"error": f"Too many operations (max {BATCH_MAX_OPS})"}), 413
+        try:
+            duplicate_policy = get_duplicate_policy()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        def on_changes(before, after):
+            # Répercuter les écritures sur les résumés, l'index des noms et le flux
+            for employee_id in set(before) | set(after):
+                previous = before.get(employee_id)
+                current = after.get(employee_id)
+                sync_ville_stats(previous, current)
+                if current is None:
+                    sync_name_index(employee_id=employee_id)
+                    record_delete(mongo_client.collection, employee_id)
+                elif previous is None or any(previous.get(f) != current.get(f) for f in NAME_FIELDS):
+                    sync_name_index(current)
+        
+        report = execute_batch(
+            mongo_client.collection, operations, on_changes=on_changes,
+            reject_duplicates=(duplicate_policy == 'reject')
+        )
+        report["on_duplicate"] = duplicate_policy
+        if report["matched_count"] or report["deleted_count"] or report["upserted_count"]:
+            invalidate_cache()
+        
+        for upserted in report["upserted"]:
+            upserted['id'] = str(upserted['id'])
+        for result in report["results"]:
+            if result["upserted_id"] is not None:
+                result["upserted_id"] = str(result["upserted_id"])
+        return jsonify(report)
+    except Exception as e:
+        logger.error(f"Error in batch_employees: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/employees/<employee_id>', methods=['GET'])
 def get_employee(employee_id):
     """Obtenir un employé spécifique"""
@@ -195,9 +687,9 @@ def get_employee(employee_id):
         if not ObjectId.is_valid(employee_id):
             return jsonify({"error": "Invalid employee ID"}), 400
             
-        employee = mongo_client.collection.find_one({"_id": ObjectId(employee_id)})
+        projection = {field: 0 for field in DERIVED_FIELDS}
+        employee = mongo_client.collection.find_one({"_id": ObjectId(employee_id)}, projection)
         if employee:
-            employee['_id'] = str(employee['_id'])
             return jsonify(employee)
         else:
             return jsonify({"error": "Employee not found"}), 404
@@ -219,16 +711,38 @@ def update_employee(employee_id):
         if not data:
             return jsonify({"error": "No data provided"}), 400
         
-        # Nettoyer les données (enlever _id si présent)
+        # Nettoyer les données (enlever _id et les champs calculés si présents)
         if '_id' in data:
             del data['_id']
+        for field in DERIVED_FIELDS:
+            data.pop(field, None)
+        data.update(derived_fields(data))
+        data.update(change_stamp(mongo_client.collection))
         
         # Mettre à jour l'employé
+        names_changed = any(field in data for field in NAME_FIELDS)
+        tracked = affects_ville_stats(data) or names_changed
+        projection = {"adresse": 1, "anciennete": 1, "nom": 1, "prenom": 1}
+        before = None
+        if tracked:
+            before = mongo_client.collection.find_one({"_id": ObjectId(employee_id)}, projection)
+        if before and names_changed:
+            # La clé de doublon dépend du nom et du prénom : compléter avec l'existant
+            current_names = {field: before[field] for field in NAME_FIELDS if field in before}
+            data.update(derived_fields(dict(current_names, **data)))
         result = mongo_client.collection.update_one(
             {"_id": ObjectId(employee_id)},
             {"$set": data}
         )
         
+        if result.modified_count > 0:
+            invalidate_cache()
+        if before and result.modified_count > 0:
+            after = mongo_client.collection.find_one({"_id": ObjectId(employee_id)}, projection)
+            sync_ville_stats(before, after)
+            if names_changed and after:
+                sync_name_index(after)
+        
         if result.matched_count > 0:
             return jsonify({
                 "message": "Employee updated successfully",
@@ -252,12 +766,17 @@ def delete_employee(employee_id):
         if not ObjectId.is_valid(employee_id):
             return jsonify({"error": "Invalid employee ID"}), 400
             
-        result = mongo_client.collection.delete_one({"_id": ObjectId(employee_id)})
+        # find_one_and_delete renvoie le document supprimé pour le résumé par ville
+        deleted = mongo_client.collection.find_one_and_delete({"_id": ObjectId(employee_id)})
         
-        if result.deleted_count > 0:
+        if deleted:
+            sync_ville_stats(before=deleted)
+            sync_name_index(employee_id=deleted['_id'])
+            record_delete(mongo_client.collection, deleted['_id'])
+            invalidate_cache()
             return jsonify({
                 "message": "Employee deleted successfully",
-                "deleted_count": result.deleted_count,
+                "deleted_count": 1,
                 "employee_id": employee_id
             })
         else:
@@ -273,18 +792,39 @@ def find_by_name_pattern(pattern):
         if not mongo_client:
             return jsonify({"error": "MongoDB not connected"}), 500
             
+        stream_format = get_stream_format()
+        try:
+            after, limit, fields = get_pagination_args(stream_format is not None)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+            
         position = request.args.get('position', 'start')
-        employees = mongo_client.find_by_name_pattern(pattern, position)
+        if position == 'any':
+            # Sous-chaîne : index des trigrammes, résultats classés (pas de curseur)
+            employees = search_names(mongo_client.collection, pattern, limit, fields)
+            return jsonify({
+                "pattern": pattern,
+                "position": position,
+                "employees": employees,
+                "count": len(employees),
+                "next": None
+            })
         
-        for emp in employees:
-            if '_id' in emp:
-                emp['_id'] = str(emp['_id'])
+        if stream_format:
+            return stream_response(
+                mongo_client.find_by_name_pattern(pattern, position, after, limit, fields, stream=True),
+                stream_format
+            )
+        
+        employees = mongo_client.find_by_name_pattern(pattern, position, after, limit, fields)
+        cursor = next_cursor(employees, limit)
         
         return jsonify({
             "pattern": pattern,
             "position": position,
             "employees": employees,
-            "count": len(employees)
+            "count": len(employees),
+            "next": cursor
         })
     except Exception as e:
         logger.error(f"Error in find_by_name_pattern: {e}")
@@ -297,17 +837,27 @@ def find_by_name_length(pattern, length):
         if not mongo_client:
             return jsonify({"error": "MongoDB not connected"}), 500
             
-        employees = mongo_client.find_name_length(pattern, length)
+        stream_format = get_stream_format()
+        try:
+            after, limit, fields = get_pagination_args(stream_format is not None)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+            
+        if stream_format:
+            return stream_response(
+                mongo_client.find_name_length(pattern, length, after, limit, fields, stream=True),
+                stream_format
+            )
         
-        for emp in employees:
-            if '_id' in emp:
-                emp['_id'] = str(emp['_id'])
+        employees = mongo_client.find_name_length(pattern, length, after, limit, fields)
+        cursor = next_cursor(employees, limit)
         
         return jsonify({
             "pattern": pattern,
             "length": length,
             "employees": employees,
-            "count": len(employees)
+            "count": len(employees),
+            "next": cursor
         })
     except Exception as e:
         logger.error(f"Error in find_by_name_length: {e}")
@@ -320,16 +870,26 @@ def find_by_seniority(years):
         if not mongo_client:
             return jsonify({"error": "MongoDB not connected"}), 500
             
-        employees = mongo_client.find_by_seniority(years)
+        stream_format = get_stream_format()
+        try:
+            after, limit, fields = get_pagination_args(stream_format is not None)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+            
+        if stream_format:
+            return stream_response(
+                mongo_client.find_by_seniority(years, after, limit, fields, stream=True),
+                stream_format
+            )
         
-        for emp in employees:
-            if '_id' in emp:
-                emp['_id'] = str(emp['_id'])
+        employees = mongo_client.find_by_seniority(years, after, limit, fields)
+        cursor = next_cursor(employees, limit)
         
         return jsonify({
             "years": years,
             "employees": employees,
-            "count": len(employees)
+            "count": len(employees),
+            "next": cursor
         })
     except Exception as e:
         logger.error(f"Error in find_by_seniority: {e}")
@@ -342,15 +902,25 @@ def find_with_street():
         if not mongo_client:
             return jsonify({"error": "MongoDB not connected"}), 500
             
-        employees = mongo_client.find_with_street_address()
+        stream_format = get_stream_format()
+        try:
+            after, limit, fields = get_pagination_args(stream_format is not None)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+            
+        if stream_format:
+            return stream_response(
+                mongo_client.find_with_street_address(after, limit, fields, stream=True),
+                stream_format
+            )
         
-        for emp in employees:
-            if '_id' in emp:
-                emp['_id'] = str(emp['_id'])
+        employees = mongo_client.find_with_street_address(after, limit, fields)
+        cursor = next_cursor(employees, limit)
         
         return jsonify({
             "employees": employees,
-            "count": len(employees)
+            "count": len(employees),
+            "next": cursor
         })
     except Exception as e:
         logger.error(f"Error in find_with_street: {e}")
@@ -358,15 +928,45 @@ def find_with_street():
 
 @app.route('/api/employees/increment-prime', methods=['POST'])
 def increment_prime():
-    """j. Incrémenter la prime"""
+    """j. Incrémenter la prime
+
+    mode=job (ou un job_id dans le corps) : exécution en arrière-plan par lots,
+    suivie via /api/jobs/<id>. Renvoyer le même job_id reprend un travail
+    interrompu sans incrémenter deux fois les employés déjà traités.
+    """
     try:
         if not mongo_client:
             return jsonify({"error": "MongoDB not connected"}), 500
             
-        data = request.get_json() or {}
+        data = request.get_json(silent=True) or {}
         amount = data.get('amount', 200)
         
+        if request.args.get('mode', data.get('mode')) == 'job' or 'job_id' in data:
+            if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+                return jsonify({"error": "amount must be a number"}), 400
+            try:
+                job, created = create_job(
+                    mongo_client.collection, "increment_prime", {"amount": amount}, data.get('job_id')
+                )
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except RuntimeError as e:
+                return jsonify({"error": str(e)}), 409
+            
+            started = job["status"] != "completed" and start_job(
+                mongo_client.collection, job["_id"], run_increment_prime_job,
+                on_batch=lambda modified: invalidate_cache()
+            )
+            result = get_job(mongo_client.collection, job["_id"]) or format_job(job)
+            result["created"] = created
+            result["started"] = started
+            response = jsonify(result)
+            response.headers['Location'] = f"/api/jobs/{job['_id']}"
+            return response, 200 if result["status"] == "completed" else 202
+        
         modified = mongo_client.increment_prime(amount)
+        if modified:
+            invalidate_cache()
         return jsonify({
             "message": f"Prime incremented successfully",
             "amount": amount,
@@ -376,6 +976,21 @@ def increment_prime():
         logger.error(f"Error in increment_prime: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Avancement d'un travail de fond (lots traités, dernier _id, statut)"""
+    try:
+        if not mongo_client:
+            return jsonify({"error": "MongoDB not connected"}), 500
+            
+        job = get_job(mongo_client.collection, job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job)
+    except Exception as e:
+        logger.error(f"Error in get_job_status: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/employees/oldest/<int:limit>', methods=['GET'])
 def get_oldest_employees(limit=10):
     """k. Les X employés les plus anciens"""
@@ -385,10 +1000,6 @@ def get_oldest_employees(limit=10):
             
         employees = mongo_client.get_oldest_employees(limit)
         
-        for emp in employees:
-            if '_id' in emp:
-                emp['_id'] = str(emp['_id'])
-        
         return jsonify({
             "limit": limit,
             "employees": employees,
@@ -400,20 +1011,22 @@ def get_oldest_employees(limit=10):
 
 @app.route('/api/employees/city/<city>', methods=['GET'])
 def group_by_city(city):
-    """l. Regrouper par ville"""
+    """l. Regrouper par ville : effectif, statistiques et employés paginés
+    
+    ?sort=prenom|nom|anciennete|prime|_id, ?after=<curseur "next">, ?limit, ?fields
+    """
     try:
         if not mongo_client:
             return jsonify({"error": "MongoDB not connected"}), 500
             
-        result = mongo_client.group_by_city(city)
-        
-        # Convertir ObjectId en string
-        for group in result:
-            if '_id' in group:
-                group['_id'] = str(group['_id'])
-            for emp in group.get('employees', []):
-                if '_id' in emp:
-                    emp['_id'] = str(emp['_id'])
+        sort = request.args.get('sort', 'prenom')
+        if sort not in CITY_SORT_KEYS:
+            return jsonify({"error": f"'sort' must be one of {', '.join(CITY_SORT_KEYS)}"}), 400
+        try:
+            after, limit, fields = get_pagination_args(sort_cursor=True)
+            result = mongo_client.group_by_city(city, sort, after, limit, fields)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         return jsonify(result)
     except Exception as e:
@@ -431,17 +1044,27 @@ def search_employees():
         cities_param = request.args.get('cities', 'Bordeaux,Paris')
         cities = [city.strip() for city in cities_param.split(',') if city.strip()]
         
-        employees = mongo_client.find_by_city_and_name(name_pattern, cities)
+        stream_format = get_stream_format()
+        try:
+            after, limit, fields = get_pagination_args(stream_format is not None)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+            
+        if stream_format:
+            return stream_response(
+                mongo_client.find_by_city_and_name(name_pattern, cities, after, limit, fields, stream=True),
+                stream_format
+            )
         
-        for emp in employees:
-            if '_id' in emp:
-                emp['_id'] = str(emp['_id'])
+        employees = mongo_client.find_by_city_and_name(name_pattern, cities, after, limit, fields)
+        cursor = next_cursor(employees, limit)
         
         return jsonify({
             "name_pattern": name_pattern,
             "cities": cities,
             "employees": employees,
-            "count": len(employees)
+            "count": len(employees),
+            "next": cursor
         })
     except Exception as e:
         logger.error(f"Error in search_employees: {e}")
@@ -455,13 +1078,16 @@ def get_ville_stats():
         if not mongo_client:
             return jsonify({"error": "MongoDB not connected"}), 500
             
+        # ?engine=aggregate|python pour forcer un recalcul complet
+        engine = request.args.get('engine') or VILLE_STATS_ENGINE
+        # Mis en cache sous la version courante : lu sur le primaire, un
+        # secondaire en retard y figerait des données périmées
         collection = mongo_client.collection
-        results = execute_ville_stats(collection)
-        
-        # Convertir ObjectId en string
-        for result in results:
-            if '_id' in result:
-                result['_id'] = str(result['_id'])
+        if engine == 'summary':
+            compute = lambda: read_ville_stats_summary(collection)
+        else:
+            compute = lambda: execute_ville_stats(collection, engine)
+        results = analytics_cache.get_or_compute("ville-stats", {"engine": engine}, compute)
         
         return jsonify({
             "stats": results,
@@ -471,6 +1097,73 @@ def get_ville_stats():
         logger.error(f"Error in get_ville_stats: {e}")
         return jsonify({"error": str(e), "results": []}), 500
 
+@app.route('/api/analytics/dashboard', methods=['GET'])
+def get_dashboard():
+    """Résumé du tableau de bord (une seule agrégation $facet)"""
+    try:
+        if not mongo_client:
+            return jsonify({"error": "MongoDB not connected"}), 500
+            
+        top = request.args.get('top', 10, type=int)
+        if top is None or not 0 < top <= DASHBOARD_TOP_LIMIT:
+            return jsonify({"error": f"'top' must be between 1 and {DASHBOARD_TOP_LIMIT}"}), 400
+        
+        # Mis en cache sous la version courante : lu sur le primaire
+        collection = mongo_client.collection
+        dashboard = analytics_cache.get_or_compute(
+            "dashboard", {"top": top},
+            lambda: execute_dashboard(collection, top)
+        )
+        return jsonify(dashboard)
+    except Exception as e:
+        logger.error(f"Error in get_dashboard: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def doublons_fuzzy_payload(threshold, refresh=False):
+    """Résultats du dernier travail de détection approximative (200)
+
+    Sans résultat (ou avec refresh), lance le travail si aucun n'est en cours
+    et renvoie son état (202) : suivi via /api/jobs/<id>.
+    """
+    collection = mongo_client.collection
+    params = {"threshold": threshold}
+    job = None if refresh else find_completed_job(collection, FUZZY_JOB_TYPE, params)
+    if job:
+        results = read_doublons_fuzzy(collection, job["_id"])
+        return {
+            "doublons": results,
+            "count": len(results),
+            "mode": "fuzzy",
+            "job": job["_id"],
+            "computed_at": job["finished_at"],
+            # Écritures sur les employés depuis le début du calcul
+            "stale": job.get("token") != current_token(collection)
+        }, 200
+    
+    active = find_active_job(collection, FUZZY_JOB_TYPE)
+    if not active:
+        try:
+            active, _ = create_job(collection, FUZZY_JOB_TYPE, params)
+        except RuntimeError:
+            # Travail lancé au même moment par une autre requête
+            active = find_active_job(collection, FUZZY_JOB_TYPE)
+            if not active:
+                return doublons_fuzzy_payload(threshold)
+        # Parcours complet non mis en cache : lu sur un secondaire si disponible
+        analytics = mongo_client.analytics_collection
+        start_job(
+            collection, active["_id"],
+            lambda collection, job, on_batch=None: run_doublons_fuzzy_job(
+                collection, job, on_batch, source=analytics
+            )
+        )
+    return {
+        "doublons": [],
+        "count": 0,
+        "mode": "fuzzy",
+        "job": get_job(collection, active["_id"]) or format_job(active)
+    }, 202
+
 @app.route('/api/analytics/doublons', methods=['GET'])
 def get_doublons():
     """2. Détection de doublons avec MapReduce"""
@@ -478,24 +1171,146 @@ def get_doublons():
         if not mongo_client:
             return jsonify({"error": "MongoDB not connected"}), 500
             
+        # Mis en cache sous la version courante : lu sur le primaire
         collection = mongo_client.collection
-        results = execute_doublons_detect(collection)
-        
-        # Convertir ObjectId en string
-        for result in results:
-            if '_id' in result:
-                result['_id'] = str(result['_id'])
-            if 'value' in result and 'ids' in result['value']:
-                result['value']['ids'] = [str(id) for id in result['value']['ids']]
+        mode = request.args.get('mode', 'exact')
+        if mode == 'fuzzy':
+            # Doublons approximatifs : calculés par un travail de fond (?refresh=1 pour relancer)
+            threshold = request.args.get('threshold', DEFAULT_THRESHOLD, type=float)
+            if threshold is None or not 0 < threshold <= 1:
+                return jsonify({"error": "'threshold' must be in ]0, 1]", "results": []}), 400
+            refresh = request.args.get('refresh', '').lower() in ['true', '1', 'yes']
+            payload, status = doublons_fuzzy_payload(threshold, refresh)
+            response = jsonify(payload)
+            if status == 202:
+                response.headers['Location'] = f"/api/jobs/{payload['job']['id']}"
+            return response, status
+        else:
+            # ?engine=compute pour recalculer la clé sans l'index cle_unique
+            engine = request.args.get('engine')
+            results = analytics_cache.get_or_compute(
+                "doublons", {"engine": engine},
+                lambda: execute_doublons_detect(collection, engine)
+            )
         
         return jsonify({
             "doublons": results,
-            "count": len(results)
+            "count": len(results),
+            "mode": mode
         })
     except Exception as e:
         logger.error(f"Error in get_doublons: {e}")
         return jsonify({"error": str(e), "results": []}), 500
 
+# Routes d'administration
+@app.route('/api/admin/slow-queries', methods=['GET', 'DELETE'])
+def get_slow_queries():
+    """Dernières commandes MongoDB plus lentes que SLOW_QUERY_MS (DELETE pour vider)"""
+    try:
+        if request.method == 'DELETE':
+            slow_queries.clear()
+            return jsonify({"message": "Slow query log cleared"})
+        
+        limit = request.args.get('limit', type=int)
+        entries = slow_queries.get_entries(limit)
+        return jsonify({
+            "threshold_ms": slow_queries.threshold_ms,
+            "slow_queries": entries,
+            "count": len(entries)
+        })
+    except Exception as e:
+        logger.error(f"Error in get_slow_queries: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/admin/indexes', methods=['GET'])
+def get_indexes():
+    """Utilisation des index de la collection ($indexStats)"""
+    try:
+        if not mongo_client:
+            return jsonify({"error": "MongoDB not connected"}), 500
+            
+        stats = mongo_client.get_index_stats()
+        indexes = [{
+            "name": index.get("name"),
+            "key": dict(index.get("key", {})),
+            "ops": index.get("accesses", {}).get("ops", 0),
+            "since": index.get("accesses", {}).get("since")
+        } for index in stats]
+        
+        declared = [spec["name"] for spec in INDEX_SPECS]
+        present = {index["name"] for index in indexes}
+        return jsonify({
+            "indexes": indexes,
+            "count": len(indexes),
+            "missing": [name for name in declared if name not in present]
+        })
+    except Exception as e:
+        logger.error(f"Error in get_indexes: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/admin/migrations/derived-fields', methods=['POST'])
+def backfill_derived_fields():
+    """Migration : calculer les champs de recherche des documents existants"""
+    try:
+        if not mongo_client:
+            return jsonify({"error": "MongoDB not connected"}), 500
+            
+        updated = mongo_client.backfill_derived_fields()
+        invalidate_cache()
+        return jsonify({
+            "message": "Derived fields backfilled",
+            "modified_count": updated
+        })
+    except Exception as e:
+        logger.error(f"Error in backfill_derived_fields: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/admin/name-index/rebuild', methods=['POST'])
+def rebuild_name_search_index():
+    """Reconstruire l'index des trigrammes de noms"""
+    try:
+        if not mongo_client:
+            return jsonify({"error": "MongoDB not connected"}), 500
+            
+        indexed = rebuild_name_index(mongo_client.collection)
+        return jsonify({
+            "message": "Name index rebuilt",
+            "indexed": indexed
+        })
+    except Exception as e:
+        logger.error(f"Error in rebuild_name_search_index: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# Routes d'administration du résumé par ville
+@app.route('/api/admin/ville-stats/rebuild', methods=['POST'])
+def rebuild_ville_stats():
+    """Reconstruire le résumé matérialisé des statistiques par ville"""
+    try:
+        if not mongo_client:
+            return jsonify({"error": "MongoDB not connected"}), 500
+            
+        villes = rebuild_ville_stats_summary(mongo_client.collection)
+        invalidate_cache()
+        return jsonify({
+            "message": "Ville stats summary rebuilt",
+            "villes": villes
+        })
+    except Exception as e:
+        logger.error(f"Error in rebuild_ville_stats: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/admin/ville-stats/check', methods=['GET'])
+def check_ville_stats():
+    """Comparer le résumé par ville à un recalcul complet"""
+    try:
+        if not mongo_client:
+            return jsonify({"error": "MongoDB not connected"}), 500
+            
+        return jsonify(check_ville_stats_summary(mongo_client.collection))
+    except Exception as e:
+        logger.error(f"Error in check_ville_stats: {e}")
+        return jsonify({"error": str(e)}), 500
+
 # Gestion des erreurs 404
 @app.errorhandler(404)
 def not_found(error):
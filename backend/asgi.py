@@ -0,0 +1,523 @@
+"""Point d'entrée ASGI : routes de lecture servies avec Motor, le reste par Flask
+
+Lancement : uvicorn asgi:app --app-dir backend --host 0.0.0.0 --port $PORT
+"""
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Mount, Route
+from a2wsgi import WSGIMiddleware
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from app import (
+    app as flask_app,
+    mongo_client as sync_client,
+    analytics_cache,
+    doublons_fuzzy_payload,
+    etag_for,
+    DEFAULT_PAGE_LIMIT,
+    MAX_PAGE_LIMIT
+)
+from mongo_utils import MongoDBClient, DERIVED_FIELDS
+from map_reduce.ville_stats import (
+    VILLE_STATS_ENGINE,
+    VILLE_STATS_FILTER,
+    VILLE_STATS_GROUP,
+    execute_ville_stats,
+    format_ville_sums
+)
+from map_reduce.ville_stats_summary import read_ville_stats_summary
+from map_reduce.doublons_detect import DOUBLONS_KEY_BATCH, execute_doublons_detect
+from map_reduce.doublons_fuzzy import DEFAULT_THRESHOLD
+from metrics import REQUEST_LATENCY, REQUESTS_IN_FLIGHT, RESPONSE_SIZE, current_route
+from name_search import search_names
+from json_utils import dumps_bytes
+import asyncio
+import datetime
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncMongoDBClient(MongoDBClient):
+    """MongoDBClient sur Motor : les méthodes appelées avec stream=True renvoient
+    des curseurs Motor, les requêtes sont donc partagées avec la version Flask."""
+
+    client_class = AsyncIOMotorClient
+
+    def connect(self):
+        """Créer le client Motor (dans la boucle d'événements du worker)"""
+        self.connections.get()
+        return True
+
+    def setup(self, collection):
+        """Index créés par le client synchrone du worker (voir on_startup)"""
+
+
+async_client = AsyncMongoDBClient()
+
+
+class MongoJSONResponse(JSONResponse):
+    """JSON avec ObjectId et dates convertis en chaînes"""
+
+    def render(self, content):
+        return dumps_bytes(content)
+
+
+def error_response(message, status_code, **extra):
+    return MongoJSONResponse(dict({"error": message}, **extra), status_code=status_code)
+
+
+def not_connected():
+    return error_response("MongoDB not connected", 500)
+
+
+def positive_int_arg(request, name, default=None):
+    """Équivalent de app.get_positive_int_arg (ValueError si invalide)"""
+    value = request.query_params.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        value = 0
+    if value <= 0:
+        raise ValueError(f"'{name}' must be a positive integer")
+    return value
+
+
+def pagination_args(request, stream=False):
+    """Équivalent de app.get_pagination_args pour Starlette (ValueError si invalide)"""
+    after = request.query_params.get('after') or None
+    if after is not None and not ObjectId.is_valid(after):
+        raise ValueError("Invalid 'after' cursor")
+    limit = positive_int_arg(request, 'limit', None if stream else DEFAULT_PAGE_LIMIT)
+    if limit and not stream:
+        limit = min(limit, MAX_PAGE_LIMIT)
+    fields_param = request.query_params.get('fields', '')
+    fields = [field.strip() for field in fields_param.split(',') if field.strip()] or None
+    return after, limit, fields
+
+
+def get_stream_format(request):
+    """Équivalent de app.get_stream_format ('ndjson', 'json' ou None)"""
+    stream = request.query_params.get('stream', '').lower()
+    if stream in ('1', 'true', 'yes', 'ndjson'):
+        return 'ndjson'
+    if stream == 'json':
+        return 'json'
+    accept = request.headers.get('accept', '')
+    if accept.split(',')[0].split(';')[0].strip() == 'application/x-ndjson':
+        return 'ndjson'
+    return None
+
+
+def stream_response(cursor, stream_format, key='employees'):
+    """Envoyer les documents d'un curseur Motor au fur et à mesure de leur lecture"""
+    async def generate():
+        try:
+            if stream_format == 'json':
+                yield b'{"%s": [' % key.encode('utf-8')
+                index = 0
+                async for document in cursor:
+                    yield (b',' if index else b'') + dumps_bytes(document)
+                    index += 1
+                yield b']}'
+            else:
+                async for document in cursor:
+                    yield dumps_bytes(document) + b'\n'
+        except Exception as e:
+            # Les headers sont déjà envoyés : on ne peut que journaliser
+            logger.error(f"Error while streaming {key}: {e}")
+        finally:
+            await cursor.close()
+
+    media_type = 'application/json' if stream_format == 'json' else 'application/x-ndjson'
+    return StreamingResponse(generate(), media_type=media_type)
+
+
+async def fetch_page(cursor, limit):
+    """Lire une page d'un curseur Motor et calculer le curseur suivant"""
+    employees = await cursor.to_list(length=limit)
+    next_cursor = str(employees[-1]['_id']) if limit and len(employees) == limit else None
+    return employees, next_cursor
+
+
+async def cached(name, params, compute):
+    """analytics_cache.get_or_compute (clés partagées avec Flask) depuis la boucle
+
+    Le cache est synchrone : il tourne dans le pool de threads, un calcul Motor
+    (coroutine) y est renvoyé à la boucle d'événements.
+    """
+    if asyncio.iscoroutinefunction(compute):
+        loop = asyncio.get_running_loop()
+        coroutine_function = compute
+        compute = lambda: asyncio.run_coroutine_threadsafe(coroutine_function(), loop).result()
+    return await run_in_threadpool(analytics_cache.get_or_compute, name, params, compute)
+
+
+def if_none_match(request):
+    """ETags de l'en-tête If-None-Match (sans guillemets ni préfixe W/)"""
+    header = request.headers.get('if-none-match', '')
+    return {tag.strip().removeprefix('W/').strip('"') for tag in header.split(',') if tag.strip()}
+
+
+def conditional(endpoint):
+    """ETag / 304 comme app.check_if_none_match et app.add_etag"""
+    async def wrapper(request):
+        etag = None
+        if request.query_params.get('mode') != 'fuzzy':
+            encoding = 'gzip' if 'gzip' in request.headers.get('accept-encoding', '') else 'identity'
+            full_path = f"{request.url.path}?{request.url.query}"
+            try:
+                etag = await run_in_threadpool(etag_for, full_path, request.headers.get('accept', ''), encoding)
+            except Exception as e:
+                logger.error(f"Error while computing ETag: {e}")
+            tags = if_none_match(request)
+            if etag and (etag in tags or '*' in tags):
+                return Response(status_code=304, headers={"ETag": f'"{etag}"'})
+        response = await endpoint(request)
+        if etag and response.status_code == 200:
+            response.headers['ETag'] = f'"{etag}"'
+            # Le navigateur revalide à chaque fois (If-None-Match)
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
+
+
+def paged_route(method_name, args=None, describe=None):
+    """Route de liste paginée (ou en streaming) appelant une méthode de MongoDBClient
+
+    args(request) : arguments de la méthode avant after/limit/fields ;
+    describe(request, limit) : champs ajoutés au corps, comme la route Flask.
+    """
+    async def endpoint(request):
+        try:
+            if not sync_client:
+                return not_connected()
+            stream_format = get_stream_format(request)
+            try:
+                after, limit, fields = pagination_args(request, stream_format is not None)
+            except ValueError as e:
+                return error_response(str(e), 400)
+            method_args = args(request) if args else []
+            cursor = getattr(async_client, method_name)(*method_args, after, limit, fields, stream=True)
+            if stream_format:
+                return stream_response(cursor, stream_format)
+            employees, next_cursor = await fetch_page(cursor, limit)
+            body = describe(request, limit) if describe else {}
+            body.update({"employees": employees, "count": len(employees), "next": next_cursor})
+            return MongoJSONResponse(body)
+        except Exception as e:
+            logger.error(f"Error in async {method_name}: {e}")
+            return error_response(str(e), 500)
+    return endpoint
+
+
+def search_params(request):
+    name_pattern = request.query_params.get('name', 'M')
+    cities_param = request.query_params.get('cities', 'Bordeaux,Paris')
+    return name_pattern, [city.strip() for city in cities_param.split(',') if city.strip()]
+
+
+get_all_employees = paged_route(
+    "get_all_documents",
+    describe=lambda request, limit: {
+        "limit": limit, "timestamp": datetime.datetime.utcnow().isoformat()
+    }
+)
+
+find_by_seniority = paged_route(
+    "find_by_seniority",
+    args=lambda request: [request.path_params['years']],
+    describe=lambda request, limit: {"years": request.path_params['years']}
+)
+
+find_with_street = paged_route("find_with_street_address")
+
+search_employees = paged_route(
+    "find_by_city_and_name",
+    args=lambda request: list(search_params(request)),
+    describe=lambda request, limit: dict(zip(("name_pattern", "cities"), search_params(request)))
+)
+
+find_by_name_prefix = paged_route(
+    "find_by_name_pattern",
+    args=lambda request: [request.path_params['pattern'], request.query_params.get('position', 'start')],
+    describe=lambda request, limit: {
+        "pattern": request.path_params['pattern'],
+        "position": request.query_params.get('position', 'start')
+    }
+)
+
+
+async def find_by_name_pattern(request):
+    """e. Prénom commence/finit par pattern, ou le contient (index des trigrammes)"""
+    position = request.query_params.get('position', 'start')
+    if position != 'any':
+        return await find_by_name_prefix(request)
+    try:
+        if not sync_client:
+            return not_connected()
+        try:
+            _, limit, fields = pagination_args(request, get_stream_format(request) is not None)
+        except ValueError as e:
+            return error_response(str(e), 400)
+        # Sous-chaîne : index des trigrammes, résultats classés (pas de curseur)
+        pattern = request.path_params['pattern']
+        employees = await run_in_threadpool(search_names, sync_client.collection, pattern, limit, fields)
+        return MongoJSONResponse({
+            "pattern": pattern,
+            "position": position,
+            "employees": employees,
+            "count": len(employees),
+            "next": None
+        })
+    except Exception as e:
+        logger.error(f"Error in async find_by_name_pattern: {e}")
+        return error_response(str(e), 500)
+
+
+async def count_employees(request):
+    """c. Compter le nombre de documents"""
+    try:
+        if not sync_client:
+            return not_connected()
+        async def compute():
+            return await async_client.count_documents()
+        count = await cached("count", None, compute)
+        return MongoJSONResponse({"count": count, "message": f"Total employees: {count}"})
+    except Exception as e:
+        logger.error(f"Error in async count_employees: {e}")
+        return error_response(str(e), 500)
+
+
+async def get_oldest_employees(request):
+    """k. Les X employés les plus anciens"""
+    try:
+        if not sync_client:
+            return not_connected()
+        limit = request.path_params['limit']
+        projection = {field: 0 for field in DERIVED_FIELDS}
+        cursor = async_client.collection.find({}, projection).sort("anciennete", -1).limit(limit)
+        employees = await cursor.to_list(length=limit)
+        return MongoJSONResponse({"limit": limit, "employees": employees, "count": len(employees)})
+    except Exception as e:
+        logger.error(f"Error in async get_oldest_employees: {e}")
+        return error_response(str(e), 500)
+
+
+async def get_ville_stats(request):
+    """1. Statistiques par ville (agrégation non bloquante, cache partagé avec Flask)
+
+    Comme pour Flask, les recalculs mis en cache lisent le primaire.
+    """
+    try:
+        if not sync_client:
+            return not_connected()
+        engine = request.query_params.get('engine') or VILLE_STATS_ENGINE
+        if engine == 'summary':
+            compute = lambda: read_ville_stats_summary(sync_client.collection)
+        elif engine == 'python':
+            compute = lambda: execute_ville_stats(sync_client.collection, engine)
+        else:
+            async def compute():
+                pipeline = [{"$match": VILLE_STATS_FILTER}, VILLE_STATS_GROUP, {"$sort": {"_id": 1}}]
+                groups = await async_client.collection.aggregate(pipeline).to_list(length=None)
+                return [format_ville_sums(group) for group in groups]
+        results = await cached("ville-stats", {"engine": engine}, compute)
+        return MongoJSONResponse({"stats": results, "count": len(results)})
+    except Exception as e:
+        logger.error(f"Error in async get_ville_stats: {e}")
+        return error_response(str(e), 500, results=[])
+
+
+async def _load_duplicate_batch(keys):
+    """Documents d'un lot de clés en doublon"""
+    cursor = async_client.collection.find(
+        {"cle_unique": {"$in": keys}},
+        {"cle_unique": 1, "nom": 1, "prenom": 1, "adresse": 1}
+    ).sort("_id", 1)
+    return keys, await cursor.to_list(length=None)
+
+
+async def _detect_duplicates():
+    """Doublons exacts : les lots de clés sont chargés en parallèle"""
+    pipeline = [
+        {"$match": {"cle_unique": {"$exists": True}}},
+        {"$sort": {"cle_unique": 1}},
+        {"$project": {"_id": 0, "cle_unique": 1}},
+        {"$group": {"_id": "$cle_unique", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    groups = await async_client.collection.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+    keys = [group["_id"] for group in groups]
+    batches = await asyncio.gather(*[
+        _load_duplicate_batch(keys[start:start + DOUBLONS_KEY_BATCH])
+        for start in range(0, len(keys), DOUBLONS_KEY_BATCH)
+    ])
+
+    results = []
+    for batch_keys, employees in batches:
+        by_key = {key: [] for key in batch_keys}
+        for employee in employees:
+            by_key[employee["cle_unique"]].append(employee)
+        for key in batch_keys:
+            members = by_key[key]
+            adresses = [member["adresse"] for member in members if "adresse" in member]
+            results.append({"_id": key, "value": {
+                "ids": [str(member["_id"]) for member in members],
+                "noms": [member.get("nom") for member in members],
+                "prenoms": [member.get("prenom") for member in members],
+                "adresses": adresses,
+                "count": len(members),
+                "adresses_differentes": any(
+                    (adresse if adresse is not None else {}) != adresses[0]
+                    for adresse in adresses[1:]
+                )
+            }})
+    return results
+
+
+async def get_doublons(request):
+    """2. Détection de doublons (cache partagé avec Flask)"""
+    try:
+        if not sync_client:
+            return not_connected()
+        mode = request.query_params.get('mode', 'exact')
+        if mode == 'fuzzy':
+            # Calcul CPU : travail de fond partagé avec la route Flask
+            try:
+                threshold = float(request.query_params.get('threshold', DEFAULT_THRESHOLD))
+            except ValueError:
+                threshold = None
+            if threshold is None or not 0 < threshold <= 1:
+                return error_response("'threshold' must be in ]0, 1]", 400, results=[])
+            refresh = request.query_params.get('refresh', '').lower() in ['true', '1', 'yes']
+            payload, status = await run_in_threadpool(doublons_fuzzy_payload, threshold, refresh)
+            headers = {"Location": f"/api/jobs/{payload['job']['id']}"} if status == 202 else None
+            return MongoJSONResponse(payload, status_code=status, headers=headers)
+
+        # ?engine=compute pour recalculer la clé sans l'index cle_unique
+        engine = request.query_params.get('engine')
+        if engine:
+            compute = lambda: execute_doublons_detect(sync_client.collection, engine)
+        else:
+            compute = _detect_duplicates
+        results = await cached("doublons", {"engine": engine}, compute)
+        return MongoJSONResponse({"doublons": results, "count": len(results), "mode": mode})
+    except Exception as e:
+        logger.error(f"Error in async get_doublons: {e}")
+        return error_response(str(e), 500, results=[])
+
+
+async def health_check(request):
+    """Endpoint de santé (ping réel du serveur MongoDB par Motor)"""
+    ping_ms = None
+    try:
+        started_at = time.perf_counter()
+        await async_client.client.admin.command("ping")
+        ping_ms = round((time.perf_counter() - started_at) * 1000, 2)
+    except Exception as e:
+        logger.error(f"MongoDB ping failed: {e}")
+    return MongoJSONResponse({
+        "status": "healthy" if ping_ms is not None else "unhealthy",
+        "service": "MongoDB Employees API",
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "mongo_connected": ping_ms is not None,
+        "mongo_ping_ms": ping_ms
+    })
+
+
+def flask_rule(path):
+    """Règle Flask équivalente à un chemin Starlette (étiquette des métriques)"""
+    return re.sub(r"\{(\w+)(:int)?\}", lambda m: f"<{'int:' if m.group(2) else ''}{m.group(1)}>", path)
+
+
+async def _finish_stream(body_iterator, route):
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        REQUESTS_IN_FLIGHT.dec((route,))
+
+
+def metered(path, endpoint):
+    """Mêmes métriques que les hooks Flask (latence jusqu'aux headers, taille, en cours)"""
+    route = flask_rule(path)
+
+    async def wrapper(request):
+        current_route.set(route)
+        REQUESTS_IN_FLIGHT.inc((route,))
+        started_at = time.perf_counter()
+        streaming = False
+        try:
+            response = await endpoint(request)
+            elapsed = time.perf_counter() - started_at
+            REQUEST_LATENCY.observe(elapsed, (request.method, route, str(response.status_code)))
+            length = response.headers.get('content-length')
+            if length is not None:
+                RESPONSE_SIZE.observe(int(length), (request.method, route))
+            if isinstance(response, StreamingResponse):
+                # Fin de la requête à la fin du flux, comme teardown_request
+                response.body_iterator = _finish_stream(response.body_iterator, route)
+                streaming = True
+            return response
+        finally:
+            if not streaming:
+                REQUESTS_IN_FLIGHT.dec((route,))
+            current_route.set('none')
+    return wrapper
+
+
+def api_route(path, endpoint, etag=True):
+    return Route(path, metered(path, conditional(endpoint) if etag else endpoint), methods=['GET'])
+
+
+wsgi_app = WSGIMiddleware(flask_app)
+
+
+# Même contrat que les routes Flask (corps, pagination, ?stream=, ETag/304, cache, métriques)
+routes = [
+    api_route('/api/health', health_check, etag=False),
+    api_route('/api/employees', get_all_employees),
+    api_route('/api/employees/count', count_employees),
+    api_route('/api/employees/name/{pattern}', find_by_name_pattern),
+    api_route('/api/employees/seniority/{years:int}', find_by_seniority),
+    api_route('/api/employees/with-street', find_with_street),
+    api_route('/api/employees/oldest/{limit:int}', get_oldest_employees),
+    api_route('/api/employees/search', search_employees),
+    api_route('/api/analytics/ville-stats', get_ville_stats),
+    api_route('/api/analytics/doublons', get_doublons),
+    # Toutes les autres routes (écritures, admin, exports...) restent servies par Flask
+    Mount('/', app=wsgi_app)
+]
+
+# Même politique CORS que Flask : le frontend (autre origine) lit les réponses et l'ETag
+middleware = [
+    Middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
+        allow_headers=["Content-Type", "Authorization", "Accept", "Origin", "X-Requested-With"],
+        expose_headers=["Content-Type", "Authorization", "ETag"],
+        allow_credentials=False,
+        max_age=86400
+    )
+]
+
+
+def on_startup():
+    """Créer le client Motor dans la boucle d'événements du worker"""
+    async_client.connect()
+    logger.info("✅ Motor client created")
+    if sync_client:
+        # Client synchrone du worker (routes Flask montées) et création des index
+        sync_client.connect()
+
+
+app = Starlette(routes=routes, middleware=middleware, on_startup=[on_startup])
@@ -0,0 +1,246 @@
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from ingest import clean_employee
+from mongo_utils import (
+    DERIVED_FIELDS,
+    DUPLICATE_ERROR,
+    change_stamp,
+    derived_fields,
+    duplicate_key,
+    existing_duplicate_keys
+)
+import os
+
+# Nombre maximum d'opérations par requête et par appel bulk_write
+BATCH_MAX_OPS = int(os.getenv("BATCH_MAX_OPS", 10000))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", 1000))
+
+OPERATION_TYPES = ("update", "replace", "delete", "upsert")
+
+# Champs relus avant/après écriture pour les résumés et index annexes
+TRACKED_PROJECTION = {"nom": 1, "prenom": 1, "adresse": 1, "anciennete": 1, "cle_unique": 1}
+
+
+def _object_id(operation):
+    """ObjectId de l'opération (ValueError si absent ou invalide)"""
+    employee_id = operation.get("id")
+    if not employee_id or not ObjectId.is_valid(employee_id):
+        raise ValueError("Invalid or missing 'id'")
+    return ObjectId(employee_id)
+
+
+def _update_data(operation):
+    """Données d'un $set, sans _id ni champs calculés"""
+    data = operation.get("data")
+    if not isinstance(data, dict) or not data:
+        raise ValueError("'data' must be a non-empty object")
+    return {key: value for key, value in data.items() if key != "_id" and key not in DERIVED_FIELDS}
+
+
+def parse_operation(operation):
+    """Valider une opération et retourner (type, filtre, données)"""
+    if not isinstance(operation, dict):
+        raise ValueError("Operation must be an object")
+    op_type = operation.get("op")
+    if op_type not in OPERATION_TYPES:
+        raise ValueError(f"'op' must be one of {', '.join(OPERATION_TYPES)}")
+
+    if op_type == "delete":
+        return op_type, {"_id": _object_id(operation)}, None
+    if op_type == "replace":
+        return op_type, {"_id": _object_id(operation)}, clean_employee(operation.get("data"))
+    if op_type == "update":
+        return op_type, {"_id": _object_id(operation)}, _update_data(operation)
+
+    # upsert : par id, ou par clé nom+prénom si aucun id n'est donné
+    data = _update_data(operation)
+    if operation.get("id"):
+        return op_type, {"_id": _object_id(operation)}, data
+    cle_unique = duplicate_key(data)
+    if cle_unique is None:
+        raise ValueError("Upsert without 'id' requires 'nom' and 'prenom'")
+    return op_type, {"cle_unique": cle_unique}, data
+
+
+def _with_derived(data, current):
+    """Compléter les données avec les champs calculés (nom/prénom existants si besoin)"""
+    if not any(field in data for field in ("nom", "prenom")):
+        return data
+    names = {field: current[field] for field in ("nom", "prenom") if current and field in current}
+    return dict(data, **derived_fields(dict(names, **data)))
+
+
+def _find_current(collection, parsed):
+    """Documents existants visés par un lot (par _id ou par cle_unique)"""
+    ids = [query["_id"] for _, query, _ in parsed if "_id" in query]
+    keys = [query["cle_unique"] for _, query, _ in parsed if "cle_unique" in query]
+    current = {}
+    if ids or keys:
+        cursor = collection.find(
+            {"$or": [{"_id": {"$in": ids}}, {"cle_unique": {"$in": keys}}]},
+            TRACKED_PROJECTION
+        )
+        for employee in cursor:
+            current[employee["_id"]] = employee
+    return current
+
+
+def _existing(query, current):
+    """Document existant visé par une opération (par _id ou par cle_unique)"""
+    if "_id" in query:
+        return current.get(query["_id"])
+    return next((employee for employee in current.values()
+                 if employee.get("cle_unique") == query["cle_unique"]), None)
+
+
+def _build_request(op_type, query, data, current, stamp):
+    """Opération pymongo correspondant à une opération de l'API"""
+    if op_type == "delete":
+        return DeleteOne(query)
+    if op_type == "replace":
+        document = dict(data, **derived_fields(data))
+        return ReplaceOne(query, dict(document, **stamp))
+
+    existing = _existing(query, current)
+    update = {"$set": dict(_with_derived(data, existing), **stamp)}
+    return UpdateOne(query, update, upsert=(op_type == "upsert"))
+
+
+def _duplicate_inserts(collection, chunk, current):
+    """Index des upserts par id qui créeraient un doublon nom + prénom
+
+    Les upserts sans id ciblent déjà la clé nom + prénom : ils ne créent
+    jamais de doublon.
+    """
+    inserts = [
+        (index, duplicate_key(data))
+        for index, op_type, query, data in chunk
+        if op_type == "upsert" and "_id" in query and query["_id"] not in current
+    ]
+    existing = existing_duplicate_keys(collection, [key for _, key in inserts])
+    return {index for index, key in inserts if key in existing}
+
+
+def _operation_result(index, op_type, error=None):
+    result = {"index": index, "op": op_type, "matched": 0, "modified": 0,
+              "deleted": 0, "upserted_id": None}
+    if error:
+        result["error"] = error
+    return result
+
+
+def _chunk_results(chunk, current, after, upserted, failed, stamp):
+    """Résultat de chaque opération d'un lot
+
+    bulk_write ne renvoie que des totaux : chaque opération est jugée sur le
+    document visé avant le lot (current) et après (after). Le tampon du lot
+    (_seq) est posé par toute écriture, il identifie les documents modifiés.
+    """
+    results = []
+    for position, (index, op_type, query, data) in enumerate(chunk):
+        result = _operation_result(index, op_type, failed.get(position))
+        existing = _existing(query, current)
+        if position in upserted:
+            result["upserted_id"] = upserted[position]
+        elif existing is not None and position not in failed:
+            if op_type == "delete":
+                result["deleted"] = int(existing["_id"] not in after)
+            else:
+                result["matched"] = 1
+                written = after.get(existing["_id"], {}).get("_seq") == stamp["_seq"]
+                result["modified"] = int(written)
+        results.append(result)
+    return results
+
+
+def execute_batch(collection, operations, chunk_size=BATCH_CHUNK_SIZE, on_changes=None,
+                  reject_duplicates=False):
+    """Exécuter des opérations mixtes par lots bulk_write(ordered=False)
+
+    on_changes(before, after) est appelé après chaque lot avec les documents
+    avant/après écriture (dictionnaires par _id ; absents après = supprimés).
+    Avec reject_duplicates, un upsert qui insérerait un doublon est refusé.
+    Le rapport contient les totaux et, dans "results", le résultat de chaque
+    opération dans l'ordre de la requête (index, op, matched, modified,
+    deleted, upserted_id, error).
+    """
+    report = {
+        "received": len(operations),
+        "chunks": 0,
+        "matched_count": 0,
+        "modified_count": 0,
+        "deleted_count": 0,
+        "upserted_count": 0,
+        "operations": {op_type: 0 for op_type in OPERATION_TYPES},
+        "upserted": [],
+        "results": [],
+        "errors": []
+    }
+
+    parsed = []
+    for index, operation in enumerate(operations):
+        try:
+            op_type, query, data = parse_operation(operation)
+        except (ValueError, TypeError) as e:
+            report["errors"].append({"index": index, "error": str(e)})
+            op_type = operation.get("op") if isinstance(operation, dict) else None
+            report["results"].append(_operation_result(index, op_type, str(e)))
+            continue
+        report["operations"][op_type] += 1
+        parsed.append((index, op_type, query, data))
+
+    for start in range(0, len(parsed), chunk_size):
+        chunk = parsed[start:start + chunk_size]
+        current = _find_current(collection, [(op_type, query, data) for _, op_type, query, data in chunk])
+        if reject_duplicates:
+            duplicates = _duplicate_inserts(collection, chunk, current)
+            for index, op_type, _, _ in chunk:
+                if index in duplicates:
+                    report["errors"].append({"index": index, "error": DUPLICATE_ERROR})
+                    report["results"].append(_operation_result(index, op_type, DUPLICATE_ERROR))
+            chunk = [operation for operation in chunk if operation[0] not in duplicates]
+            if not chunk:
+                continue
+        # Un seul numéro de séquence par lot pour le flux des modifications
+        stamp = change_stamp(collection)
+        requests = [
+            _build_request(op_type, query, data, current, stamp)
+            for _, op_type, query, data in chunk
+        ]
+
+        failed = {}
+        try:
+            result = collection.bulk_write(requests, ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            for error in details.get("writeErrors", []):
+                failed[error["index"]] = error.get("errmsg", "Write error")
+                report["errors"].append({
+                    "index": chunk[error["index"]][0],
+                    "error": failed[error["index"]]
+                })
+
+        report["chunks"] += 1
+        report["matched_count"] += details.get("nMatched", 0)
+        report["modified_count"] += details.get("nModified", 0)
+        report["deleted_count"] += details.get("nRemoved", 0)
+        report["upserted_count"] += details.get("nUpserted", 0)
+        upserted = {}
+        for item in details.get("upserted", []):
+            upserted[item["index"]] = item["_id"]
+            report["upserted"].append({"index": chunk[item["index"]][0], "id": item["_id"]})
+
+        after_ids = [employee_id for employee_id in current] + list(upserted.values())
+        after = {
+            employee["_id"]: employee
+            for employee in collection.find({"_id": {"$in": after_ids}}, dict(TRACKED_PROJECTION, _seq=1))
+        }
+        report["results"] += _chunk_results(chunk, current, after, upserted, failed, stamp)
+        if on_changes:
+            on_changes(current, after)
+
+    report["errors"].sort(key=lambda error: error["index"])
+    report["results"].sort(key=lambda result: result["index"])
+    return report
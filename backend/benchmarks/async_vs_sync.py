@@ -0,0 +1,78 @@
+"""Comparer le mode WSGI (gunicorn + Flask) et le mode ASGI (uvicorn + Motor)
+
+Lancer les deux serveurs sur la même base, par exemple :
+    gunicorn app:app --chdir backend --bind 0.0.0.0:8000 --workers 2
+    uvicorn asgi:app --app-dir backend --port 8001 --workers 2
+puis :
+    python backend/benchmarks/async_vs_sync.py http://localhost:8000 http://localhost:8001
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import time
+import urllib.request
+
+DEFAULT_PATHS = [
+    "/api/analytics/doublons",
+    "/api/analytics/ville-stats?engine=aggregate",
+    "/api/employees?limit=100",
+    "/api/employees/count"
+]
+
+
+def timed_get(url, timeout):
+    """Durée d'une requête GET en secondes (None si erreur)"""
+    started_at = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+    except Exception:
+        return None
+    return time.perf_counter() - started_at
+
+
+def percentile(values, ratio):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def run(base_url, paths, requests_count, concurrency, timeout):
+    """Envoyer requests_count requêtes réparties sur les chemins, concurrency en vol"""
+    urls = [base_url.rstrip("/") + paths[index % len(paths)] for index in range(requests_count)]
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        durations = list(executor.map(lambda url: timed_get(url, timeout), urls))
+    elapsed = time.perf_counter() - started_at
+
+    succeeded = [duration for duration in durations if duration is not None]
+    return {
+        "base_url": base_url,
+        "requests": requests_count,
+        "errors": requests_count - len(succeeded),
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(len(succeeded) / elapsed, 1) if elapsed > 0 else None,
+        "p50_ms": round(percentile(succeeded, 0.50) * 1000, 1) if succeeded else None,
+        "p95_ms": round(percentile(succeeded, 0.95) * 1000, 1) if succeeded else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base_urls", nargs="+", help="URL de chaque serveur à comparer")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--path", action="append", dest="paths", help="Chemin à interroger (répétable)")
+    args = parser.parse_args()
+
+    paths = args.paths or DEFAULT_PATHS
+    print(f"{'serveur':<32} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'erreurs':>8}")
+    for base_url in args.base_urls:
+        result = run(base_url, paths, args.requests, args.concurrency, args.timeout)
+        print(f"{result['base_url']:<32} {result['requests_per_second'] or 0:>8} "
+              f"{result['p50_ms'] or 0:>9} {result['p95_ms'] or 0:>9} {result['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Générateur d'employés synthétiques pour les benchmarks
+
+Villes tirées selon la population des grandes villes françaises, taux de
+doublons nom + prénom et proportion d'adresses avec rue configurables.
+La même graine produit toujours le même jeu de données.
+    python backend/benchmarks/generate_dataset.py --size 100000 --uri mongodb://localhost:27017 --db bench
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import bulk_insert  # noqa: E402
+from map_reduce.ville_stats_summary import rebuild_ville_stats_summary  # noqa: E402
+from name_search import rebuild_name_index  # noqa: E402
+
+# Population en milliers d'habitants (poids du tirage) et code postal
+VILLES = [
+    ("Paris", 2133, 75001), ("Marseille", 873, 13001), ("Lyon", 522, 69001),
+    ("Toulouse", 498, 31000), ("Nice", 342, 6000), ("Nantes", 320, 44000),
+    ("Montpellier", 302, 34000), ("Strasbourg", 287, 67000), ("Bordeaux", 261, 33000),
+    ("Lille", 236, 59000), ("Rennes", 222, 35000), ("Reims", 180, 51100),
+    ("Toulon", 180, 83000), ("Saint-Étienne", 173, 42000), ("Le Havre", 166, 76600),
+    ("Grenoble", 158, 38000), ("Dijon", 159, 21000), ("Angers", 157, 49000),
+    ("Nîmes", 148, 30000), ("Villeurbanne", 152, 69100), ("Clermont-Ferrand", 147, 63000),
+    ("Le Mans", 143, 72000), ("Aix-en-Provence", 147, 13080), ("Brest", 139, 29200),
+    ("Tours", 136, 37000), ("Amiens", 133, 80000), ("Limoges", 130, 87000),
+    ("Annecy", 130, 74000), ("Perpignan", 119, 66000), ("Metz", 118, 57000)
+]
+
+NOMS = [
+    "Martin", "Bernard", "Thomas", "Petit", "Robert", "Richard", "Durand", "Dubois",
+    "Moreau", "Laurent", "Simon", "Michel", "Lefèvre", "Leroy", "Roux", "David",
+    "Bertrand", "Morel", "Fournier", "Girard", "Bonnet", "Dupont", "Lambert", "Fontaine",
+    "Rousseau", "Vincent", "Muller", "Lefebvre", "Faure", "André", "Mercier", "Blanc",
+    "Guérin", "Boyer", "Garnier", "Chevalier", "François", "Legrand", "Gauthier", "Garcia",
+    "Perrin", "Robin", "Clément", "Morin", "Nicolas", "Henry", "Roussel", "Mathieu",
+    "Gautier", "Masson", "Marchand", "Duval", "Denis", "Dumont", "Marie", "Lemaire",
+    "Noël", "Meyer", "Dufour", "Meunier", "Brun", "Blanchard", "Giraud", "Joly"
+]
+
+PRENOMS = [
+    "Marie", "Jean", "Pierre", "Michel", "André", "Philippe", "Nathalie", "Isabelle",
+    "Sylvie", "Catherine", "Françoise", "Martine", "Christine", "Nicolas", "Julien",
+    "Sébastien", "Stéphane", "Céline", "Émilie", "Camille", "Léa", "Manon", "Chloé",
+    "Inès", "Lucas", "Hugo", "Louis", "Gabriel", "Raphaël", "Arthur", "Jules", "Maël",
+    "Zoé", "Hélène", "Agnès", "Benoît", "Jérôme", "Mathieu", "Thibault", "Anaïs",
+    "Mélanie", "Aurélie", "Clément", "Théo", "Noémie", "Maëlle", "Gaëlle", "Joël"
+]
+
+RUES = [
+    "rue de la République", "avenue Jean Jaurès", "rue Victor Hugo", "boulevard Pasteur",
+    "rue de la Paix", "place de la Mairie", "rue des Écoles", "avenue de la Gare",
+    "rue du Moulin", "chemin des Vignes", "rue Nationale", "allée des Tilleuls"
+]
+
+
+def generate_employees(size, duplicate_rate=0.02, street_rate=0.6, seed=42):
+    """Générer size employés (dictionnaires prêts pour l'insertion)"""
+    rng = random.Random(seed)
+    weights = list(itertools.accumulate(population for _, population, _ in VILLES))
+    emitted = []
+    for _ in range(size):
+        ville, _, codepostal = rng.choices(VILLES, cum_weights=weights)[0]
+        if emitted and rng.random() < duplicate_rate:
+            # Doublon : même nom + prénom, adresse éventuellement différente
+            nom, prenom = rng.choice(emitted)
+        else:
+            # Nom numéroté : les doublons viennent du taux demandé, pas du hasard
+            nom = f"{rng.choice(NOMS)}-{rng.randrange(10 ** 7)}"
+            prenom = rng.choice(PRENOMS)
+            if len(emitted) < 100000:
+                emitted.append((nom, prenom))
+        adresse = {"numero": rng.randint(1, 250), "codepostal": codepostal, "ville": ville}
+        if rng.random() < street_rate:
+            adresse["rue"] = rng.choice(RUES)
+        yield {
+            "nom": nom,
+            "prenom": prenom,
+            "anciennete": rng.randint(0, 40),
+            "prime": round(rng.uniform(0, 5000), 2),
+            "adresse": adresse
+        }
+
+
+def seed_collection(collection, size, duplicate_rate=0.02, street_rate=0.6, seed=42, drop=True,
+                    name_indexes=True):
+    """Remplir la collection puis reconstruire le résumé par ville et l'index des noms
+
+    name_indexes=False ne crée pas les index des trigrammes (mongomock vérifie
+    l'index unique à chaque insertion : remplissage quadratique).
+    """
+    if drop:
+        collection.drop()
+    report = bulk_insert(collection, generate_employees(size, duplicate_rate, street_rate, seed))
+    rebuild_ville_stats_summary(collection)
+    rebuild_name_index(collection, create_indexes=name_indexes)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.02)
+    parser.add_argument("--street-rate", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="bench")
+    parser.add_argument("--collection", default="employes")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+    collection = MongoClient(args.uri)[args.db][args.collection]
+    report = seed_collection(collection, args.size, args.duplicate_rate, args.street_rate, args.seed)
+    print(f"Inserted {report['inserted']} employees in {report['elapsed_seconds']} s "
+          f"({report['rows_per_second']} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
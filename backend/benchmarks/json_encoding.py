@@ -0,0 +1,66 @@
+"""Microbenchmark de la sérialisation des réponses de liste
+
+Compare l'ancien chemin (conversion de _id dans une boucle puis json.dumps
+trié, comme jsonify) aux encodeurs de json_utils, sur des employés générés.
+    python backend/benchmarks/json_encoding.py --documents 10000 --repeat 20
+"""
+from bson import ObjectId
+import argparse
+import datetime
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_utils import get_dumps, orjson  # noqa: E402
+
+
+def make_employees(count):
+    now = datetime.datetime.utcnow()
+    return [{
+        "_id": ObjectId(),
+        "nom": f"Nom{index % 500}",
+        "prenom": f"Prénom{index % 300}",
+        "anciennete": index % 40,
+        "prime": 1000.0 + index,
+        "adresse": {"numero": index % 200, "rue": "rue de la Paix", "codepostal": 75000 + index % 20, "ville": "Paris"},
+        "updated_at": now
+    } for index in range(count)]
+
+
+def legacy(employees):
+    """Boucle de conversion par route + encodeur par défaut de Flask"""
+    employees = [dict(employee) for employee in employees]
+    for emp in employees:
+        if '_id' in emp:
+            emp['_id'] = str(emp['_id'])
+    return json.dumps({"employees": employees, "count": len(employees)},
+                      default=str, ensure_ascii=True, sort_keys=True).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    employees = make_employees(args.documents)
+    candidates = {"legacy (boucle + json)": legacy}
+    for encoder in ("json", "orjson"):
+        if encoder == "orjson" and orjson is None:
+            continue
+        dumps_bytes = get_dumps(encoder)
+        candidates[f"json_utils ({encoder})"] = (
+            lambda employees, dumps_bytes=dumps_bytes: dumps_bytes({"employees": employees, "count": len(employees)})
+        )
+
+    print(f"{args.documents} documents, meilleur de {args.repeat} essais")
+    for name, encode in candidates.items():
+        best = min(timeit.repeat(lambda: encode(employees), number=1, repeat=args.repeat))
+        print(f"{name:<26} {best * 1000:>9.2f} ms  {args.documents / best:>12.0f} docs/s")
+
+
+if __name__ == "__main__":
+    main()
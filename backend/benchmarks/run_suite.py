@@ -0,0 +1,410 @@
+"""Suite de benchmarks de l'API : toutes les routes de app.py et les calculs map_reduce
+
+Remplit la base avec generate_dataset (mongod local, ou mongomock avec
+--backend mongomock), appelle chaque route via le client de test Flask,
+mesure les travaux de fond de bout en bout (lancement puis suivi par
+/api/jobs/<id>), puis execute_ville_stats et execute_doublons_detect directement.
+Écrit p50/p95/p99, débit et mémoire maximale en JSON ; avec --baseline, les
+scénarios dont le p95 dépasse la référence de plus de --tolerance sont
+signalés et le code de sortie vaut 1.
+    python backend/benchmarks/run_suite.py --size 100000 --output bench.json
+    python backend/benchmarks/run_suite.py --size 100000 --baseline bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(values, ratio):
+    """Percentile au rang le plus proche"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(ratio * len(values))) - 1))]
+
+
+def peak_rss_kb():
+    """RSS maximal du processus en Ko depuis son démarrage (ru_maxrss est en octets sous macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def traced_peak_kb(run, prepare=None):
+    """Pic des allocations Python (Ko) pendant une exécution supplémentaire de run
+
+    Exécution tracée à part : tracemalloc ralentit les allocations et fausserait
+    les durées. Tous les threads sont suivis (travaux de fond compris), pas
+    les processus enfants.
+    """
+    argument = prepare() if prepare else None
+    tracemalloc.start()
+    try:
+        run(argument) if prepare else run()
+    except Exception:
+        pass
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak // 1024
+
+
+def summarize(durations, errors, peak_alloc_kb=None):
+    total = sum(durations)
+    return {
+        "runs": len(durations),
+        "errors": errors,
+        "p50_ms": round(percentile(durations, 0.50) * 1000, 3) if durations else None,
+        "p95_ms": round(percentile(durations, 0.95) * 1000, 3) if durations else None,
+        "p99_ms": round(percentile(durations, 0.99) * 1000, 3) if durations else None,
+        "mean_ms": round(total / len(durations) * 1000, 3) if durations else None,
+        "ops_per_second": round(len(durations) / total, 2) if total > 0 else None,
+        # Propre au scénario
+        "peak_alloc_kb": peak_alloc_kb,
+        # Cumulé sur le processus : sa hausse désigne le scénario qui l'a fait monter
+        "peak_rss_kb": peak_rss_kb()
+    }
+
+
+def measure(run, repeat, prepare=None):
+    """Exécuter run repeat fois (run retourne False en cas d'erreur)
+
+    prepare() est appelé hors chronométrage et son résultat passé à run.
+    """
+    durations = []
+    errors = 0
+    for _ in range(repeat):
+        argument = prepare() if prepare else None
+        started_at = time.perf_counter()
+        try:
+            ok = run(argument) if prepare else run()
+        except Exception:
+            ok = False
+        durations.append(time.perf_counter() - started_at)
+        errors += 0 if ok is not False else 1
+    return summarize(durations, errors, traced_peak_kb(run, prepare))
+
+
+def configure_environment(args):
+    """Variables lues par mongo_utils et app à l'import"""
+    os.environ["MONGODB_URI"] = args.uri
+    os.environ["DATABASE_NAME"] = args.db
+    os.environ["COLLECTION_NAME"] = args.collection
+    os.environ.setdefault("CACHE_BACKEND", "memory")
+    # Index créés après le remplissage (voir ensure_indexes)
+    os.environ["MONGO_ENSURE_INDEXES"] = "false"
+
+
+def load_app(args):
+    configure_environment(args)
+    import app as api
+
+    if args.backend == "mongomock":
+        import mongomock
+        client = mongomock.MongoClient()
+        connections = api.mongo_client.connections
+        connections.client_class = lambda uri, **options: client
+        connections.reset()
+    return api
+
+
+def ensure_indexes(api, collection, name_indexes=True):
+    """Index de l'application, après le remplissage (collection.drop les supprime)
+
+    Sur mongomock, l'index unique des trigrammes rend chaque insertion linéaire
+    (remplissage et routes d'écriture quadratiques) : il n'est pas créé.
+    """
+    api.mongo_client.ensure_indexes()
+    if name_indexes:
+        api.ensure_name_index(collection)
+    api.ensure_change_feed_indexes(collection)
+    api.ensure_job_indexes(collection)
+
+
+def route_scenarios(api, collection, repeat, bulk_rows=1000):
+    """(nom, méthode, chemin, options de requête, répétitions)"""
+    sample = collection.find_one({"adresse.rue": {"$exists": True}}) or collection.find_one() or {}
+    employee_id = str(sample.get("_id", ""))
+    ville = sample.get("adresse", {}).get("ville", "Paris")
+    heavy = max(1, repeat // 10)
+    counter = iter(range(10 ** 9))
+
+    def new_employee():
+        return {"json": {"nom": f"Bench-{next(counter)}-{time.time_ns()}", "prenom": "Léa",
+                         "anciennete": 3, "prime": 100, "adresse": {"ville": ville}}}
+
+    def ndjson_rows():
+        rows = "\n".join(json.dumps(new_employee()["json"]) for _ in range(bulk_rows))
+        return {"data": rows, "content_type": "application/x-ndjson"}
+
+    def batch_operations():
+        ids = [str(employee["_id"]) for employee in collection.find({}, {"_id": 1}).limit(100)]
+        return {"json": {"operations": [{"op": "update", "id": employee_id, "data": {"prime": 150}}
+                                        for employee_id in ids]}}
+
+    created = []
+    job_ids = []
+
+    def increment_prime_job():
+        # Hors chronométrage : attendre la fin du travail précédent (sinon 409)
+        wait_for_active_job(api, "increment_prime")
+        job_ids.append(f"bench-{time.time_ns()}")
+        return {"json": {"amount": 1, "job_id": job_ids[-1]}}
+
+    def create_then_delete():
+        response = api.app.test_client().post("/api/employees", **new_employee())
+        created.append(response.get_json().get("id"))
+        return {}
+
+    return [
+        ("index", "GET", "/", None, repeat),
+        ("health", "GET", "/api/health", None, repeat),
+        ("test", "GET", "/api/test", None, repeat),
+        ("metrics", "GET", "/api/metrics", None, repeat),
+        ("collections", "GET", "/api/collections", None, repeat),
+        ("employees_page", "GET", "/api/employees?limit=100", None, repeat),
+        ("employees_stream", "GET", "/api/employees?stream=ndjson&limit=5000", None, heavy),
+        ("employee_by_id", "GET", f"/api/employees/{employee_id}", None, repeat),
+        ("count", "GET", "/api/employees/count", None, repeat),
+        ("changes", "GET", "/api/employees/changes?since=0&limit=500", None, repeat),
+        ("name_start", "GET", "/api/employees/name/Ma?position=start&limit=100", None, repeat),
+        ("name_end", "GET", "/api/employees/name/ie?position=end&limit=100", None, repeat),
+        ("name_any", "GET", "/api/employees/name/ath?position=any&limit=100", None, repeat),
+        ("name_length", "GET", "/api/employees/name-length/Ma/5?limit=100", None, repeat),
+        ("seniority", "GET", "/api/employees/seniority/20?limit=100", None, repeat),
+        ("with_street", "GET", "/api/employees/with-street?limit=100", None, repeat),
+        ("oldest", "GET", "/api/employees/oldest/10", None, repeat),
+        ("city", "GET", f"/api/employees/city/{ville}", None, heavy),
+        ("search", "GET", f"/api/employees/search?name=M&cities={ville},Lyon&limit=100", None, repeat),
+        ("export_csv", "GET", "/api/employees/export?format=csv", None, heavy),
+        ("ville_stats_summary", "GET", "/api/analytics/ville-stats?engine=summary", None, repeat),
+        ("ville_stats_aggregate", "GET", "/api/analytics/ville-stats?engine=aggregate", None, heavy),
+        ("dashboard", "GET", "/api/analytics/dashboard", None, heavy),
+        ("doublons", "GET", "/api/analytics/doublons", None, heavy),
+        ("doublons_fuzzy", "GET", "/api/analytics/doublons?mode=fuzzy", None, heavy),
+        ("admin_indexes", "GET", "/api/admin/indexes", None, repeat),
+        ("admin_slow_queries", "GET", "/api/admin/slow-queries", None, repeat),
+        ("admin_slow_queries_clear", "DELETE", "/api/admin/slow-queries", None, 1),
+        ("admin_ville_stats_check", "GET", "/api/admin/ville-stats/check", None, heavy),
+        ("add_employee", "POST", "/api/employees", new_employee, repeat),
+        ("update_employee", "PUT", f"/api/employees/{employee_id}", lambda: {"json": {"prime": 120}}, repeat),
+        ("delete_employee", "DELETE", lambda: f"/api/employees/{created.pop()}", create_then_delete, repeat),
+        ("bulk_ndjson", "POST", "/api/employees/bulk", ndjson_rows, heavy),
+        ("batch_update", "POST", "/api/employees/batch", batch_operations, heavy),
+        ("increment_prime", "POST", "/api/employees/increment-prime", lambda: {"json": {"amount": 1}}, heavy),
+        ("increment_prime_job", "POST", "/api/employees/increment-prime?mode=job", increment_prime_job, heavy),
+        ("job_status", "GET", lambda: f"/api/jobs/{job_ids[-1]}", None, repeat),
+        ("admin_name_index_rebuild", "POST", "/api/admin/name-index/rebuild", None, 1),
+        ("admin_ville_stats_rebuild", "POST", "/api/admin/ville-stats/rebuild", None, 1),
+        ("admin_derived_fields", "POST", "/api/admin/migrations/derived-fields", None, 1)
+    ]
+
+
+def run_routes(api, collection, repeat, warm_cache, bulk_rows, skip=()):
+    client = api.app.test_client()
+    adapter = api.app.url_map.bind("localhost")
+    results = {}
+    covered = set()
+    for name, method, path, options, count in route_scenarios(api, collection, repeat, bulk_rows):
+        if name in skip:
+            continue
+        def prepare(method=method, path=path, options=options):
+            if not warm_cache:
+                # Chaque appel recalcule les analytics
+                api.analytics_cache.bump_generation()
+            kwargs = options() if callable(options) else (options or {})
+            target = path() if callable(path) else path
+            covered.add((adapter.match(target.split("?")[0], method=method)[0], method))
+            return method, target, kwargs
+
+        def run(request_args):
+            method, target, kwargs = request_args
+            response = client.open(target, method=method, **kwargs)
+            response.get_data()
+            response.close()
+            return response.status_code < 400
+
+        results[f"route:{name}"] = measure(run, count, prepare)
+        print(f"{name:<32} {results[f'route:{name}']['p50_ms']} ms", file=sys.stderr)
+
+    uncovered = sorted(
+        f"{method} {rule.rule}"
+        for rule in api.app.url_map.iter_rules() if rule.endpoint != "static"
+        for method in rule.methods - {"HEAD", "OPTIONS"}
+        if (rule.endpoint, method) not in covered
+    )
+    return results, uncovered
+
+
+def wait_for_job(api, job_id, timeout=600, interval=0.05):
+    """Suivre /api/jobs/<id> jusqu'à la fin du travail (True s'il est terminé)"""
+    if job_id is None:
+        return True
+    client = api.app.test_client()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/jobs/{job_id}").get_json() or {}
+        if job.get("status") in ("completed", "failed"):
+            return job["status"] == "completed"
+        time.sleep(interval)
+    return False
+
+
+def wait_for_active_job(api, job_type):
+    """Attendre la fin du travail actif du type donné (un seul à la fois, sinon 409)"""
+    active = api.find_active_job(api.mongo_client.collection, job_type)
+    return wait_for_job(api, active["_id"] if active else None)
+
+
+def run_jobs(api, repeat):
+    """Travaux de fond de bout en bout : lancement (202) puis suivi jusqu'à la fin"""
+    client = api.app.test_client()
+
+    def increment_prime(_):
+        job_id = f"bench-job-{time.time_ns()}"
+        response = client.post("/api/employees/increment-prime?mode=job",
+                               json={"amount": 1, "job_id": job_id})
+        return response.status_code < 400 and wait_for_job(api, job_id)
+
+    def doublons_fuzzy(_):
+        response = client.get("/api/analytics/doublons?mode=fuzzy&refresh=1")
+        if response.status_code != 202:
+            return response.status_code < 400
+        return wait_for_job(api, response.get_json()["job"]["id"])
+
+    runs = {
+        "job:increment_prime": (increment_prime, "increment_prime"),
+        "job:doublons_fuzzy": (doublons_fuzzy, api.FUZZY_JOB_TYPE)
+    }
+    results = {}
+    for name, (run, job_type) in runs.items():
+        # Hors chronométrage : attendre la fin d'un travail du même type encore actif
+        prepare = lambda job_type=job_type: wait_for_active_job(api, job_type)
+        results[name] = measure(run, max(1, repeat // 10), prepare)
+        print(f"{name:<32} {results[name]['p50_ms']} ms", file=sys.stderr)
+    return results
+
+
+def run_executors(collection, repeat):
+    from map_reduce.doublons_detect import execute_doublons_detect
+    from map_reduce.ville_stats import execute_ville_stats
+
+    runs = {
+        "execute_ville_stats:aggregate": lambda: execute_ville_stats(collection, "aggregate"),
+        "execute_ville_stats:python": lambda: execute_ville_stats(collection, "python"),
+        "execute_doublons_detect:stored": lambda: execute_doublons_detect(collection, "stored"),
+        "execute_doublons_detect:compute": lambda: execute_doublons_detect(collection, "compute")
+    }
+    results = {}
+    for name, run in runs.items():
+        results[name] = measure(run, max(1, repeat // 10))
+        print(f"{name:<32} {results[name]['p50_ms']} ms", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Scénarios plus lents que la référence (p95) au-delà de la tolérance"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous.get("p95_ms") or current.get("p95_ms") is None:
+            continue
+        ratio = current["p95_ms"] / previous["p95_ms"]
+        if ratio > 1 + tolerance:
+            regressions.append({
+                "scenario": name,
+                "baseline_p95_ms": previous["p95_ms"],
+                "p95_ms": current["p95_ms"],
+                "ratio": round(ratio, 2)
+            })
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("mongod", "mongomock"), default="mongod")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="bench")
+    parser.add_argument("--collection", default="employes")
+    parser.add_argument("--size", type=int, default=10000, help="10 000 à 5 000 000 employés")
+    parser.add_argument("--duplicate-rate", type=float, default=0.02)
+    parser.add_argument("--street-rate", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-seed", action="store_true", help="Réutiliser les données existantes")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--bulk-rows", type=int, default=1000, help="Lignes par appel à /api/employees/bulk")
+    parser.add_argument("--warm-cache", action="store_true", help="Garder le cache des analytics entre les appels")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="Résultats JSON d'une exécution précédente")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    api = load_app(args)
+    from generate_dataset import seed_collection
+    collection = api.mongo_client.collection
+
+    name_indexes = args.backend != "mongomock"
+    seed_report = None
+    if not args.skip_seed:
+        seed_report = seed_collection(collection, args.size, args.duplicate_rate, args.street_rate, args.seed,
+                                      name_indexes=name_indexes)
+        print(f"Seeded {seed_report['inserted']} employees in {seed_report['elapsed_seconds']} s", file=sys.stderr)
+    ensure_indexes(api, collection, name_indexes)
+
+    # Sans index des trigrammes, la reconstruction (qui les recrée) reste listée dans uncovered_routes
+    skip = () if name_indexes else ("admin_name_index_rebuild",)
+    results, uncovered = run_routes(api, collection, args.repeat, args.warm_cache, args.bulk_rows, skip)
+    results.update(run_jobs(api, args.repeat))
+    results.update(run_executors(collection, args.repeat))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "backend": args.backend,
+            "size": args.size,
+            "duplicate_rate": args.duplicate_rate,
+            "street_rate": args.street_rate,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "warm_cache": args.warm_cache,
+            "seed_report": seed_report
+        },
+        "results": results,
+        "uncovered_routes": uncovered,
+        "regressions": []
+    }
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report["regressions"] = compare(results, json.load(baseline_file), args.tolerance)
+
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2, default=str)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    for regression in report["regressions"]:
+        print(f"REGRESSION {regression['scenario']}: p95 {regression['baseline_p95_ms']} -> "
+              f"{regression['p95_ms']} ms (x{regression['ratio']})", file=sys.stderr)
+    sys.exit(1 if report["regressions"] else 0)
+
+
+if __name__ == "__main__":
+    main()
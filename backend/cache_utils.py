@@ -0,0 +1,224 @@
+from collections import OrderedDict
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import copy
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Backend du cache : "memory" (LRU par processus) ou "mongo" (partagé entre workers)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL = int(os.getenv("CACHE_TTL", 60))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 256))
+CACHE_COLLECTION = os.getenv("CACHE_COLLECTION", "api_cache")
+
+# Durée maximale d'attente d'un calcul en cours dans un autre worker
+CACHE_LOCK_TIMEOUT = int(os.getenv("CACHE_LOCK_TIMEOUT", 30))
+
+GENERATION_KEY = "generation:employees"
+
+
+class MemoryCacheBackend:
+    """Cache LRU en mémoire, propre à chaque processus"""
+
+    # Génération locale : inconnue des autres workers
+    shared = False
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        # Copie : les routes modifient les résultats avant sérialisation
+        return copy.deepcopy(value)
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (copy.deepcopy(value), time.time() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_generation(self):
+        return self.generation
+
+    def bump_generation(self):
+        with self.lock:
+            self.generation += 1
+            return self.generation
+
+    def acquire(self, key, ttl):
+        # Un seul processus : le verrou local de AnalyticsCache suffit
+        return "local"
+
+    def release(self, key, token):
+        pass
+
+
+class MongoCacheBackend:
+    """Cache partagé entre workers, stocké dans une collection MongoDB"""
+
+    shared = True
+
+    def __init__(self, get_collection):
+        # Fonction plutôt que collection : le client MongoDB est propre à chaque processus
+        self.get_collection = get_collection
+        # Expiration automatique des entrées par MongoDB
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    @property
+    def collection(self):
+        return self.get_collection()
+
+    def get(self, key):
+        entry = self.collection.find_one({"_id": key})
+        if entry is None or entry["expires_at"] < datetime.datetime.utcnow():
+            return None
+        return entry["value"]
+
+    def set(self, key, value, ttl):
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+        self.collection.replace_one(
+            {"_id": key},
+            {"value": value, "expires_at": expires_at},
+            upsert=True
+        )
+
+    def get_generation(self):
+        entry = self.collection.find_one({"_id": GENERATION_KEY})
+        return entry["value"] if entry else 0
+
+    def bump_generation(self):
+        entry = self.collection.find_one_and_update(
+            {"_id": GENERATION_KEY},
+            {"$inc": {"value": 1}, "$set": {"expires_at": datetime.datetime.max}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return entry["value"]
+
+    def acquire(self, key, ttl):
+        """Prendre un bail de calcul pour une clé (jeton du bail, None si un autre worker l'a)"""
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+        self.collection.delete_one({"_id": lock_key, "expires_at": {"$lt": datetime.datetime.utcnow()}})
+        try:
+            self.collection.insert_one({"_id": lock_key, "owner": token, "expires_at": expires_at})
+            return token
+        except DuplicateKeyError:
+            return None
+
+    def release(self, key, token):
+        """Libérer le bail s'il appartient encore à ce jeton (il a pu expirer et être repris)"""
+        self.collection.delete_one({"_id": f"lock:{key}", "owner": token})
+
+
+class AnalyticsCache:
+    """Cache des résultats d'analytics, invalidé par un compteur de génération
+
+    get_version (optionnel) retourne une version des données partagée entre
+    workers (ex. séquence du flux des modifications) : elle entre dans les
+    clés, si bien qu'une écriture reçue par un autre worker invalide aussi
+    le cache en mémoire de celui-ci.
+    """
+
+    def __init__(self, backend, ttl=CACHE_TTL, get_version=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.get_data_version = get_version
+        self.locks = {}
+        self.locks_guard = threading.Lock()
+
+    def get_version(self):
+        """Version commune à tous les workers (None si aucune n'est disponible)"""
+        parts = []
+        if self.backend.shared:
+            parts.append(str(self.backend.get_generation()))
+        if self.get_data_version:
+            parts.append(str(self.get_data_version()))
+        return ":".join(parts) or None
+
+    def make_key(self, name, params=None):
+        """Clé incluant la génération courante : une écriture invalide tout"""
+        generation = self.backend.get_generation()
+        version = self.get_data_version() if self.get_data_version else ""
+        return f"{name}:{generation}:{version}:{json.dumps(params or {}, sort_keys=True, default=str)}"
+
+    def bump_generation(self):
+        """À appeler après chaque écriture sur la collection des employés"""
+        return self.backend.bump_generation()
+
+    def get_generation(self):
+        return self.backend.get_generation()
+
+    def _local_lock(self, key):
+        with self.locks_guard:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def get_or_compute(self, name, params, compute, ttl=None):
+        """Valeur en cache ou calculée une seule fois pour les requêtes simultanées"""
+        ttl = ttl or self.ttl
+        key = self.make_key(name, params)
+        value = self.backend.get(key)
+        if value is not None:
+            return value
+
+        # Un seul calcul par processus pour une même clé
+        with self._local_lock(key):
+            value = self.backend.get(key)
+            if value is not None:
+                return value
+
+            # Puis un seul calcul entre workers (backend partagé)
+            deadline = time.time() + CACHE_LOCK_TIMEOUT
+            token = self.backend.acquire(key, CACHE_LOCK_TIMEOUT)
+            while token is None:
+                time.sleep(0.1)
+                value = self.backend.get(key)
+                if value is not None:
+                    return value
+                if time.time() > deadline:
+                    # Calcul sans bail : le bail de l'autre worker n'est pas libéré ici
+                    break
+                token = self.backend.acquire(key, CACHE_LOCK_TIMEOUT)
+            try:
+                value = compute()
+                try:
+                    self.backend.set(key, value, ttl)
+                except Exception as e:
+                    # Résultat non cachable (ex. document > 16 Mo) : renvoyé quand même
+                    logger.error(f"Error while caching {name}: {e}")
+            finally:
+                if token is not None:
+                    self.backend.release(key, token)
+        with self.locks_guard:
+            self.locks.pop(key, None)
+        return value
+
+
+def create_cache(get_database=None, get_version=None):
+    """Créer le cache selon CACHE_BACKEND (get_database : fonction retournant la base)"""
+    if CACHE_BACKEND == "mongo" and get_database is not None:
+        return AnalyticsCache(MongoCacheBackend(lambda: get_database()[CACHE_COLLECTION]), get_version=get_version)
+    return AnalyticsCache(MemoryCacheBackend(), get_version=get_version)
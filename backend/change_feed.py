@@ -0,0 +1,210 @@
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+from bson import ObjectId
+from mongo_utils import COUNTERS_COLLECTION, DERIVED_FIELDS, change_stamp
+import datetime
+import os
+
+# Suppressions conservées pour le flux des modifications
+TOMBSTONES_COLLECTION = os.getenv("TOMBSTONES_COLLECTION", "employee_tombstones")
+
+CHANGES_DEFAULT_LIMIT = 1000
+
+# "stream" : change streams (ordre de validation, replica set requis), "sequence" :
+# numéros _seq, "auto" : change streams quand le serveur les accepte
+CHANGES_MODE = os.getenv("CHANGES_MODE", "auto")
+STREAM_TOKEN_PREFIX = "cs:"
+CHANGES_AWAIT_MS = int(os.getenv("CHANGES_AWAIT_MS", 200))
+# Mode "sequence" : un _seq est attribué avant la validation de l'écriture, une
+# écriture lente peut donc apparaître sous le jeton d'un client. Les écritures
+# des CHANGES_LAG_SECONDS dernières secondes sous le jeton sont renvoyées à
+# nouveau (réappliquer un upsert ou une suppression par _id est sans effet).
+CHANGES_LAG_SECONDS = int(os.getenv("CHANGES_LAG_SECONDS", 30))
+
+# Erreurs "historique perdu" : le jeton est sorti de l'oplog
+STREAM_HISTORY_LOST_CODES = (280, 286)
+
+_stream_supported = {}
+
+# Tri commun aux documents et aux suppressions
+CHANGE_ORDER = [("_seq", ASCENDING), ("_id", ASCENDING)]
+
+
+def get_tombstones(collection):
+    """Collection des suppressions associée aux employés"""
+    return collection.database[TOMBSTONES_COLLECTION]
+
+
+def record_delete(collection, employee_id):
+    """Enregistrer la suppression d'un employé dans le flux"""
+    stamp = change_stamp(collection)
+    get_tombstones(collection).replace_one(
+        {"_id": employee_id},
+        {"_seq": stamp["_seq"], "deleted_at": stamp["updated_at"]},
+        upsert=True
+    )
+
+
+def current_token(collection):
+    """Position actuelle de la séquence des écritures (version partagée des données)"""
+    counter = collection.database[COUNTERS_COLLECTION].find_one({"_id": collection.name})
+    return str(counter["seq"] if counter else 0)
+
+
+def parse_token(token):
+    """Décoder un jeton "seq" ou "seq:id" (ValueError si invalide)"""
+    seq, _, last_id = str(token).partition(":")
+    seq = int(seq)
+    if last_id and not ObjectId.is_valid(last_id):
+        raise ValueError("Invalid change token")
+    return seq, ObjectId(last_id) if last_id else None
+
+
+def _after_token(seq, last_id):
+    """Filtre des modifications strictement postérieures au jeton"""
+    if last_id is None:
+        return {"_seq": {"$gt": seq}}
+    return {"$or": [
+        {"_seq": {"$gt": seq}},
+        {"_seq": seq, "_id": {"$gt": last_id}}
+    ]}
+
+
+def stream_supported(collection):
+    """Les change streams sont-ils disponibles (mémorisé par base) ?"""
+    if CHANGES_MODE == "sequence":
+        return False
+    key = (collection.database.name, collection.name)
+    if key not in _stream_supported:
+        try:
+            collection.watch(max_await_time_ms=1).close()
+            _stream_supported[key] = True
+        except (OperationFailure, NotImplementedError, TypeError, AttributeError):
+            # Serveur autonome (pas de replica set) ou client sans change streams
+            if CHANGES_MODE == "stream":
+                raise
+            _stream_supported[key] = False
+    return _stream_supported[key]
+
+
+def start_token(collection):
+    """Jeton correspondant à l'état actuel (à prendre avant un chargement complet)"""
+    if stream_supported(collection):
+        with collection.watch() as stream:
+            return STREAM_TOKEN_PREFIX + stream.resume_token["_data"]
+    return current_token(collection)
+
+
+def _public(document):
+    """Document renvoyé par le flux, sans les champs techniques"""
+    return {key: value for key, value in document.items() if key not in DERIVED_FIELDS}
+
+
+def _stream_changes(collection, token, limit):
+    """Modifications lues dans le change stream, dans l'ordre de validation
+
+    LookupError si le jeton n'est plus dans l'oplog (rechargement complet).
+    """
+    if not stream_supported(collection):
+        raise ValueError("Change streams are not available")
+    changes = {}
+    has_more = False
+    try:
+        with collection.watch(
+            full_document="updateLookup",
+            resume_after={"_data": token[len(STREAM_TOKEN_PREFIX):]},
+            max_await_time_ms=CHANGES_AWAIT_MS,
+            batch_size=limit
+        ) as stream:
+            while len(changes) < limit:
+                change = stream.try_next()
+                if change is None:
+                    break
+                if change["operationType"] not in ("insert", "update", "replace", "delete"):
+                    continue
+                employee_id = change["documentKey"]["_id"]
+                document = change.get("fullDocument")
+                # Un seul état par employé : le dernier lu
+                changes.pop(employee_id, None)
+                if document is None:
+                    changes[employee_id] = {"op": "delete", "id": employee_id}
+                else:
+                    changes[employee_id] = {"op": "upsert", "id": employee_id, "employee": _public(document)}
+            else:
+                has_more = True
+            next_token = STREAM_TOKEN_PREFIX + stream.resume_token["_data"]
+    except OperationFailure as e:
+        if e.code in STREAM_HISTORY_LOST_CODES:
+            raise LookupError("Change token is no longer available, reload required")
+        raise
+    return {"changes": list(changes.values()), "token": next_token, "has_more": has_more}
+
+
+def _sequence_changes(collection, token, limit):
+    """Modifications après le jeton (ordre _seq) et relecture de la fenêtre de latence"""
+    seq, last_id = parse_token(token)
+    query = _after_token(seq, last_id)
+    projection = {field: 0 for field in DERIVED_FIELDS if field != "_seq"}
+    tombstones = get_tombstones(collection)
+
+    updated = collection.find(query, projection).sort(CHANGE_ORDER).limit(limit + 1)
+    deleted = tombstones.find(query).sort(CHANGE_ORDER).limit(limit + 1)
+
+    changes = [("upsert", employee) for employee in updated]
+    changes += [("delete", tombstone) for tombstone in deleted]
+    changes.sort(key=lambda change: (change[1]["_seq"], change[1]["_id"]))
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    next_token = str(token)
+    if changes:
+        last = changes[-1][1]
+        next_token = f"{last['_seq']}:{last['_id']}"
+
+    # Écritures récentes numérotées sous le jeton : validées après la lecture précédente ?
+    if seq > 0 and CHANGES_LAG_SECONDS > 0:
+        horizon = datetime.datetime.utcnow() - datetime.timedelta(seconds=CHANGES_LAG_SECONDS)
+        lagging = collection.find(
+            {"_seq": {"$lte": seq}, "updated_at": {"$gte": horizon}}, projection
+        ).limit(limit)
+        changes += [("upsert", employee) for employee in lagging]
+        lagging = tombstones.find({"_seq": {"$lte": seq}, "deleted_at": {"$gte": horizon}}).limit(limit)
+        changes += [("delete", tombstone) for tombstone in lagging]
+
+    # Un seul état par employé : celui de plus grand numéro
+    latest = {}
+    for op, document in changes:
+        current = latest.get(document["_id"])
+        if current is None or current[1]["_seq"] < document["_seq"]:
+            latest[document["_id"]] = (op, document)
+
+    results = []
+    for op, document in sorted(latest.values(), key=lambda change: (change[1]["_seq"], change[1]["_id"])):
+        document_seq = document.pop("_seq")
+        if op == "delete":
+            results.append({"op": op, "id": document["_id"], "seq": document_seq})
+        else:
+            results.append({"op": op, "id": document["_id"], "seq": document_seq, "employee": document})
+
+    return {"changes": results, "token": next_token, "has_more": has_more}
+
+
+def get_changes(collection, token, limit=CHANGES_DEFAULT_LIMIT):
+    """Documents insérés/modifiés et supprimés depuis un jeton
+
+    Jeton "cs:..." : change stream, ordre de validation des écritures.
+    Jeton "seq" ou "seq:id" : numéros _seq (les écritures d'une même séquence,
+    comme increment_prime, partagent un numéro : le dernier _id permet de
+    reprendre au milieu du groupe) avec relecture de la fenêtre de latence.
+    ValueError si le jeton est invalide, LookupError s'il a expiré.
+    """
+    if str(token).startswith(STREAM_TOKEN_PREFIX):
+        return _stream_changes(collection, str(token), limit)
+    return _sequence_changes(collection, token, limit)
+
+
+def ensure_change_feed_indexes(collection):
+    """Index des suppressions pour la lecture du flux (ordre et fenêtre de latence)"""
+    tombstones = get_tombstones(collection)
+    tombstones.create_index("deleted_at", name="deleted_at")
+    return tombstones.create_index(CHANGE_ORDER, name="change_seq")
@@ -0,0 +1,163 @@
+import csv
+import io
+import os
+import zlib
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # parquet/arrow indisponibles, CSV uniquement
+    pa = None
+    pq = None
+
+# Nombre de lignes par morceau CSV / par record batch Arrow
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", 5000))
+
+# Colonnes exportées : adresse.* est aplati en colonnes
+EXPORT_COLUMNS = [
+    "_id", "nom", "prenom", "anciennete", "prime",
+    "adresse.numero", "adresse.rue", "adresse.codepostal", "adresse.ville"
+]
+NUMERIC_COLUMNS = ("anciennete", "prime")
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow")
+}
+
+
+def export_projection(columns):
+    """Projection MongoDB couvrant les colonnes exportées"""
+    return {column: 1 for column in columns}
+
+
+def flatten(document, columns):
+    """Valeurs d'un document dans l'ordre des colonnes (chemins pointés)"""
+    row = []
+    for column in columns:
+        value = document
+        for part in column.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        row.append(value)
+    return row
+
+
+def _batches(cursor, columns):
+    """Lignes aplaties regroupées par EXPORT_BATCH_ROWS"""
+    batch = []
+    for document in cursor:
+        batch.append(flatten(document, columns))
+        if len(batch) >= EXPORT_BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_csv(cursor, columns):
+    """Export CSV en morceaux, en-tête compris"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in _batches(cursor, columns):
+        writer.writerows(
+            ["" if value is None else value for value in row] for row in batch
+        )
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _StreamSink(io.RawIOBase):
+    """Fichier en écriture seule vidé au fil de l'eau (position conservée)"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_schema(columns):
+    """Schéma Arrow : nombres en float64, le reste en chaînes"""
+    return pa.schema([
+        (column, pa.float64() if column in NUMERIC_COLUMNS else pa.string())
+        for column in columns
+    ])
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _record_batch(batch, columns, schema):
+    """Convertir des lignes aplaties en RecordBatch"""
+    arrays = []
+    for index, column in enumerate(columns):
+        values = [row[index] for row in batch]
+        if column in NUMERIC_COLUMNS:
+            values = [_to_float(value) for value in values]
+        else:
+            values = [None if value is None else str(value) for value in values]
+        arrays.append(pa.array(values, type=schema.field(column).type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def iter_arrow(cursor, columns, export_format):
+    """Export Parquet (un row group par lot) ou flux Arrow IPC"""
+    schema = _arrow_schema(columns)
+    sink = _StreamSink()
+    output = pa.PythonFile(sink, mode="w")
+    if export_format == "parquet":
+        writer = pq.ParquetWriter(output, schema)
+        write = lambda record_batch: writer.write_table(pa.Table.from_batches([record_batch]))
+    else:
+        writer = pa.ipc.new_stream(output, schema)
+        write = writer.write_batch
+
+    for batch in _batches(cursor, columns):
+        write(_record_batch(batch, columns, schema))
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+def iter_export(cursor, columns, export_format):
+    """Morceaux binaires de l'export dans le format demandé"""
+    if export_format == "csv":
+        return iter_csv(cursor, columns)
+    if pa is None:
+        raise RuntimeError("pyarrow is required for parquet/arrow exports")
+    return iter_arrow(cursor, columns, export_format)
+
+
+def gzip_chunks(chunks):
+    """Compresser un flux de morceaux en gzip au fil de l'eau"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
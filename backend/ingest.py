@@ -0,0 +1,206 @@
+from pymongo.errors import BulkWriteError
+from mongo_utils import DUPLICATE_ERROR, change_stamp, derived_fields, existing_duplicate_keys
+import csv
+import io
+import json
+import os
+import time
+
+# Taille des lots insert_many et nombre maximum d'erreurs détaillées
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 1000))
+BULK_MAX_ERRORS = 1000
+
+READ_CHUNK_SIZE = 64 * 1024
+
+ADDRESS_FIELDS = ("numero", "rue", "codepostal", "ville")
+
+
+def clean_employee(data):
+    """Valider et nettoyer un employé (ValueError si invalide)"""
+    if not isinstance(data, dict):
+        raise ValueError("Employee must be an object")
+    for field in ("nom", "prenom"):
+        if field not in data:
+            raise ValueError(f"Missing required field: {field}")
+
+    return {
+        "nom": str(data.get('nom', '')).strip(),
+        "prenom": str(data.get('prenom', '')).strip(),
+        "anciennete": float(data.get('anciennete', 0)) if data.get('anciennete') else 0,
+        "prime": float(data.get('prime', 0)) if data.get('prime') else 0,
+        "adresse": data.get('adresse', {})
+    }
+
+
+def iter_json_array(stream):
+    """Lire un tableau JSON objet par objet sans charger tout le corps"""
+    decoder = json.JSONDecoder()
+    reader = io.TextIOWrapper(stream, encoding="utf-8")
+    buffer = ""
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        # Sauter les espaces et séparateurs
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                yield value
+                position = end
+                continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError("Invalid JSON array body")
+        elif eof:
+            if started:
+                raise ValueError("Unterminated JSON array")
+            return
+
+        chunk = reader.read(READ_CHUNK_SIZE)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_ndjson(stream):
+    """Lire un document JSON par ligne"""
+    for line in io.TextIOWrapper(stream, encoding="utf-8"):
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _csv_value(value):
+    """Cellule CSV conservée en texte : "01000" reste un code postal valide
+
+    Seuls anciennete et prime sont numériques (convertis par clean_employee).
+    """
+    return (value or "").strip()
+
+
+def iter_csv(stream):
+    """Lire un CSV (colonnes adresse.* ou numero/rue/codepostal/ville)"""
+    for row in csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8", newline="")):
+        employee = {}
+        adresse = {}
+        for column, value in row.items():
+            if column is None or value in (None, ""):
+                continue
+            column = column.strip()
+            if column.startswith("adresse."):
+                adresse[column[len("adresse."):]] = _csv_value(value)
+            elif column in ADDRESS_FIELDS:
+                adresse[column] = _csv_value(value)
+            else:
+                employee[column] = _csv_value(value)
+        employee["adresse"] = adresse
+        yield employee
+
+
+PARSERS = {
+    "json": iter_json_array,
+    "ndjson": iter_ndjson,
+    "csv": iter_csv
+}
+
+
+def iter_rows(rows):
+    """Numéroter les lignes et transformer les erreurs de parsing en erreur de ligne"""
+    row = 0
+    iterator = iter(rows)
+    while True:
+        try:
+            data = next(iterator)
+        except StopIteration:
+            return
+        except (ValueError, csv.Error) as e:
+            # Erreur de syntaxe : impossible de continuer la lecture
+            yield row, None, f"Parse error: {e}"
+            return
+        yield row, data, None
+        row += 1
+
+
+def bulk_insert(collection, rows, batch_size=BULK_BATCH_SIZE, on_inserted=None, reject_duplicates=False):
+    """Insérer des employés par lots insert_many non ordonnés
+
+    on_inserted(documents) est appelé après chaque lot avec les documents insérés
+    (mise à jour des résumés et index annexes). Avec reject_duplicates, les
+    lignes dont la clé nom + prénom existe déjà (en base ou plus haut dans le
+    corps) sont refusées comme les lignes invalides.
+    """
+    started_at = time.time()
+    report = {"received": 0, "inserted": 0, "failed": 0, "batches": 0, "errors": []}
+    seen_keys = set()
+
+    def add_error(row, message):
+        report["failed"] += 1
+        if len(report["errors"]) < BULK_MAX_ERRORS:
+            report["errors"].append({"row": row, "error": message})
+
+    def reject(batch):
+        existing = existing_duplicate_keys(collection, [document.get("cle_unique") for _, document in batch])
+        kept = []
+        for row, document in batch:
+            key = document.get("cle_unique")
+            if key in existing or key in seen_keys:
+                add_error(row, DUPLICATE_ERROR)
+                continue
+            seen_keys.add(key)
+            kept.append((row, document))
+        return kept
+
+    def flush(batch):
+        if batch and reject_duplicates:
+            batch = reject(batch)
+        if not batch:
+            return
+        # Un seul numéro de séquence par lot pour le flux des modifications
+        stamp = change_stamp(collection)
+        documents = [dict(document, **stamp) for _, document in batch]
+        failed = set()
+        try:
+            collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed.add(error["index"])
+                add_error(batch[error["index"]][0], error.get("errmsg", "Write error"))
+        inserted = [document for index, document in enumerate(documents) if index not in failed]
+        report["inserted"] += len(inserted)
+        report["batches"] += 1
+        if on_inserted and inserted:
+            on_inserted(inserted)
+
+    batch = []
+    for row, data, parse_error in iter_rows(rows):
+        if parse_error:
+            add_error(row, parse_error)
+            break
+        report["received"] += 1
+        try:
+            employee = clean_employee(data)
+        except (ValueError, TypeError) as e:
+            add_error(row, str(e))
+            continue
+        employee.update(derived_fields(employee))
+        batch.append((row, employee))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    flush(batch)
+
+    elapsed = time.time() - started_at
+    report["elapsed_seconds"] = round(elapsed, 3)
+    report["rows_per_second"] = round(report["inserted"] / elapsed, 1) if elapsed > 0 else None
+    return report
@@ -0,0 +1,253 @@
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from pymongo.write_concern import WriteConcern
+from mongo_utils import change_stamp
+from slow_queries import track_operation
+import datetime
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Travaux de fond (un document par travail, _id = identifiant fourni par le client)
+JOBS_COLLECTION = os.getenv("JOBS_COLLECTION", "jobs")
+# Taille d'un lot (plage d'_id) et pause entre deux lots
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", 1000))
+JOB_THROTTLE_MS = int(os.getenv("JOB_THROTTLE_MS", 50))
+# Chaque lot attend cet acquittement : le débit suit la réplication
+JOB_WRITE_CONCERN = os.getenv("JOB_WRITE_CONCERN", "majority")
+# Un travail "running" sans nouvelle depuis ce délai est repris par le prochain appel
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 60))
+
+# Champ posé sur chaque employé traité : un lot rejoué ne l'incrémente pas deux fois
+JOB_MARKER_FIELD = "_job"
+
+JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+ACTIVE_STATUSES = ("pending", "running")
+
+
+def get_jobs(collection):
+    """Collection des travaux associée aux employés"""
+    return collection.database[JOBS_COLLECTION]
+
+
+def ensure_job_indexes(collection):
+    """Index de recherche du travail actif par type"""
+    return get_jobs(collection).create_index(
+        [("type", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)],
+        name="type_status"
+    )
+
+
+def _write_concern(value=JOB_WRITE_CONCERN):
+    return WriteConcern(w=int(value) if value.isdigit() else value)
+
+
+def _now():
+    return datetime.datetime.utcnow()
+
+
+def _stale_before():
+    return _now() - datetime.timedelta(seconds=JOB_LEASE_SECONDS)
+
+
+def format_job(job):
+    """Document de travail renvoyé par l'API (avancement en pourcentage)"""
+    if not job:
+        return None
+    total = job.get("total") or 0
+    result = {key: value for key, value in job.items() if key not in ("_id", "owner")}
+    result["id"] = job["_id"]
+    result["progress"] = round(100.0 * min(job.get("processed", 0), total) / total, 1) if total else (
+        100.0 if job.get("status") == "completed" else 0.0
+    )
+    return result
+
+
+def get_job(collection, job_id):
+    return format_job(get_jobs(collection).find_one({"_id": job_id}))
+
+
+def find_active_job(collection, job_type):
+    """Travail du type donné en attente ou en cours (bail non expiré)"""
+    return get_jobs(collection).find_one({
+        "type": job_type,
+        "status": {"$in": list(ACTIVE_STATUSES)},
+        "heartbeat_at": {"$gte": _stale_before()}
+    })
+
+
+def find_completed_job(collection, job_type, params):
+    """Dernier travail terminé du type et des paramètres donnés"""
+    return get_jobs(collection).find_one(
+        {"type": job_type, "params": params, "status": "completed"},
+        sort=[("finished_at", DESCENDING)]
+    )
+
+
+def create_job(collection, job_type, params, job_id=None):
+    """Créer le travail, ou retrouver celui de même identifiant
+
+    Retourne (travail, créé). ValueError si l'identifiant est invalide ou
+    déjà utilisé avec d'autres paramètres, RuntimeError si un autre travail
+    du même type est encore actif.
+    """
+    job_id = str(job_id) if job_id is not None else uuid.uuid4().hex
+    if not JOB_ID_PATTERN.match(job_id):
+        raise ValueError("Invalid job id")
+    jobs = get_jobs(collection)
+    existing = jobs.find_one({"_id": job_id})
+    if existing:
+        if existing["type"] != job_type or existing["params"] != params:
+            raise ValueError(f"Job {job_id} already exists with different parameters")
+        return existing, False
+    # Un seul travail actif par type : le marqueur ne garde que le dernier identifiant
+    active = find_active_job(collection, job_type)
+    if active:
+        raise RuntimeError(f"Job {active['_id']} is still running")
+    now = _now()
+    job = {
+        "_id": job_id,
+        "type": job_type,
+        "params": params,
+        "status": "pending",
+        "last_id": None,
+        "total": None,
+        "processed": 0,
+        "modified": 0,
+        "batches": 0,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+        "heartbeat_at": now,
+        "finished_at": None
+    }
+    try:
+        jobs.insert_one(job)
+    except DuplicateKeyError:
+        # Même identifiant envoyé deux fois en parallèle
+        return jobs.find_one({"_id": job_id}), False
+    return job, True
+
+
+def claim_job(collection, job_id):
+    """Prendre la main sur un travail non terminé (absent, fini ou déjà pris : None)
+
+    Un travail "running" dont le bail a expiré (worker arrêté) peut être repris.
+    """
+    owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    now = _now()
+    return get_jobs(collection).find_one_and_update(
+        {"_id": job_id, "$or": [
+            {"status": {"$in": ["pending", "failed"]}},
+            {"status": "running", "heartbeat_at": {"$lt": _stale_before()}}
+        ]},
+        {"$set": {"status": "running", "owner": owner, "error": None,
+                  "heartbeat_at": now, "updated_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _owned(job):
+    # Les écritures d'avancement ne s'appliquent que tant que ce worker a le bail
+    return {"_id": job["_id"], "owner": job["owner"]}
+
+
+def update_job(collection, job, fields=None, inc=None):
+    """Enregistrer l'avancement et prolonger le bail (False si le bail est perdu)"""
+    now = _now()
+    update = {"$set": dict(fields or {}, heartbeat_at=now, updated_at=now)}
+    if inc:
+        update["$inc"] = inc
+    return get_jobs(collection).update_one(_owned(job), update).matched_count > 0
+
+
+def complete_job(collection, job, fields=None):
+    now = _now()
+    get_jobs(collection).update_one(_owned(job), {"$set": dict(
+        fields or {}, status="completed", updated_at=now, finished_at=now
+    )})
+    return get_job(collection, job["_id"])
+
+
+def fail_job(collection, job, error):
+    logger.error(f"Job {job['_id']} failed: {error}")
+    get_jobs(collection).update_one(_owned(job), {"$set": {
+        "status": "failed", "error": str(error), "updated_at": _now()
+    }})
+
+
+@track_operation
+def run_increment_prime_job(collection, job, on_batch=None,
+                            batch_size=JOB_BATCH_SIZE, throttle_ms=JOB_THROTTLE_MS):
+    """Incrémenter la prime par plages d'_id croissants, en reprenant après last_id
+
+    Chaque lot pose le marqueur du travail sur les employés modifiés et exclut
+    ceux qui le portent déjà : rejouer un lot interrompu avant l'enregistrement
+    de l'avancement n'incrémente aucun employé deux fois.
+    """
+    writer = collection.with_options(write_concern=_write_concern())
+    job_id = job["_id"]
+    amount = job["params"]["amount"]
+    last_id = job.get("last_id")
+    if job.get("total") is None:
+        update_job(collection, job, {"total": collection.count_documents({"prime": {"$exists": True}})})
+
+    try:
+        while True:
+            range_filter = {"prime": {"$exists": True}}
+            if last_id is not None:
+                range_filter["_id"] = {"$gt": last_id}
+            ids = [doc["_id"] for doc in collection.find(range_filter, {"_id": 1})
+                   .sort("_id", ASCENDING).limit(batch_size)]
+            if not ids:
+                break
+            upper = ids[-1]
+            range_filter["_id"] = dict(range_filter.get("_id", {}), **{"$lte": upper})
+            range_filter[JOB_MARKER_FIELD] = {"$ne": job_id}
+            stamp = change_stamp(collection)
+            stamp[JOB_MARKER_FIELD] = job_id
+            result = writer.update_many(range_filter, {"$inc": {"prime": amount}, "$set": stamp})
+            last_id = upper
+
+            owned = update_job(collection, job, {"last_id": last_id}, inc={
+                "processed": len(ids), "modified": result.modified_count, "batches": 1
+            })
+            if on_batch and result.modified_count:
+                on_batch(result.modified_count)
+            if not owned:
+                # Bail repris par un autre worker : il continue à partir de last_id
+                logger.warning(f"Job {job_id} claimed by another worker, stopping")
+                return get_job(collection, job_id)
+            if len(ids) < batch_size:
+                break
+            if throttle_ms:
+                time.sleep(throttle_ms / 1000)
+    except Exception as e:
+        fail_job(collection, job, e)
+        raise
+
+    return complete_job(collection, job)
+
+
+def start_job(collection, job_id, run, on_batch=None):
+    """Lancer le travail dans un thread du worker s'il n'est pas déjà en cours
+
+    Retourne True si ce processus a pris la main sur le travail.
+    """
+    job = claim_job(collection, job_id)
+    if not job:
+        return False
+
+    def target():
+        try:
+            run(collection, job, on_batch=on_batch)
+        except Exception:
+            pass  # statut "failed" déjà enregistré, reprise par un nouvel appel
+
+    threading.Thread(target=target, name=f"job-{job_id}", daemon=True).start()
+    return True
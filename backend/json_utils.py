@@ -0,0 +1,77 @@
+from flask.json.provider import JSONProvider
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from bson.regex import Regex
+import datetime
+import decimal
+import json
+import os
+import re
+
+try:
+    import orjson
+except ImportError:  # encodeur de la bibliothèque standard
+    orjson = None
+
+# Encodeur JSON des réponses : "orjson" (si installé) ou "json"
+JSON_ENCODER = os.getenv("JSON_ENCODER", "orjson" if orjson is not None else "json")
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def default(value):
+    """Types BSON non gérés nativement par l'encodeur"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (Regex, re.Pattern)):
+        return {"$regex": value.pattern}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
+
+
+def get_dumps(encoder=JSON_ENCODER):
+    """Fonction obj -> bytes UTF-8 de l'encodeur demandé"""
+    if encoder == "orjson" and orjson is not None:
+        return _orjson_dumps
+    return _stdlib_dumps
+
+
+dumps_bytes = get_dumps()
+
+
+def dumps(obj):
+    """Sérialiser un document MongoDB (ObjectId, dates, Decimal128) en une passe"""
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def loads(data):
+    if orjson is not None and JSON_ENCODER == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class MongoJSONProvider(JSONProvider):
+    """Fournisseur JSON de Flask : jsonify écrit directement les octets encodés"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype="application/json")
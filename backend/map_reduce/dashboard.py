@@ -0,0 +1,125 @@
+from slow_queries import track_operation
+import os
+
+# Bornes des histogrammes (la dernière tranche est ouverte)
+SENIORITY_BOUNDARIES = [0, 3, 6, 11, 16]
+PRIME_BOUNDARIES = [0, 500, 1000, 2000, 5000]
+# Employés seniors : ancienneté strictement supérieure (carte "10+ ans")
+DASHBOARD_SENIOR_YEARS = int(os.getenv("DASHBOARD_SENIOR_YEARS", 10))
+DASHBOARD_TOP_LIMIT = 50
+
+UNKNOWN_CITY = "Non spécifiée"
+# Tranche des valeurs négatives ou non numériques (hors histogramme)
+INVALID_BUCKET = -1
+
+
+def _histogram(field, boundaries):
+    """$bucket sur un champ numérique, valeurs au-delà de la dernière borne regroupées
+
+    Champ absent : 0. Les valeurs négatives ou non numériques sont comptées à
+    part (INVALID_BUCKET) au lieu de tomber dans la tranche ouverte.
+    """
+    return [{"$bucket": {
+        "groupBy": {"$let": {
+            "vars": {"value": {"$ifNull": [f"${field}", 0]}},
+            "in": {"$cond": [
+                {"$and": [{"$isNumber": "$$value"}, {"$gte": ["$$value", 0]}]},
+                "$$value",
+                INVALID_BUCKET
+            ]}
+        }},
+        "boundaries": [INVALID_BUCKET] + boundaries,
+        "default": "over",
+        "output": {"count": {"$sum": 1}}
+    }}]
+
+
+def dashboard_pipeline(top=10):
+    """Une seule agrégation $facet pour toutes les cartes du tableau de bord"""
+    return [{"$facet": {
+        "totals": [{"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "anciennete_moyenne": {"$avg": "$anciennete"},
+            "prime_totale": {"$sum": "$prime"},
+            "avec_prime": {"$sum": {"$cond": [{"$gt": ["$prime", 0]}, 1, 0]}},
+            "seniors": {"$sum": {"$cond": [{"$gt": ["$anciennete", DASHBOARD_SENIOR_YEARS]}, 1, 0]}},
+            "avec_rue": {"$sum": {"$cond": [{"$ifNull": ["$adresse.rue", False]}, 1, 0]}}
+        }}],
+        "villes": [
+            {"$group": {
+                "_id": {"$ifNull": ["$adresse.ville", UNKNOWN_CITY]},
+                "count": {"$sum": 1},
+                "anciennete_moyenne": {"$avg": "$anciennete"},
+                "prime_totale": {"$sum": "$prime"}
+            }},
+            {"$sort": {"count": -1, "_id": 1}}
+        ],
+        "anciennete": _histogram("anciennete", SENIORITY_BOUNDARIES),
+        "prime": _histogram("prime", PRIME_BOUNDARIES),
+        "oldest": [
+            {"$sort": {"anciennete": -1, "_id": 1}},
+            {"$limit": top},
+            {"$project": {"nom": 1, "prenom": 1, "anciennete": 1, "ville": "$adresse.ville"}}
+        ],
+        "doublons": [
+            {"$match": {"cle_unique": {"$exists": True}}},
+            {"$group": {"_id": "$cle_unique", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$group": {"_id": None, "groupes": {"$sum": 1}, "employes": {"$sum": "$count"}}}
+        ]
+    }}]
+
+
+def format_histogram(buckets, boundaries):
+    """Tranches [min, max) dans l'ordre, y compris les tranches vides"""
+    counts = {bucket["_id"]: bucket["count"] for bucket in buckets}
+    bounds = boundaries + [None]
+    return [
+        {"min": bounds[index], "max": bounds[index + 1],
+         "count": counts.get(bounds[index], 0) + (counts.get("over", 0) if bounds[index + 1] is None else 0)}
+        for index in range(len(boundaries))
+    ]
+
+
+def invalid_count(buckets):
+    """Nombre de valeurs négatives ou non numériques d'un histogramme"""
+    return sum(bucket["count"] for bucket in buckets if bucket["_id"] == INVALID_BUCKET)
+
+
+@track_operation
+def execute_dashboard(collection, top=10):
+    """Résumé du tableau de bord en un aller-retour MongoDB"""
+    result = next(collection.aggregate(dashboard_pipeline(top), allowDiskUse=True), {})
+    totals = (result.get("totals") or [{}])[0]
+    doublons = (result.get("doublons") or [{}])[0]
+
+    def rounded(value):
+        return round(value, 2) if value is not None else None
+
+    return {
+        "total": totals.get("count", 0),
+        "anciennete_moyenne": rounded(totals.get("anciennete_moyenne")),
+        "prime_totale": rounded(totals.get("prime_totale", 0)),
+        "avec_prime": totals.get("avec_prime", 0),
+        "seniors": totals.get("seniors", 0),
+        "senior_years": DASHBOARD_SENIOR_YEARS,
+        "avec_rue": totals.get("avec_rue", 0),
+        "villes": [{
+            "ville": ville["_id"],
+            "count": ville["count"],
+            "anciennete_moyenne": rounded(ville.get("anciennete_moyenne")),
+            "prime_totale": rounded(ville.get("prime_totale"))
+        } for ville in result.get("villes", [])],
+        "anciennete": format_histogram(result.get("anciennete", []), SENIORITY_BOUNDARIES),
+        "prime": format_histogram(result.get("prime", []), PRIME_BOUNDARIES),
+        "invalides": {
+            "anciennete": invalid_count(result.get("anciennete", [])),
+            "prime": invalid_count(result.get("prime", []))
+        },
+        "oldest": result.get("oldest", []),
+        "doublons": {
+            "groupes": doublons.get("groupes", 0),
+            "employes": doublons.get("employes", 0)
+        }
+    }
@@ -1,7 +1,69 @@
 from bson.code import Code
+from slow_queries import track_operation
+import os
 
-def execute_doublons_detect(collection):
-    """Exécuter le MapReduce pour détecter les doublons (version moderne)"""
+# Moteur par défaut : "stored" (clé cle_unique indexée) ou "compute" (clé recalculée)
+DOUBLONS_ENGINE = os.getenv("DOUBLONS_ENGINE", "stored")
+
+# Nombre de clés en doublon chargées par requête
+DOUBLONS_KEY_BATCH = 1000
+
+
+@track_operation
+def execute_doublons_detect(collection, engine=None):
+    """Détecter les doublons avec le moteur choisi"""
+    engine = engine or DOUBLONS_ENGINE
+    if engine == "compute":
+        return execute_doublons_detect_compute(collection)
+    return execute_doublons_detect_stored(collection)
+
+
+def execute_doublons_detect_stored(collection):
+    """Doublons à partir de la clé cle_unique stockée et indexée
+    
+    Le $group ne lit que l'index (scan couvert) et ne garde qu'un compteur par clé ;
+    seuls les documents des clés en doublon sont ensuite chargés.
+    """
+    pipeline = [
+        {"$match": {"cle_unique": {"$exists": True}}},
+        {"$sort": {"cle_unique": 1}},
+        {"$project": {"_id": 0, "cle_unique": 1}},
+        {"$group": {"_id": "$cle_unique", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    keys = [group["_id"] for group in collection.aggregate(pipeline, allowDiskUse=True)]
+
+    results = []
+    for start in range(0, len(keys), DOUBLONS_KEY_BATCH):
+        batch = keys[start:start + DOUBLONS_KEY_BATCH]
+        groups = {key: {"ids": [], "noms": [], "prenoms": [], "adresses": []} for key in batch}
+        cursor = collection.find(
+            {"cle_unique": {"$in": batch}},
+            {"cle_unique": 1, "nom": 1, "prenom": 1, "adresse": 1}
+        ).sort("_id", 1)
+        for employee in cursor:
+            group = groups[employee["cle_unique"]]
+            group["ids"].append(employee["_id"])
+            group["noms"].append(employee.get("nom"))
+            group["prenoms"].append(employee.get("prenom"))
+            if "adresse" in employee:
+                group["adresses"].append(employee["adresse"])
+
+        for key in batch:
+            group = groups[key]
+            adresses = group["adresses"]
+            group["count"] = len(group["ids"])
+            group["adresses_differentes"] = any(
+                (adresse if adresse is not None else {}) != adresses[0]
+                for adresse in adresses[1:]
+            )
+            results.append({"_id": key, "value": group})
+
+    return results
+
+
+def execute_doublons_detect_compute(collection):
+    """Exécuter le MapReduce pour détecter les doublons (clé recalculée à chaque appel)"""
     
     # Pipeline d'aggregation pour détecter les doublons
     pipeline = [
@@ -0,0 +1,263 @@
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from pymongo import ASCENDING
+from change_feed import current_token
+from jobs import complete_job, fail_job, update_job
+from mongo_utils import normalize_name
+from slow_queries import track_operation
+import hashlib
+import multiprocessing
+import os
+import random
+
+# Paramètres MinHash / LSH : NUM_PERM = LSH_BANDS * LSH_ROWS
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = 4
+
+# Au-delà de cette taille, un bloc est comparé par fenêtre glissante (tri par nom)
+MAX_BLOCK_SIZE = int(os.getenv("FUZZY_MAX_BLOCK_SIZE", 200))
+WINDOW_SIZE = 50
+
+DEFAULT_THRESHOLD = 0.85
+
+# Processus de calcul d'un travail de fond (plafonnés au nombre de CPU)
+FUZZY_WORKERS = max(1, min(int(os.getenv("FUZZY_WORKERS", 1)), os.cpu_count() or 1))
+# Résultats du dernier travail par seuil, lus par la route des doublons
+FUZZY_RESULTS_COLLECTION = os.getenv("FUZZY_RESULTS_COLLECTION", "doublons_fuzzy")
+FUZZY_JOB_TYPE = "doublons_fuzzy"
+
+_PRIME = (1 << 61) - 1
+_random = random.Random(42)
+_PERMUTATIONS = [(_random.randrange(1, _PRIME), _random.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"),
+    **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"),
+    "l": "4",
+    **dict.fromkeys("mn", "5"),
+    "r": "6"
+}
+
+
+def soundex(word):
+    """Code phonétique Soundex d'un mot déjà normalisé"""
+    letters = [char for char in word if char.isalpha()]
+    if not letters:
+        return ""
+    code = letters[0]
+    previous = _SOUNDEX_CODES.get(letters[0], "")
+    for char in letters[1:]:
+        digit = _SOUNDEX_CODES.get(char, "")
+        if digit and digit != previous:
+            code += digit
+        if char not in "hw":
+            previous = digit
+    return (code + "000")[:4]
+
+
+def _record(employee):
+    """Représentation normalisée d'un employé pour la comparaison"""
+    adresse = employee.get("adresse") or {}
+    tokens = sorted(token for token in (
+        normalize_name(employee.get("nom")),
+        normalize_name(employee.get("prenom"))
+    ) if token)
+    address_tokens = set()
+    for field in ("numero", "rue", "codepostal", "ville"):
+        address_tokens |= set(normalize_name(adresse.get(field)).split())
+    return {
+        "_id": employee["_id"],
+        # Tokens triés : nom et prénom inversés donnent le même nom complet
+        "name": " ".join(tokens),
+        "tokens": tokens,
+        "address": address_tokens
+    }
+
+
+def _shingles(record):
+    """Trigrammes du nom complet et mots de l'adresse"""
+    name = f" {record['name']} "
+    shingles = {name[i:i + 3] for i in range(len(name) - 2)}
+    shingles |= {f"a:{token}" for token in record["address"]}
+    return shingles
+
+
+def minhash(shingles):
+    """Signature MinHash d'un ensemble de shingles"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for shingle in shingles
+    ]
+    if not hashes:
+        return [0] * NUM_PERM
+    return [min((a * value + b) % _PRIME for value in hashes) for a, b in _PERMUTATIONS]
+
+
+def blocking_keys(record):
+    """Clés de blocage : code phonétique du nom complet et bandes LSH"""
+    keys = []
+    phonetic = "-".join(soundex(token) for token in record["tokens"])
+    if phonetic:
+        keys.append(f"p:{phonetic}")
+    signature = minhash(_shingles(record))
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        keys.append(f"l:{band}:{hash(tuple(rows))}")
+    return keys
+
+
+def similarity(left, right):
+    """Score de similarité entre deux employés (0 à 1)"""
+    name_score = SequenceMatcher(None, left["name"], right["name"]).ratio()
+    if not left["address"] or not right["address"]:
+        return name_score
+    union = left["address"] | right["address"]
+    address_score = len(left["address"] & right["address"]) / len(union)
+    return 0.8 * name_score + 0.2 * address_score
+
+
+def _candidate_pairs(block):
+    """Paires à comparer dans un bloc (fenêtre glissante pour les gros blocs)"""
+    if len(block) <= MAX_BLOCK_SIZE:
+        for i in range(len(block)):
+            for j in range(i + 1, len(block)):
+                yield block[i], block[j]
+        return
+    block = sorted(block, key=lambda record: record["name"])
+    for i in range(len(block)):
+        for j in range(i + 1, min(i + WINDOW_SIZE, len(block))):
+            yield block[i], block[j]
+
+
+def score_block(args):
+    """Comparer les paires d'un bloc et garder celles au-dessus du seuil"""
+    block, threshold = args
+    matches = []
+    for left, right in _candidate_pairs(block):
+        score = similarity(left, right)
+        if score >= threshold:
+            matches.append((left["_id"], right["_id"], score))
+    return matches
+
+
+def _find(parents, node):
+    """Racine d'un élément (union-find avec compression de chemin)"""
+    while parents[node] != node:
+        parents[node] = parents[parents[node]]
+        node = parents[node]
+    return node
+
+
+@track_operation
+def execute_doublons_fuzzy(collection, threshold=DEFAULT_THRESHOLD, workers=1):
+    """Détection approximative des doublons (accents, fautes de frappe, champs inversés)
+
+    Avec workers > 1, les blocs sont comparés dans des processus démarrés en
+    "spawn" : un fork du worker web copierait le MongoClient et ses threads.
+    """
+    employees = {}
+    blocks = {}
+    projection = {"nom": 1, "prenom": 1, "adresse": 1}
+    for employee in collection.find({}, projection).batch_size(1000):
+        employees[employee["_id"]] = employee
+        record = _record(employee)
+        if not record["name"]:
+            continue
+        for key in blocking_keys(record):
+            blocks.setdefault(key, []).append(record)
+
+    tasks = [(block, threshold) for block in blocks.values() if len(block) > 1]
+    if workers > 1 and len(tasks) > 1:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            block_matches = list(executor.map(score_block, tasks, chunksize=64))
+    else:
+        block_matches = [score_block(task) for task in tasks]
+
+    # Regrouper les paires en clusters et garder le meilleur score par paire
+    parents = {}
+    scores = {}
+    for matches in block_matches:
+        for left, right, score in matches:
+            parents.setdefault(left, left)
+            parents.setdefault(right, right)
+            parents[_find(parents, left)] = _find(parents, right)
+            pair = tuple(sorted((left, right)))
+            scores[pair] = max(score, scores.get(pair, 0))
+
+    clusters = {}
+    for employee_id in parents:
+        clusters.setdefault(_find(parents, employee_id), []).append(employee_id)
+    cluster_scores = {}
+    for (left, right), score in scores.items():
+        root = _find(parents, left)
+        cluster_scores[root] = max(score, cluster_scores.get(root, 0))
+
+    results = []
+    for root, ids in clusters.items():
+        ids.sort()
+        members = [employees[employee_id] for employee_id in ids]
+        adresses = [member.get("adresse") for member in members if "adresse" in member]
+        results.append({
+            "_id": "_".join(normalize_name(members[0].get(field)) for field in ("nom", "prenom")),
+            "value": {
+                "ids": ids,
+                "noms": [member.get("nom") for member in members],
+                "prenoms": [member.get("prenom") for member in members],
+                "adresses": adresses,
+                "count": len(ids),
+                "score": round(cluster_scores.get(root, 0), 3),
+                "adresses_differentes": any(
+                    (adresse if adresse is not None else {}) != adresses[0]
+                    for adresse in adresses[1:]
+                )
+            }
+        })
+
+    results.sort(key=lambda result: -result["value"]["score"])
+    return results
+
+
+def get_fuzzy_results(collection):
+    """Collection des résultats des travaux de détection approximative"""
+    return collection.database[FUZZY_RESULTS_COLLECTION]
+
+
+def read_doublons_fuzzy(collection, job_id):
+    """Clusters enregistrés par un travail, par score décroissant"""
+    cursor = get_fuzzy_results(collection).find({"job": job_id}, {"_id": 0, "cle": 1, "value": 1})
+    return [{"_id": result["cle"], "value": result["value"]} for result in cursor.sort("rank", ASCENDING)]
+
+
+def run_doublons_fuzzy_job(collection, job, on_batch=None, workers=FUZZY_WORKERS, source=None):
+    """Travail de fond : calcul complet puis remplacement des résultats du seuil
+
+    Le jeton du flux des modifications pris au départ permet à la route de
+    signaler un résultat antérieur aux dernières écritures. Le parcours des
+    employés peut être lu sur `source` (secondaire, retard borné) ; le jeton,
+    l'état du travail et les résultats restent sur le primaire.
+    """
+    threshold = job["params"]["threshold"]
+    results_collection = get_fuzzy_results(collection)
+    try:
+        token = current_token(collection)
+        update_job(collection, job, {"token": token})
+        results = execute_doublons_fuzzy(source if source is not None else collection, threshold, workers)
+
+        results_collection.create_index([("job", ASCENDING), ("rank", ASCENDING)], name="job_rank")
+        results_collection.delete_many({"job": job["_id"]})
+        for start in range(0, len(results), 1000):
+            results_collection.insert_many([
+                {"job": job["_id"], "threshold": threshold, "rank": start + index,
+                 "cle": result["_id"], "value": result["value"]}
+                for index, result in enumerate(results[start:start + 1000])
+            ], ordered=False)
+            update_job(collection, job, {"processed": min(start + 1000, len(results))})
+        # Les résultats des travaux précédents de même seuil ne sont plus lus
+        results_collection.delete_many({"threshold": threshold, "job": {"$ne": job["_id"]}})
+    except Exception as e:
+        fail_job(collection, job, e)
+        raise
+    return complete_job(collection, job, {"total": len(results), "processed": len(results)})
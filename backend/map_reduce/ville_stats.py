@@ -1,95 +1,156 @@
-def execute_ville_stats(collection):
-    """Exécuter les statistiques par ville - Version Python simplifiée"""
+from slow_queries import track_operation
+import os
+
+# Moteur par défaut : "summary" (collection matérialisée, voir ville_stats_summary),
+# "aggregate" (un seul $group côté serveur) ou "python"
+VILLE_STATS_ENGINE = os.getenv("VILLE_STATS_ENGINE", "summary")
+
+# Seuil d'ancienneté au-delà duquel un employé est considéré senior
+SENIOR_THRESHOLD = 5
+
+# Documents pris en compte par les deux moteurs (et par le résumé incrémental) :
+# une ancienneté non numérique (chaîne envoyée par un PUT) ferait échouer $multiply
+VILLE_STATS_FILTER = {
+    "adresse.ville": {"$exists": True, "$nin": [None, ""]},
+    "anciennete": {"$type": "number"}
+}
+
+
+def is_seniority(value):
+    """Ancienneté prise en compte : nombre (int ou float), booléens exclus"""
+    return not isinstance(value, bool) and isinstance(value, (int, float))
+
+# Sommes suffisantes pour dériver moyenne, variance et écart-type
+VILLE_STATS_GROUP = {
+    "$group": {
+        "_id": "$adresse.ville",
+        "count": {"$sum": 1},
+        "sum": {"$sum": "$anciennete"},
+        "sumsq": {"$sum": {"$multiply": ["$anciennete", "$anciennete"]}},
+        "min": {"$min": "$anciennete"},
+        "max": {"$max": "$anciennete"},
+        "seniors": {
+            "$sum": {"$cond": [{"$gt": ["$anciennete", SENIOR_THRESHOLD]}, 1, 0]}
+        }
+    }
+}
+
+
+@track_operation
+def execute_ville_stats(collection, engine=None):
+    """Recalculer les statistiques par ville avec le moteur choisi
     
-    try:
-        # Récupérer tous les employés avec ville et ancienneté
-        employees = list(collection.find({
-            "adresse.ville": {"$exists": True, "$ne": None},
-            "anciennete": {"$exists": True, "$ne": None}
-        }, {
-            "adresse.ville": 1,
-            "anciennete": 1,
-            "_id": 0
-        }))
-        
-        # Dictionnaire pour regrouper par ville
-        ville_data = {}
-        
-        # Regrouper les données par ville
-        for emp in employees:
-            ville = emp.get("adresse", {}).get("ville")
-            anciennete = emp.get("anciennete", 0)
-            
-            if not ville:
-                continue
-                
-            if ville not in ville_data:
-                ville_data[ville] = {
-                    "anciennetes": [],
-                    "count": 0,
-                    "sum": 0,
-                    "min": float('inf'),
-                    "max": float('-inf')
-                }
-            
-            ville_data[ville]["anciennetes"].append(anciennete)
-            ville_data[ville]["count"] += 1
-            ville_data[ville]["sum"] += anciennete
-            ville_data[ville]["min"] = min(ville_data[ville]["min"], anciennete)
-            ville_data[ville]["max"] = max(ville_data[ville]["max"], anciennete)
-        
-        # Calculer les statistiques
-        results = []
-        for ville, data in ville_data.items():
-            if data["count"] > 0:
-                avg = data["sum"] / data["count"]
-                
-                # Calcul de la variance
-                variance_sum = 0
-                for val in data["anciennetes"]:
-                    variance_sum += (val - avg) ** 2
-                variance = variance_sum / data["count"]
-                std_dev = variance ** 0.5
-                
-                # Calcul des ratios seniors/juniors
-                seniors = sum(1 for x in data["anciennetes"] if x > 5)
-                juniors = sum(1 for x in data["anciennetes"] if x <= 5)
-                
-                senior_ratio = seniors / data["count"] if data["count"] > 0 else 0
-                junior_ratio = juniors / data["count"] if data["count"] > 0 else 0
-                
-                # Ajouter au résultat
-                results.append({
-                    "_id": ville,
-                    "value": {
-                        "count": data["count"],
-                        "sum": data["sum"],
-                        "avg": round(avg, 2),
-                        "min": data["min"],
-                        "max": data["max"],
-                        "variance": round(variance, 2),
-                        "std_dev": round(std_dev, 2),
-                        "senior_ratio": round(senior_ratio, 2),
-                        "junior_ratio": round(junior_ratio, 2)
-                    }
-                })
-        
-        return results
-        
-    except Exception as e:
-        print(f"Erreur dans execute_ville_stats: {str(e)}")
-        # Retourner des données de test en cas d'erreur
-        return [{
-            "_id": "Toulouse",
-            "value": {
-                "count": 10,
-                "sum": 85,
-                "avg": 8.5,
-                "min": 1,
-                "max": 15,
-                "variance": 15.25,
-                "std_dev": 3.91,
-                "senior_ratio": 0.6,
-                "junior_ratio": 0.4
+    Le moteur "summary" est servi par ville_stats_summary ; ici il revient
+    à un recalcul complet par agrégation. Les erreurs MongoDB remontent à
+    l'appelant : aucun résultat n'est mis en cache.
+    """
+
+    engine = engine or VILLE_STATS_ENGINE
+    if engine == "python":
+        return execute_ville_stats_python(collection)
+    return execute_ville_stats_aggregate(collection)
+
+
+def format_ville_stats(ville, count, total, minimum, maximum, variance, seniors):
+    """Construire le document résultat d'une ville"""
+    avg = total / count
+    variance = max(variance, 0)
+    std_dev = variance ** 0.5
+    juniors = count - seniors
+
+    return {
+        "_id": ville,
+        "value": {
+            "count": count,
+            "sum": total,
+            "avg": round(avg, 2),
+            "min": minimum,
+            "max": maximum,
+            "variance": round(variance, 2),
+            "std_dev": round(std_dev, 2),
+            "senior_ratio": round(seniors / count, 2),
+            "junior_ratio": round(juniors / count, 2)
+        }
+    }
+
+
+def execute_ville_stats_aggregate(collection):
+    """Statistiques par ville en une seule passe $group côté MongoDB"""
+
+    pipeline = [
+        {"$match": VILLE_STATS_FILTER},
+        VILLE_STATS_GROUP,
+        {"$sort": {"_id": 1}}
+    ]
+
+    return [format_ville_sums(group) for group in collection.aggregate(pipeline)]
+
+
+def format_ville_sums(group):
+    """Dériver les statistiques d'une ville à partir de ses sommes"""
+    count = group["count"]
+    avg = group["sum"] / count
+    variance = group["sumsq"] / count - avg ** 2
+    return format_ville_stats(
+        group["_id"], count, group["sum"], group["min"], group["max"],
+        variance, group["seniors"]
+    )
+
+
+def execute_ville_stats_python(collection):
+    """Statistiques par ville - Version Python simplifiée"""
+
+    # Récupérer tous les employés avec ville et ancienneté
+    employees = list(collection.find(VILLE_STATS_FILTER, {
+        "adresse.ville": 1,
+        "anciennete": 1,
+        "_id": 0
+    }))
+
+    # Dictionnaire pour regrouper par ville
+    ville_data = {}
+
+    # Regrouper les données par ville
+    for emp in employees:
+        ville = emp.get("adresse", {}).get("ville")
+        anciennete = emp.get("anciennete", 0)
+
+        if not ville or not is_seniority(anciennete):
+            continue
+
+        if ville not in ville_data:
+            ville_data[ville] = {
+                "anciennetes": [],
+                "count": 0,
+                "sum": 0,
+                "min": float('inf'),
+                "max": float('-inf')
             }
-        }]
\ No newline at end of file
+
+        ville_data[ville]["anciennetes"].append(anciennete)
+        ville_data[ville]["count"] += 1
+        ville_data[ville]["sum"] += anciennete
+        ville_data[ville]["min"] = min(ville_data[ville]["min"], anciennete)
+        ville_data[ville]["max"] = max(ville_data[ville]["max"], anciennete)
+
+    # Calculer les statistiques
+    results = []
+    for ville, data in ville_data.items():
+        if data["count"] > 0:
+            avg = data["sum"] / data["count"]
+
+            # Calcul de la variance
+            variance_sum = 0
+            for val in data["anciennetes"]:
+                variance_sum += (val - avg) ** 2
+            variance = variance_sum / data["count"]
+
+            # Calcul du nombre de seniors
+            seniors = sum(1 for x in data["anciennetes"] if x > SENIOR_THRESHOLD)
+
+            results.append(format_ville_stats(
+                ville, data["count"], data["sum"], data["min"], data["max"],
+                variance, seniors
+            ))
+
+    return results
@@ -0,0 +1,235 @@
+import datetime
+import os
+import sys
+from map_reduce.ville_stats import (
+    SENIOR_THRESHOLD,
+    VILLE_STATS_FILTER,
+    VILLE_STATS_GROUP,
+    execute_ville_stats_aggregate,
+    format_ville_sums,
+    is_seniority
+)
+from slow_queries import track_operation
+
+# Collection matérialisée : un document par ville avec les sommes courantes
+SUMMARY_COLLECTION = os.getenv("VILLE_STATS_COLLECTION", "ville_stats")
+
+# Marqueur posé par une reconstruction complète : sans lui, le résumé est incomplet
+SUMMARY_META_ID = "__meta__"
+
+# Champs d'un employé qui influencent les statistiques par ville
+SUMMARY_FIELDS = ("adresse", "anciennete")
+
+
+def get_summary_collection(collection):
+    """Collection de résumé associée à la collection des employés"""
+    return collection.database[SUMMARY_COLLECTION]
+
+
+def affects_ville_stats(update_data):
+    """Indiquer si un $set touche la ville ou l'ancienneté"""
+    return any(key.split(".")[0] in SUMMARY_FIELDS for key in update_data)
+
+
+def employee_contribution(employee):
+    """Retourner (ville, anciennete) si l'employé compte dans les statistiques"""
+    if not employee:
+        return None
+    ville = (employee.get("adresse") or {}).get("ville")
+    anciennete = employee.get("anciennete")
+    if not ville or not is_seniority(anciennete):
+        return None
+    return ville, anciennete
+
+
+def _add_contribution(summary, ville, anciennete):
+    """Ajouter un employé aux sommes de sa ville"""
+    summary.update_one(
+        {"_id": ville},
+        {
+            "$inc": {
+                "count": 1,
+                "sum": anciennete,
+                "sumsq": anciennete * anciennete,
+                "seniors": 1 if anciennete > SENIOR_THRESHOLD else 0
+            },
+            "$min": {"min": anciennete},
+            "$max": {"max": anciennete}
+        },
+        upsert=True
+    )
+
+
+def _remove_contribution(summary, ville, anciennete):
+    """Retirer un employé des sommes de sa ville"""
+    # Si la valeur retirée était un extremum, min/max seront recalculés à la lecture
+    summary.update_one(
+        {"_id": ville, "$or": [{"min": {"$gte": anciennete}}, {"max": {"$lte": anciennete}}]},
+        {"$set": {"minmax_stale": True}}
+    )
+    summary.update_one(
+        {"_id": ville},
+        {"$inc": {
+            "count": -1,
+            "sum": -anciennete,
+            "sumsq": -(anciennete * anciennete),
+            "seniors": -1 if anciennete > SENIOR_THRESHOLD else 0
+        }}
+    )
+    summary.delete_one({"_id": ville, "count": {"$lte": 0}})
+
+
+def record_employee_change(collection, before=None, after=None):
+    """Répercuter une écriture (insertion, mise à jour, suppression) sur le résumé"""
+    old = employee_contribution(before)
+    new = employee_contribution(after)
+    if old == new:
+        return
+
+    summary = get_summary_collection(collection)
+    if old:
+        _remove_contribution(summary, *old)
+    if new:
+        _add_contribution(summary, *new)
+
+
+def record_bulk_insert(collection, employees):
+    """Ajouter un lot d'employés au résumé : une mise à jour par ville"""
+    villes = {}
+    for employee in employees:
+        contribution = employee_contribution(employee)
+        if not contribution:
+            continue
+        ville, anciennete = contribution
+        sums = villes.setdefault(ville, {
+            "count": 0, "sum": 0, "sumsq": 0, "seniors": 0,
+            "min": anciennete, "max": anciennete
+        })
+        sums["count"] += 1
+        sums["sum"] += anciennete
+        sums["sumsq"] += anciennete * anciennete
+        sums["seniors"] += 1 if anciennete > SENIOR_THRESHOLD else 0
+        sums["min"] = min(sums["min"], anciennete)
+        sums["max"] = max(sums["max"], anciennete)
+
+    summary = get_summary_collection(collection)
+    for ville, sums in villes.items():
+        summary.update_one(
+            {"_id": ville},
+            {
+                "$inc": {field: sums[field] for field in ("count", "sum", "sumsq", "seniors")},
+                "$min": {"min": sums["min"]},
+                "$max": {"max": sums["max"]}
+            },
+            upsert=True
+        )
+
+
+def _refresh_minmax(collection, summary, ville):
+    """Recalculer min/max d'une ville marquée comme obsolète"""
+    query = dict(VILLE_STATS_FILTER, **{"adresse.ville": ville})
+    projection = {"anciennete": 1, "_id": 0}
+    lowest = list(collection.find(query, projection).sort("anciennete", 1).limit(1))
+    highest = list(collection.find(query, projection).sort("anciennete", -1).limit(1))
+    if not lowest:
+        summary.delete_one({"_id": ville})
+        return None
+
+    minmax = {"min": lowest[0]["anciennete"], "max": highest[0]["anciennete"]}
+    summary.update_one(
+        {"_id": ville},
+        {"$set": minmax, "$unset": {"minmax_stale": ""}}
+    )
+    return minmax
+
+
+@track_operation
+def read_ville_stats_summary(collection):
+    """Statistiques par ville lues depuis le résumé matérialisé (O(#villes))"""
+    summary = get_summary_collection(collection)
+
+    if summary.find_one({"_id": SUMMARY_META_ID}) is None:
+        # Résumé jamais construit : initialisation à partir d'un scan complet
+        rebuild_ville_stats_summary(collection)
+    groups = list(summary.find({"count": {"$gt": 0}}).sort("_id", 1))
+
+    results = []
+    for group in groups:
+        if group.get("minmax_stale"):
+            minmax = _refresh_minmax(collection, summary, group["_id"])
+            if minmax is None:
+                continue
+            group.update(minmax)
+        results.append(format_ville_sums(group))
+
+    return results
+
+
+def rebuild_ville_stats_summary(collection):
+    """Reconstruire entièrement le résumé à partir d'un scan de la collection
+
+    Même filtre que employee_contribution (ancienneté numérique) : le résumé
+    reconstruit et le résumé tenu à jour par les écritures comptent les mêmes employés.
+    """
+    pipeline = [
+        {"$match": VILLE_STATS_FILTER},
+        VILLE_STATS_GROUP,
+        {"$out": SUMMARY_COLLECTION}
+    ]
+    collection.aggregate(pipeline)
+    summary = get_summary_collection(collection)
+    summary.replace_one(
+        {"_id": SUMMARY_META_ID},
+        {"built_at": datetime.datetime.utcnow()},
+        upsert=True
+    )
+    return summary.count_documents({"count": {"$gt": 0}})
+
+
+def check_ville_stats_summary(collection, tolerance=1e-6):
+    """Comparer le résumé à un recalcul complet et lister les écarts"""
+    expected = {stats["_id"]: stats["value"] for stats in execute_ville_stats_aggregate(collection)}
+    actual = {stats["_id"]: stats["value"] for stats in read_ville_stats_summary(collection)}
+
+    mismatches = []
+    for ville in sorted(set(expected) | set(actual)):
+        if ville not in actual or ville not in expected:
+            mismatches.append({
+                "ville": ville,
+                "field": None,
+                "expected": expected.get(ville),
+                "actual": actual.get(ville)
+            })
+            continue
+        for field, value in expected[ville].items():
+            other = actual[ville].get(field)
+            if other is None or abs(value - other) > tolerance:
+                mismatches.append({
+                    "ville": ville,
+                    "field": field,
+                    "expected": value,
+                    "actual": other
+                })
+
+    return {
+        "consistent": not mismatches,
+        "villes": len(expected),
+        "mismatches": mismatches
+    }
+
+
+if __name__ == "__main__":
+    # Usage : python -m map_reduce.ville_stats_summary [rebuild|check]
+    from mongo_utils import MongoDBClient
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    client = MongoDBClient()
+    client.connect()
+    if command == "rebuild":
+        print(f"Résumé reconstruit : {rebuild_ville_stats_summary(client.collection)} villes")
+    else:
+        report = check_ville_stats_summary(client.collection)
+        print(f"Cohérent : {report['consistent']} ({report['villes']} villes)")
+        for mismatch in report["mismatches"]:
+            print(f"  {mismatch}")
+        sys.exit(0 if report["consistent"] else 1)
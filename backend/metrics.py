@@ -0,0 +1,187 @@
+from pymongo import monitoring
+from bson import encode
+from bson.raw_bson import RawBSONDocument
+import bisect
+import contextvars
+import os
+import random
+import threading
+
+# Bornes des histogrammes (secondes et octets)
+LATENCY_BUCKETS = [
+    float(bound) for bound in
+    os.getenv("METRICS_LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(",")
+]
+SIZE_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216]
+
+# Part des réponses MongoDB réencodées pour estimer leur taille (1 = toutes)
+REPLY_SIZE_SAMPLE_RATE = float(os.getenv("METRICS_REPLY_SIZE_SAMPLE_RATE", "0.01"))
+
+# Route Flask en cours, pour attribuer les commandes MongoDB à un endpoint
+current_route = contextvars.ContextVar("current_route", default="none")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class Metric:
+    """Métrique avec étiquettes, valeurs conservées par processus"""
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = sorted(buckets) + [float("inf")]
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket_labels = _format_labels(self.labels + ("le",), labels + (_format_bound(bound),))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                label_text = _format_labels(self.labels, labels)
+                lines.append(f"{self.name}_sum{label_text} {total}")
+                lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Durée des requêtes HTTP par route", ("method", "route", "status")
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Taille des réponses HTTP par route", ("method", "route"), SIZE_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requêtes HTTP en cours par route", ("route",))
+
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "Durée des commandes MongoDB", ("command", "route")
+)
+MONGO_DOCUMENTS_RETURNED = Counter(
+    "mongodb_command_documents_returned_total", "Documents renvoyés par MongoDB", ("command", "route")
+)
+MONGO_REPLY_BYTES = Counter(
+    "mongodb_command_reply_bytes_total", "Taille BSON des réponses de MongoDB (estimée par échantillonnage)",
+    ("command", "route")
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongodb_command_failures_total", "Commandes MongoDB en échec", ("command", "route")
+)
+
+REGISTRY = [
+    REQUEST_LATENCY, RESPONSE_SIZE, REQUESTS_IN_FLIGHT,
+    MONGO_COMMAND_LATENCY, MONGO_DOCUMENTS_RETURNED, MONGO_REPLY_BYTES, MONGO_COMMAND_FAILURES
+]
+
+
+def render_metrics(registry=REGISTRY):
+    """Exposition au format texte de Prometheus"""
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _documents_returned(reply):
+    """Nombre de documents du lot renvoyé (find, aggregate, getMore)"""
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        return len(batch) if batch is not None else 0
+    return 0
+
+
+def _reply_size(reply, sample_rate=None):
+    """Taille de la réponse, ou estimation sans biais par échantillonnage
+
+    Les réponses arrivent déjà décodées : seule une réponse brute donne sa
+    taille gratuitement. Les autres ne sont réencodées en BSON qu'avec la
+    probabilité sample_rate, leur taille étant alors comptée 1 / sample_rate fois.
+    """
+    if isinstance(reply, RawBSONDocument):
+        return len(reply.raw)
+    sample_rate = REPLY_SIZE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if sample_rate <= 0 or random.random() >= sample_rate:
+        return 0
+    try:
+        return round(len(encode(reply)) / min(sample_rate, 1))
+    except Exception:
+        return 0
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Durée, documents et octets (échantillonnés) de chaque commande MongoDB, par route"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        labels = (event.command_name, current_route.get())
+        MONGO_COMMAND_LATENCY.observe(event.duration_micros / 1e6, labels)
+        MONGO_DOCUMENTS_RETURNED.inc(labels, _documents_returned(event.reply))
+        size = _reply_size(event.reply)
+        if size:
+            MONGO_REPLY_BYTES.inc(labels, size)
+
+    def failed(self, event):
+        labels = (event.command_name, current_route.get())
+        MONGO_COMMAND_LATENCY.observe(event.duration_micros / 1e6, labels)
+        MONGO_COMMAND_FAILURES.inc(labels)
@@ -1,110 +1,532 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel, UpdateOne, ReturnDocument, ASCENDING, DESCENDING
+from pymongo import read_preferences
+from bson import ObjectId
+from slow_queries import track_operation
+import base64
+import datetime
+import importlib.util
+import json
 import os
+import re
+import threading
+import time
+import unicodedata
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Taille des lots lus depuis le serveur pour les réponses en streaming
+STREAM_BATCH_SIZE = int(os.getenv("MONGO_STREAM_BATCH_SIZE", 1000))
+
+# Index créés au démarrage (create_indexes est idempotent pour une même définition)
+ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() in ["true", "1", "yes"]
+INDEX_SPECS = [
+    # find_by_city_and_name, group_by_city, statistiques par ville
+    {"keys": [("adresse.ville", ASCENDING), ("prenom_norm", ASCENDING)], "name": "ville_prenom_norm"},
+    # Recherche de prénom par préfixe et par suffixe (plages d'index)
+    {"keys": [("prenom_norm", ASCENDING)], "name": "prenom_norm"},
+    {"keys": [("prenom_rev", ASCENDING)], "name": "prenom_rev"},
+    # find_name_length : égalité sur la longueur puis plage sur le préfixe
+    {"keys": [("prenom_len", ASCENDING), ("prenom_norm", ASCENDING)], "name": "prenom_len_norm"},
+    # Recherche par nom : préfixe des motifs trop courts pour les trigrammes
+    {"keys": [("nom_norm", ASCENDING)], "name": "nom_norm"},
+    # find_by_seniority et tri de get_oldest_employees
+    {"keys": [("anciennete", DESCENDING)], "name": "anciennete_desc"},
+    # find_with_street_address ($exists)
+    {"keys": [("adresse.rue", ASCENDING)], "name": "rue_sparse", "sparse": True},
+    # Flux des modifications (/api/employees/changes)
+    {"keys": [("_seq", ASCENDING), ("_id", ASCENDING)], "name": "change_seq", "sparse": True},
+    # Relecture des écritures récentes du flux (fenêtre de latence)
+    {"keys": [("updated_at", ASCENDING)], "name": "updated_at", "sparse": True},
+    # Détection des doublons nom + prénom (clé stockée)
+    {"keys": [("cle_unique", ASCENDING)], "name": "cle_unique"},
+]
+
+# Champs calculés ou techniques posés à l'écriture, masqués dans les réponses par défaut
+# (_job : dernier travail de fond appliqué, voir jobs.py)
+DERIVED_FIELDS = ("prenom_norm", "prenom_rev", "prenom_len", "nom_norm", "cle_unique", "_seq", "_job")
+
+# Clés de tri des employés d'une ville (champ, sens), _id départage les égalités
+CITY_SORT_KEYS = {
+    "prenom": ("prenom_norm", ASCENDING),
+    "nom": ("nom", ASCENDING),
+    "anciennete": ("anciennete", DESCENDING),
+    "prime": ("prime", DESCENDING),
+    "_id": ("_id", ASCENDING)
+}
+
+# Politique des doublons nom + prénom à l'insertion (toutes les routes d'écriture) :
+# "allow" insère quand même, "reject" refuse (409 ou erreur de ligne)
+DUPLICATE_POLICIES = ("allow", "reject")
+DUPLICATE_POLICY = os.getenv("DUPLICATE_POLICY", "allow")
+DUPLICATE_ERROR = "Duplicate employee: same nom and prenom already exist"
+
+# Compteurs de séquence des modifications, un document par collection
+COUNTERS_COLLECTION = os.getenv("COUNTERS_COLLECTION", "counters")
+
+# Pool de connexions (un client par processus worker)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+# Compression réseau, par ordre de préférence (seules les bibliothèques installées sont gardées)
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+# Lectures analytiques non mises en cache envoyées aux secondaires quand il y en a
+# (retard borné : 90 s est le minimum accepté par MongoDB). Les recalculs mis en
+# cache sous la version courante lisent le primaire.
+ANALYTICS_READ_PREFERENCE = os.getenv("MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred")
+ANALYTICS_MAX_STALENESS_SECONDS = int(os.getenv("MONGO_ANALYTICS_MAX_STALENESS_SECONDS", 90))
+READ_PREFERENCES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest
+}
+
+def normalize_name(value):
+    """Normaliser un nom : sans accents, en minuscules, sans espaces de bord"""
+    decomposed = unicodedata.normalize("NFKD", str(value or ""))
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return folded.casefold().strip()
+
+def duplicate_key(employee):
+    """Clé de doublon nom_prenom en minuscules (None si l'un des deux manque)"""
+    nom = employee.get("nom")
+    prenom = employee.get("prenom")
+    if nom is None or prenom is None:
+        return None
+    return f"{str(nom).lower()}_{str(prenom).lower()}"
+
+def existing_duplicate_keys(collection, keys):
+    """Clés de doublon déjà présentes dans la collection (requête couverte par l'index)"""
+    keys = [key for key in set(keys) if key is not None]
+    if not keys:
+        return set()
+    cursor = collection.find({"cle_unique": {"$in": keys}}, {"_id": 0, "cle_unique": 1})
+    return {employee["cle_unique"] for employee in cursor}
+
+def derived_fields(employee):
+    """Champs de recherche et clé de doublon calculés à partir du nom et du prénom"""
+    fields = {}
+    if "prenom" in employee:
+        prenom = str(employee.get("prenom") or "")
+        prenom_norm = normalize_name(prenom)
+        fields.update({
+            "prenom_norm": prenom_norm,
+            "prenom_rev": prenom_norm[::-1],
+            "prenom_len": len(prenom)
+        })
+    if "nom" in employee:
+        fields["nom_norm"] = normalize_name(employee.get("nom"))
+    cle_unique = duplicate_key(employee)
+    if cle_unique is not None:
+        fields["cle_unique"] = cle_unique
+    return fields
+
+def change_stamp(collection):
+    """Numéro de séquence et date à poser sur chaque document écrit"""
+    counter = collection.database[COUNTERS_COLLECTION].find_one_and_update(
+        {"_id": collection.name},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return {"_seq": counter["seq"], "updated_at": datetime.datetime.utcnow()}
+
+def encode_sort_cursor(value, document_id):
+    """Curseur opaque (valeur de tri, _id) de la page suivante"""
+    raw = json.dumps([value, str(document_id)], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_sort_cursor(token):
+    """Valeur de tri et ObjectId d'un curseur (ValueError si invalide)"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        value, document_id = json.loads(raw)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid 'after' cursor")
+    if not ObjectId.is_valid(document_id):
+        raise ValueError("Invalid 'after' cursor")
+    return value, ObjectId(document_id)
+
+def keyset_filter(field, direction, value, last_id):
+    """Documents qui suivent (value, last_id) dans le tri {field: direction, _id: 1}
+
+    MongoDB trie null et les champs absents avant toute valeur, alors que
+    {field: {"$gt": ...}} ne les sélectionne jamais : ils sont donc traités à part
+    (en tête en ordre croissant, en fin en ordre décroissant).
+    """
+    same_value = {field: value, "_id": {"$gt": last_id}}
+    if value is None:
+        if direction == ASCENDING:
+            return {"$or": [same_value, {field: {"$ne": None}}]}
+        return same_value
+    operator = "$gt" if direction == ASCENDING else "$lt"
+    branches = [{field: {operator: value}}, same_value]
+    if direction != ASCENDING:
+        branches.append({field: None})
+    return {"$or": branches}
+
+def prefix_range(prefix):
+    """Bornes [prefix, successeur) couvrant toutes les chaînes qui commencent par prefix"""
+    if not prefix:
+        return {"$type": "string"}
+    successor = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return {"$gte": prefix, "$lt": successor}
+
+def available_compressors(names=MONGO_COMPRESSORS):
+    """Compresseurs demandés dont la bibliothèque est installée"""
+    compressors = []
+    for name in (name.strip() for name in names.split(",")):
+        module = COMPRESSOR_MODULES.get(name)
+        if module and importlib.util.find_spec(module) is not None:
+            compressors.append(name)
+    return compressors
+
+def client_options():
+    """Options du MongoClient lues depuis l'environnement"""
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS
+    }
+    if MONGO_WAIT_QUEUE_TIMEOUT_MS:
+        options["waitQueueTimeoutMS"] = int(MONGO_WAIT_QUEUE_TIMEOUT_MS)
+    compressors = available_compressors()
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+def analytics_read_preference():
+    """Préférence de lecture des agrégations analytiques"""
+    mode = READ_PREFERENCES.get(ANALYTICS_READ_PREFERENCE, read_preferences.SecondaryPreferred)
+    if mode is read_preferences.Primary:
+        return mode()
+    return mode(max_staleness=ANALYTICS_MAX_STALENESS_SECONDS)
+
+class MongoConnectionManager:
+    """Client MongoDB créé à la première utilisation, un par processus
+
+    Un MongoClient n'est pas utilisable après un fork (gunicorn --preload) :
+    si le pid a changé, un nouveau client est créé et l'ancien abandonné.
+    on_connect(collection) est appelé une fois par client créé.
+    """
+
+    def __init__(self, uri, db_name, collection_name, client_class=MongoClient, options=None, on_connect=None):
+        self.uri = uri
+        self.db_name = db_name
+        self.collection_name = collection_name
+        self.client_class = client_class
+        self.options = client_options() if options is None else options
+        self.on_connect = on_connect
+        self.lock = threading.Lock()
+        self.pid = None
+        self.handles = (None, None, None)
+
+    @property
+    def connected(self):
+        return self.pid == os.getpid()
+
+    def get(self):
+        """(client, base, collection) du processus courant"""
+        if self.pid != os.getpid():
+            created = False
+            with self.lock:
+                if self.pid != os.getpid():
+                    client = self.client_class(self.uri, **self.options)
+                    db = client[self.db_name]
+                    self.handles = (client, db, db[self.collection_name])
+                    self.pid = os.getpid()
+                    created = True
+            # Hors du verrou : on_connect peut relire les handles
+            if created and self.on_connect:
+                self.on_connect(self.handles[2])
+        return self.handles
+
+    def reset(self):
+        """Fermer le client du processus courant (recréé au prochain accès)"""
+        with self.lock:
+            if self.connected and self.handles[0] is not None:
+                self.handles[0].close()
+            self.pid = None
+            self.handles = (None, None, None)
+
 class MongoDBClient:
+    client_class = MongoClient
+
     def __init__(self):
         self.uri = os.getenv("MONGODB_URI")
         self.db_name = os.getenv("DATABASE_NAME")
         self.collection_name = os.getenv("COLLECTION_NAME")
-        self.client = None
-        self.db = None
-        self.collection = None
+        # Index créés par chaque processus à la création de son client
+        self.setup_hooks = []
+        self.connections = MongoConnectionManager(
+            self.uri, self.db_name, self.collection_name, self.client_class,
+            on_connect=self.setup
+        )
+    
+    def setup(self, collection):
+        """Index de INDEX_SPECS et des setup_hooks (si MONGO_ENSURE_INDEXES)"""
+        if not ENSURE_INDEXES:
+            return
+        self.ensure_indexes()
+        for hook in self.setup_hooks:
+            try:
+                hook(collection)
+            except Exception as e:
+                print(f"Index creation error: {e}")
+    
+    @property
+    def client(self):
+        return self.connections.get()[0]
+    
+    @property
+    def db(self):
+        return self.connections.get()[1]
+    
+    @property
+    def collection(self):
+        return self.connections.get()[2]
+    
+    @property
+    def analytics_collection(self):
+        """Collection lue sur un secondaire si disponible (agrégations non mises en cache)"""
+        return self.collection.with_options(read_preference=analytics_read_preference())
         
     def connect(self):
-        """Établir la connexion à MongoDB"""
+        """Établir la connexion à MongoDB (client propre au processus courant)"""
         try:
-            self.client = MongoClient(self.uri)
-            self.db = self.client[self.db_name]
-            self.collection = self.db[self.collection_name]
+            self.connections.get()
             print(f"Connected to MongoDB: {self.db_name}.{self.collection_name}")
             return True
         except Exception as e:
             print(f"Connection error: {e}")
             return False
     
+    def ping(self):
+        """Durée d'un aller-retour vers le serveur en millisecondes (exception si injoignable)"""
+        started_at = time.perf_counter()
+        self.client.admin.command("ping")
+        return round((time.perf_counter() - started_at) * 1000, 2)
+    
+    def ensure_indexes(self):
+        """Créer les index déclarés dans INDEX_SPECS s'ils n'existent pas"""
+        models = [
+            IndexModel(spec["keys"], **{k: v for k, v in spec.items() if k != "keys"})
+            for spec in INDEX_SPECS
+        ]
+        try:
+            names = self.collection.create_indexes(models)
+            print(f"Indexes ensured: {', '.join(names)}")
+            return names
+        except Exception as e:
+            print(f"Index creation error: {e}")
+            return []
+    
+    def get_index_stats(self):
+        """Statistiques d'utilisation des index ($indexStats)"""
+        return list(self.collection.aggregate([{"$indexStats": {}}]))
+    
+    @track_operation
+    def backfill_derived_fields(self, batch_size=1000):
+        """Migration : calculer les champs dérivés des documents existants"""
+        updated = 0
+        operations = []
+        cursor = self.collection.find({}, {"nom": 1, "prenom": 1}).batch_size(batch_size)
+        for employee in cursor:
+            fields = derived_fields(employee)
+            if fields:
+                operations.append(UpdateOne({"_id": employee["_id"]}, {"$set": fields}))
+            if len(operations) >= batch_size:
+                updated += self.collection.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            updated += self.collection.bulk_write(operations, ordered=False).modified_count
+        return updated
+    
     def get_collections(self):
         """Afficher toutes les collections de la base"""
         return list(self.db.list_collection_names())
     
-    def get_all_documents(self):
+    def _find_page(self, query, after=None, limit=None, fields=None, stream=False):
+        """Exécuter une requête paginée par _id (keyset) avec projection optionnelle
+        
+        Avec stream=True, retourne le curseur pymongo au lieu d'une liste.
+        """
+        if after is not None:
+            query = dict(query)
+            query["_id"] = {"$gt": ObjectId(after)}
+        if fields:
+            projection = {field: 1 for field in fields}
+        else:
+            projection = {field: 0 for field in DERIVED_FIELDS}
+        cursor = self.collection.find(query, projection)
+        if after is not None or limit:
+            # Tri sur _id pour que le curseur "after" soit stable
+            cursor = cursor.sort("_id", 1)
+        if limit:
+            cursor = cursor.limit(limit)
+        if stream:
+            return cursor.batch_size(STREAM_BATCH_SIZE)
+        return list(cursor)
+    
+    @track_operation
+    def get_all_documents(self, after=None, limit=None, fields=None, stream=False):
         """Afficher tous les documents de la base"""
-        return list(self.collection.find({}))
+        return self._find_page({}, after, limit, fields, stream)
     
+    @track_operation
     def count_documents(self):
         """Compter le nombre de documents"""
         return self.collection.count_documents({})
     
+    @track_operation
     def insert_employee(self, employee_data):
         """Insérer un employé"""
+        employee_data.update(derived_fields(employee_data))
+        employee_data.update(change_stamp(self.collection))
         result = self.collection.insert_one(employee_data)
         return result.inserted_id
     
-    def find_by_name_pattern(self, pattern, position="start"):
-        """Trouver les employés par pattern de prénom"""
+    @track_operation
+    def find_duplicate(self, employee_data):
+        """Vérification rapide (index cle_unique) d'un doublon existant"""
+        cle_unique = duplicate_key(employee_data)
+        if cle_unique is None:
+            return None
+        return self.collection.find_one({"cle_unique": cle_unique}, {"_id": 1})
+    
+    @track_operation
+    def find_by_name_pattern(self, pattern, position="start", after=None, limit=None, fields=None, stream=False):
+        """Trouver les employés par pattern de prénom (sans accents ni casse)"""
+        normalized = normalize_name(pattern)
         if position == "start":
-            regex_pattern = f"^{pattern}"
+            query = {"prenom_norm": prefix_range(normalized)}
         elif position == "end":
-            regex_pattern = f"{pattern}$"
+            # Suffixe = préfixe du prénom inversé
+            query = {"prenom_rev": prefix_range(normalized[::-1])}
         else:  # any position
-            regex_pattern = f".*{pattern}.*"
+            query = {"prenom_norm": {"$regex": re.escape(normalized)}}
         
-        query = {"prenom": {"$regex": regex_pattern, "$options": "i"}}
-        return list(self.collection.find(query))
+        return self._find_page(query, after, limit, fields, stream)
     
-    def find_name_length(self, pattern, length):
+    @track_operation
+    def find_name_length(self, pattern, length, after=None, limit=None, fields=None, stream=False):
         """Trouver les prénoms avec pattern et longueur spécifique"""
         query = {
-            "prenom": {
-                "$regex": f"^{pattern}",
-                "$options": "i",
-                "$exists": True
-            }
+            "prenom_len": length,
+            "prenom_norm": prefix_range(normalize_name(pattern))
         }
-        
-        results = list(self.collection.find(query))
-        # Filtrage supplémentaire pour la longueur
-        filtered = [emp for emp in results if len(emp.get('prenom', '')) == length]
-        return filtered
+        return self._find_page(query, after, limit, fields, stream)
     
-    def find_by_seniority(self, years):
+    @track_operation
+    def find_by_seniority(self, years, after=None, limit=None, fields=None, stream=False):
         """Trouver les employés avec ancienneté > années"""
-        return list(self.collection.find({"anciennete": {"$gt": years}}))
+        return self._find_page({"anciennete": {"$gt": years}}, after, limit, fields, stream)
     
-    def find_with_street_address(self):
+    @track_operation
+    def find_with_street_address(self, after=None, limit=None, fields=None, stream=False):
         """Trouver les employés avec attribut rue dans l'adresse"""
-        return list(self.collection.find({"adresse.rue": {"$exists": True}}))
+        return self._find_page({"adresse.rue": {"$exists": True}}, after, limit, fields, stream)
     
+    @track_operation
     def increment_prime(self, amount):
         """Incrémenter la prime des employés"""
         result = self.collection.update_many(
             {"prime": {"$exists": True}},
-            {"$inc": {"prime": amount}}
+            {"$inc": {"prime": amount}, "$set": change_stamp(self.collection)}
         )
         return result.modified_count
     
+    @track_operation
     def get_oldest_employees(self, limit=10):
         """Obtenir les employés les plus anciens"""
-        return list(self.collection.find().sort("anciennete", -1).limit(limit))
+        projection = {field: 0 for field in DERIVED_FIELDS}
+        return list(self.collection.find({}, projection).sort("anciennete", -1).limit(limit))
     
-    def group_by_city(self, city):
-        """Regrouper par ville"""
+    @track_operation
+    def group_by_city(self, city, sort="prenom", after=None, limit=100, fields=None):
+        """Regrouper par ville : effectif, statistiques et une page d'employés triés
+        
+        Un seul $facet sur le $match de la ville (index ville_prenom_norm) : le résumé
+        est un $group sans tableau et la page un tri top-k borné par limit, la mémoire
+        et la taille de la réponse ne dépendent donc pas de la taille de la ville.
+        """
+        field, direction = CITY_SORT_KEYS[sort]
+        page = []
+        if after is not None:
+            value, last_id = decode_sort_cursor(after)
+            if field == "_id":
+                page.append({"$match": {"_id": {"$gt": last_id}}})
+            else:
+                page.append({"$match": keyset_filter(field, direction, value, last_id)})
+        sort_spec = {field: direction}
+        if field != "_id":
+            sort_spec["_id"] = ASCENDING
+        if fields:
+            projection = {name: 1 for name in set(fields) | {field}}
+        else:
+            projection = {name: 0 for name in DERIVED_FIELDS if name != field}
+        page += [{"$sort": sort_spec}, {"$limit": limit}, {"$project": projection}]
+        
         pipeline = [
             {"$match": {"adresse.ville": city}},
-            {"$group": {
-                "_id": "$adresse.ville",
-                "count": {"$sum": 1},
-                "employees": {"$push": "$$ROOT"}
+            {"$facet": {
+                "summary": [{"$group": {
+                    "_id": None,
+                    "count": {"$sum": 1},
+                    "anciennete_moyenne": {"$avg": "$anciennete"},
+                    "anciennete_max": {"$max": "$anciennete"},
+                    "prime_totale": {"$sum": "$prime"},
+                    "prime_moyenne": {"$avg": "$prime"},
+                    "avec_rue": {"$sum": {"$cond": [{"$ifNull": ["$adresse.rue", False]}, 1, 0]}}
+                }}],
+                "employees": page
             }}
         ]
-        return list(self.collection.aggregate(pipeline))
+        result = next(self.collection.aggregate(pipeline), {"summary": [], "employees": []})
+        
+        employees = result["employees"]
+        next_cursor = None
+        if len(employees) == limit:
+            last = employees[-1]
+            value = None if field == "_id" else last.get(field)
+            next_cursor = encode_sort_cursor(value, last["_id"])
+        if field in DERIVED_FIELDS and not (fields and field in fields):
+            for employee in employees:
+                employee.pop(field, None)
+        
+        summary = result["summary"][0] if result["summary"] else {"count": 0}
+        summary.pop("_id", None)
+        for key in ("anciennete_moyenne", "prime_moyenne"):
+            if summary.get(key) is not None:
+                summary[key] = round(summary[key], 2)
+        return {
+            "city": city,
+            "count": summary.pop("count"),
+            "stats": summary,
+            "sort": sort,
+            "employees": employees,
+            "next": next_cursor
+        }
     
-    def find_by_city_and_name(self, name_pattern, cities):
+    @track_operation
+    def find_by_city_and_name(self, name_pattern, cities, after=None, limit=None, fields=None, stream=False):
         """Trouver par prénom et ville"""
         query = {
-            "prenom": {"$regex": f"^{name_pattern}", "$options": "i"},
-            "adresse.ville": {"$in": cities}
+            "adresse.ville": {"$in": cities},
+            "prenom_norm": prefix_range(normalize_name(name_pattern))
         }
-        return list(self.collection.find(query))
\ No newline at end of file
+        return self._find_page(query, after, limit, fields, stream)
+
+if __name__ == "__main__":
+    # Usage : python mongo_utils.py backfill
+    import sys
+    
+    client = MongoDBClient()
+    client.connect()
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        print(f"Derived fields updated: {client.backfill_derived_fields()}")
@@ -0,0 +1,215 @@
+from pymongo import ASCENDING, IndexModel
+from mongo_utils import DERIVED_FIELDS, normalize_name, prefix_range
+from slow_queries import track_operation
+import datetime
+import heapq
+import os
+import re
+
+# Index inversé des trigrammes de nom/prénom : un document par (trigramme, employé)
+NAME_INDEX_COLLECTION = os.getenv("NAME_INDEX_COLLECTION", "name_trigrams")
+
+# Nombre de candidats intersectés et vérifiés par aller-retour
+SEARCH_BATCH_SIZE = int(os.getenv("SEARCH_BATCH_SIZE", 1000))
+# Taille au-delà de laquelle une liste de postings n'est plus comptée
+SEARCH_RARITY_CAP = int(os.getenv("SEARCH_RARITY_CAP", 10000))
+
+# Champs dont dépend l'index
+NAME_FIELDS = ("nom", "prenom")
+
+GRAM_SIZE = 3
+
+# Marqueur posé par une reconstruction complète : sans lui, l'index ne contient
+# que les employés écrits depuis le déploiement et la recherche passe par un scan
+NAME_INDEX_META_ID = "__meta__"
+
+
+def get_name_index(collection):
+    """Collection de l'index des trigrammes associée aux employés"""
+    return collection.database[NAME_INDEX_COLLECTION]
+
+
+def ensure_name_index(collection):
+    """Créer les index de la collection des trigrammes"""
+    return get_name_index(collection).create_indexes([
+        IndexModel([("g", ASCENDING), ("e", ASCENDING)], name="gram_employee", unique=True),
+        IndexModel([("e", ASCENDING)], name="employee")
+    ])
+
+
+def trigrams(text):
+    """Ensemble des trigrammes d'un texte normalisé"""
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def employee_trigrams(employee):
+    """Trigrammes du nom et du prénom d'un employé"""
+    grams = set()
+    for field in NAME_FIELDS:
+        grams |= trigrams(normalize_name(employee.get(field)))
+    return grams
+
+
+def index_employee(collection, employee):
+    """Indexer (ou réindexer) les trigrammes d'un employé"""
+    name_index = get_name_index(collection)
+    name_index.delete_many({"e": employee["_id"]})
+    postings = [{"g": gram, "e": employee["_id"]} for gram in employee_trigrams(employee)]
+    if postings:
+        name_index.insert_many(postings, ordered=False)
+
+
+def index_employees(collection, employees):
+    """Indexer un lot de nouveaux employés en un seul insert_many"""
+    postings = [
+        {"g": gram, "e": employee["_id"]}
+        for employee in employees
+        for gram in employee_trigrams(employee)
+    ]
+    if postings:
+        get_name_index(collection).insert_many(postings, ordered=False)
+
+
+def unindex_employee(collection, employee_id):
+    """Retirer un employé de l'index"""
+    get_name_index(collection).delete_many({"e": employee_id})
+
+
+def rebuild_name_index(collection, batch_size=1000, create_indexes=True):
+    """Reconstruire entièrement l'index des trigrammes
+
+    create_indexes=False laisse la collection des trigrammes sans index
+    (benchmarks sur mongomock, qui vérifie l'index unique à chaque insertion).
+    """
+    name_index = get_name_index(collection)
+    name_index.drop()
+    if create_indexes:
+        ensure_name_index(collection)
+
+    indexed = 0
+    postings = []
+    for employee in collection.find({}, {"nom": 1, "prenom": 1}).batch_size(batch_size):
+        postings.extend({"g": gram, "e": employee["_id"]} for gram in employee_trigrams(employee))
+        indexed += 1
+        if len(postings) >= batch_size * 10:
+            name_index.insert_many(postings, ordered=False)
+            postings = []
+    if postings:
+        name_index.insert_many(postings, ordered=False)
+    name_index.replace_one(
+        {"_id": NAME_INDEX_META_ID},
+        {"built_at": datetime.datetime.utcnow(), "indexed": indexed},
+        upsert=True
+    )
+    return indexed
+
+
+def name_index_built(collection):
+    """Indiquer si l'index a été construit par rebuild_name_index"""
+    return get_name_index(collection).find_one({"_id": NAME_INDEX_META_ID}, {"_id": 1}) is not None
+
+
+def _match_rank(pattern, employee):
+    """Score de pertinence : égalité > préfixe > sous-chaîne (None si pas de match)"""
+    best = None
+    for field in NAME_FIELDS:
+        value = normalize_name(employee.get(field))
+        if value == pattern:
+            rank = 0
+        elif value.startswith(pattern):
+            rank = 1
+        elif pattern in value:
+            rank = 2
+        else:
+            continue
+        best = rank if best is None else min(best, rank)
+    return best
+
+
+def _rarest_first(collection, grams):
+    """Trigrammes triés par taille de liste de postings croissante
+
+    Le comptage s'arrête à SEARCH_RARITY_CAP : au-delà, l'ordre importe peu.
+    """
+    name_index = get_name_index(collection)
+    return sorted(grams, key=lambda gram: (
+        name_index.count_documents({"g": gram}, limit=SEARCH_RARITY_CAP), gram
+    ))
+
+
+def _candidate_batches(collection, grams):
+    """Lots d'employés contenant tous les trigrammes
+
+    Parcourt la liste du trigramme le plus rare, puis ne garde de chaque lot
+    que les employés présents dans les listes suivantes (index gram_employee).
+    """
+    name_index = get_name_index(collection)
+    rarest, *others = _rarest_first(collection, grams)
+
+    def intersect(batch):
+        for gram in others:
+            if not batch:
+                break
+            batch = [posting["e"] for posting in name_index.find(
+                {"g": gram, "e": {"$in": batch}}, {"_id": 0, "e": 1}
+            )]
+        return batch
+
+    batch = []
+    for posting in name_index.find({"g": rarest}, {"_id": 0, "e": 1}).batch_size(SEARCH_BATCH_SIZE):
+        batch.append(posting["e"])
+        if len(batch) >= SEARCH_BATCH_SIZE:
+            yield intersect(batch)
+            batch = []
+    if batch:
+        yield intersect(batch)
+
+
+def _verify(normalized, candidates):
+    """(rang, clé de tri, employé) des candidats qui contiennent vraiment le motif"""
+    for employee in candidates:
+        rank = _match_rank(normalized, employee)
+        if rank is not None:
+            yield (rank, len(employee.get("prenom") or ""), str(employee["_id"])), employee
+
+
+@track_operation
+def search_names(collection, pattern, limit=None, fields=None):
+    """Recherche de sous-chaîne dans le nom ou le prénom, résultats classés
+
+    Tous les candidats sont vérifiés avant le classement : la limite ne
+    s'applique qu'aux résultats classés (les meilleurs gardés dans un tas).
+    Un motif de moins de GRAM_SIZE caractères (premières frappes) ne cherche
+    que les préfixes, par plages sur les index prenom_norm et nom_norm.
+    """
+    normalized = normalize_name(pattern)
+    grams = trigrams(normalized)
+
+    if fields:
+        # nom et prénom restent nécessaires au classement
+        projection = {field: 1 for field in set(fields) | set(NAME_FIELDS)}
+    else:
+        projection = {field: 0 for field in DERIVED_FIELDS}
+
+    if grams and name_index_built(collection):
+        def candidates():
+            for batch in _candidate_batches(collection, grams):
+                if batch:
+                    yield from collection.find({"_id": {"$in": batch}}, projection)
+    else:
+        if grams:
+            # Index pas encore construit : scan des champs normalisés, motif échappé
+            escaped = re.escape(normalized)
+            query = {"$or": [{field: {"$regex": escaped}} for field in ("prenom_norm", "nom_norm")]}
+        else:
+            query = {"$or": [{field: prefix_range(normalized)} for field in ("prenom_norm", "nom_norm")]}
+
+        def candidates():
+            return collection.find(query, projection).batch_size(SEARCH_BATCH_SIZE)
+
+    matches = _verify(normalized, candidates())
+    if limit:
+        ranked = heapq.nsmallest(limit, matches, key=lambda match: match[0])
+    else:
+        ranked = sorted(matches, key=lambda match: match[0])
+    return [employee for _, employee in ranked]
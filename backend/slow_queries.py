@@ -0,0 +1,170 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import monitoring
+import contextvars
+import datetime
+import functools
+import os
+import random
+import threading
+
+# Seuil (ms) au-delà duquel une commande est enregistrée, taille du tampon circulaire
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+SLOW_QUERY_BUFFER = int(os.getenv("SLOW_QUERY_BUFFER", 200))
+# Proportion des requêtes lentes pour lesquelles explain("executionStats") est lancé
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", 0.2))
+
+# Commandes dont on garde les paramètres et qui peuvent être expliquées
+EXPLAINABLE_COMMANDS = ("find", "aggregate", "count", "distinct", "findAndModify", "update", "delete")
+COMMAND_FIELDS = (
+    "filter", "query", "pipeline", "sort", "projection", "limit", "skip", "key", "hint",
+    "update", "updates", "deletes", "cursor", "allowDiskUse", "collation"
+)
+
+# Méthode de MongoDBClient ou calcul map_reduce en cours
+current_operation = contextvars.ContextVar("current_operation", default=None)
+
+
+def track_operation(function):
+    """Décorateur : attribuer les commandes MongoDB exécutées à cette fonction"""
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = current_operation.set(name)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            current_operation.reset(token)
+    return wrapper
+
+
+def _plan_summary(plan):
+    """Chaîne des étapes du plan gagnant, ex. FETCH > IXSCAN(prenom_norm)"""
+    stages = []
+    while isinstance(plan, dict):
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0] or plan.get("queryPlan")
+    return " > ".join(stages)
+
+
+def _find_key(document, key):
+    """Première valeur de key dans un résultat d'explain (agrégations imbriquées)"""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        values = document.values()
+    elif isinstance(document, list):
+        values = document
+    else:
+        return None
+    for value in values:
+        found = _find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+
+def explain_summary(explain):
+    """Documents et clés examinés, documents renvoyés et plan retenu"""
+    stats = _find_key(explain, "executionStats") or {}
+    return {
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "n_returned": stats.get("nReturned"),
+        "execution_ms": stats.get("executionTimeMillis"),
+        "plan": _plan_summary(_find_key(explain, "winningPlan"))
+    }
+
+
+class SlowQueryRecorder(monitoring.CommandListener):
+    """Enregistrer les commandes lentes dans un tampon circulaire
+
+    get_client retourne le MongoClient du processus, utilisé pour lancer
+    explain en arrière-plan sur un échantillon des commandes lentes.
+    """
+
+    def __init__(self, get_client, threshold_ms=SLOW_QUERY_MS, size=SLOW_QUERY_BUFFER,
+                 explain_rate=SLOW_QUERY_EXPLAIN_RATE, get_route=None):
+        self.get_client = get_client
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.get_route = get_route
+        self.entries = deque(maxlen=size)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = None
+        self.executor_pid = None
+
+    def started(self, event):
+        if event.command_name not in EXPLAINABLE_COMMANDS:
+            return
+        fields = {field: event.command[field] for field in COMMAND_FIELDS if field in event.command}
+        self.pending[(event.connection_id, event.request_id)] = (
+            event.command.get(event.command_name), fields, current_operation.get(),
+            self.get_route() if self.get_route else None
+        )
+
+    def succeeded(self, event):
+        started = self.pending.pop((event.connection_id, event.request_id), None)
+        if started is None or event.duration_micros / 1000 < self.threshold_ms:
+            return
+        cursor = event.reply.get("cursor")
+        returned = len(cursor.get("firstBatch", [])) if isinstance(cursor, dict) else None
+        self._record(event, started, returned)
+
+    def failed(self, event):
+        self.pending.pop((event.connection_id, event.request_id), None)
+
+    def _record(self, event, started, returned):
+        collection, fields, operation, route = started
+        entry = {
+            "at": datetime.datetime.utcnow(),
+            "command": event.command_name,
+            "database": event.database_name,
+            "collection": collection,
+            "operation": operation,
+            "route": route,
+            "duration_ms": round(event.duration_micros / 1000, 2),
+            "docs_returned": returned,
+            "parameters": fields,
+            "explain": None
+        }
+        with self.lock:
+            self.entries.append(entry)
+        pipeline = fields.get("pipeline") or []
+        writes = any("$out" in stage or "$merge" in stage for stage in pipeline if isinstance(stage, dict))
+        if not writes and random.random() < self.explain_rate:
+            self._get_executor().submit(self._explain, entry)
+
+    def _get_executor(self):
+        # Un thread d'explain par processus (recréé après un fork)
+        if self.executor_pid != os.getpid():
+            self.executor = ThreadPoolExecutor(max_workers=1)
+            self.executor_pid = os.getpid()
+        return self.executor
+
+    def _explain(self, entry):
+        """explain("executionStats") de la commande, rattaché à l'entrée"""
+        command = {entry["command"]: entry["collection"]}
+        command.update(entry["parameters"])
+        try:
+            explain = self.get_client()[entry["database"]].command(
+                {"explain": command, "verbosity": "executionStats"}
+            )
+            entry["explain"] = explain_summary(explain)
+        except Exception as e:
+            entry["explain"] = {"error": str(e)}
+
+    def get_entries(self, limit=None):
+        """Entrées les plus récentes d'abord"""
+        with self.lock:
+            entries = list(reversed(self.entries))
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
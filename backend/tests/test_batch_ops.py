@@ -0,0 +1,37 @@
+from batch_ops import execute_batch
+from mongo_utils import derived_fields
+
+
+def insert(collection, nom, prenom):
+    employee = {"nom": nom, "prenom": prenom, "prime": 100}
+    employee.update(derived_fields(employee))
+    return collection.insert_one(employee).inserted_id
+
+
+def test_report_has_one_result_per_operation(collection):
+    martin = insert(collection, "Martin", "Paul")
+    durand = insert(collection, "Durand", "Anne")
+    missing = "0123456789ab0123456789ab"
+
+    # Upsert en tête : mongomock renvoie toujours l'index 0 pour les upserts
+    report = execute_batch(collection, [
+        {"op": "upsert", "data": {"nom": "Petit", "prenom": "Luc"}},
+        {"op": "update", "id": str(martin), "data": {"prime": 150}},
+        {"op": "delete", "id": str(durand)},
+        {"op": "update", "id": missing, "data": {"prime": 1}},
+        {"op": "rename", "id": str(martin)},
+        {"op": "delete", "id": missing},
+    ])
+
+    results = [(result["index"], result["op"], result["matched"], result["modified"],
+                result["deleted"], result["upserted_id"] is not None, "error" in result)
+               for result in report["results"]]
+    assert results == [
+        (0, "upsert", 0, 0, 0, True, False),
+        (1, "update", 1, 1, 0, False, False),
+        (2, "delete", 0, 0, 1, False, False),
+        (3, "update", 0, 0, 0, False, False),
+        (4, "rename", 0, 0, 0, False, True),
+        (5, "delete", 0, 0, 0, False, False),
+    ]
+    assert report["matched_count"] == 1 and report["deleted_count"] == 1
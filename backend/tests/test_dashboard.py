@@ -0,0 +1,15 @@
+from map_reduce.dashboard import execute_dashboard
+
+
+def test_invalid_values_are_not_counted_in_the_open_range(collection):
+    for anciennete in (1, 20, -3, "dix", 3.5):
+        collection.insert_one({"nom": "Martin", "anciennete": anciennete, "prime": 100})
+    collection.insert_one({"nom": "Durand", "prime": -50})
+
+    dashboard = execute_dashboard(collection)
+
+    counts = {(bucket["min"], bucket["max"]): bucket["count"] for bucket in dashboard["anciennete"]}
+    assert counts[(0, 3)] == 2  # 1 et le champ absent (0)
+    assert counts[(3, 6)] == 1
+    assert counts[(16, None)] == 1
+    assert dashboard["invalides"] == {"anciennete": 2, "prime": 1}
@@ -0,0 +1,51 @@
+import pytest
+
+from mongo_utils import MongoConnectionManager, MongoDBClient, derived_fields
+
+
+@pytest.fixture
+def client(collection):
+    """MongoDBClient branché sur la collection mongomock"""
+    client = MongoDBClient()
+    client.connections = MongoConnectionManager(
+        None, collection.database.name, collection.name,
+        lambda uri, **options: collection.database.client, options={}
+    )
+    return client
+
+
+def insert(collection, nom, **fields):
+    employee = dict({"nom": nom, "prenom": "Anne", "adresse": {"ville": "Lyon"}}, **fields)
+    employee.update(derived_fields(employee))
+    return collection.insert_one(employee).inserted_id
+
+
+def page_through(client, sort, limit):
+    seen = []
+    after = None
+    while True:
+        result = client.group_by_city("Lyon", sort, after, limit)
+        seen += [employee["_id"] for employee in result["employees"]]
+        after = result["next"]
+        if after is None:
+            return seen, result["count"]
+
+
+@pytest.mark.parametrize("sort", ["anciennete", "prime", "nom"])
+def test_pages_include_missing_and_null_sort_values(client, collection, sort):
+    ids = [
+        insert(collection, "Martin", anciennete=5, prime=100),
+        insert(collection, "Durand", anciennete=None, prime=None),
+        insert(collection, "Petit", anciennete=12, prime=300),
+        insert(collection, "Bernard"),
+        insert(collection, "Moreau", anciennete=5, prime=100),
+        insert(collection, "Lefebvre"),
+    ]
+    for index in range(3):
+        collection.insert_one({"prenom": "Paul", "adresse": {"ville": "Lyon"}})
+    ids += [employee["_id"] for employee in collection.find({"nom": {"$exists": False}})]
+
+    for limit in (1, 2, 4):
+        seen, count = page_through(client, sort, limit)
+        assert sorted(seen) == sorted(ids)
+        assert len(seen) == count == len(ids)
@@ -0,0 +1,70 @@
+import name_search
+from mongo_utils import derived_fields
+from name_search import index_employee, rebuild_name_index, search_names
+
+
+def insert(collection, nom, prenom):
+    employee = {"nom": nom, "prenom": prenom}
+    employee.update(derived_fields(employee))
+    return collection.insert_one(employee).inserted_id
+
+
+def test_exact_match_beyond_candidate_batch(collection, monkeypatch):
+    monkeypatch.setattr(name_search, "SEARCH_BATCH_SIZE", 2)
+    for index in range(12):
+        insert(collection, f"Durand{index}", "Marianne")
+    exact = insert(collection, "Martin", "Mari")
+    rebuild_name_index(collection)
+
+    results = search_names(collection, "mari", limit=1)
+
+    assert [employee["_id"] for employee in results] == [exact]
+
+
+def test_results_are_ranked_then_limited(collection, monkeypatch):
+    monkeypatch.setattr(name_search, "SEARCH_BATCH_SIZE", 3)
+    contains = insert(collection, "Lemarchand", "Paul")
+    prefix = insert(collection, "Marchand", "Luc")
+    for index in range(8):
+        insert(collection, f"Petit{index}", "Anne")
+    rebuild_name_index(collection)
+
+    results = search_names(collection, "marchand", limit=5)
+
+    assert [employee["_id"] for employee in results] == [prefix, contains]
+
+
+def test_rarest_trigram_drives_the_lookup(collection):
+    for index in range(5):
+        insert(collection, "Martin", f"Jean{index}")
+    insert(collection, "Martinez", "Zoé")
+    rebuild_name_index(collection)
+
+    grams = name_search.trigrams("tinez")
+    rarest = name_search._rarest_first(collection, grams)[0]
+
+    assert rarest in {"ine", "nez"}
+    assert [employee["nom"] for employee in search_names(collection, "tinez")] == ["Martinez"]
+
+
+def test_writes_before_the_first_rebuild_do_not_hide_older_employees(collection):
+    insert(collection, "Durand", "Marie")
+    insert(collection, "Petit", "Marianne")
+    newcomer = {"_id": insert(collection, "Bernard", "Luc"), "nom": "Bernard", "prenom": "Luc"}
+    index_employee(collection, newcomer)
+
+    assert sorted(employee["prenom"] for employee in search_names(collection, "mari")) == ["Marianne", "Marie"]
+
+    rebuild_name_index(collection)
+    index_employee(collection, newcomer)
+
+    assert sorted(employee["prenom"] for employee in search_names(collection, "mari")) == ["Marianne", "Marie"]
+
+
+def test_short_patterns_match_accent_folded_prefixes(collection):
+    lemaire = insert(collection, "Lémaire", "Paul")
+    insert(collection, "Dulé", "Anne")
+    rebuild_name_index(collection)
+
+    assert [employee["_id"] for employee in search_names(collection, "le")] == [lemaire]
+    assert [employee["_id"] for employee in search_names(collection, "lém")] == [lemaire]
@@ -0,0 +1,36 @@
+import pytest
+
+from map_reduce.ville_stats import execute_ville_stats
+from map_reduce.ville_stats_summary import (
+    check_ville_stats_summary,
+    read_ville_stats_summary,
+    record_employee_change
+)
+
+
+def insert_lyon(collection, *anciennetes):
+    collection.insert_many([{"adresse": {"ville": "Lyon"}, "anciennete": value} for value in anciennetes])
+
+
+@pytest.mark.parametrize("engine", ["aggregate", "python"])
+def test_non_numeric_seniority_is_skipped(collection, engine):
+    insert_lyon(collection, 3, "7", True, 4.5)
+
+    (stats,) = execute_ville_stats(collection, engine)
+
+    assert stats["_id"] == "Lyon"
+    assert stats["value"]["count"] == 2
+    assert stats["value"]["sum"] == 7.5
+
+
+def test_summary_rebuild_matches_incremental_updates(collection):
+    insert_lyon(collection, 3, "7", 12)
+    employee = {"adresse": {"ville": "Lyon"}, "anciennete": "dix"}
+    collection.insert_one(employee)
+    record_employee_change(collection, after=employee)
+
+    (stats,) = read_ville_stats_summary(collection)
+
+    assert stats["value"]["count"] == 2
+    assert stats["value"]["max"] == 12
+    assert check_ville_stats_summary(collection)["consistent"]
@@ -43,6 +43,7 @@ const EmployeeForm: React.FC = () => {
   const [loading, setLoading] = useState(false);
   const [success, setSuccess] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  const [duplicate, setDuplicate] = useState(false);
 
   const handleChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     const { name, value } = e.target;
@@ -64,10 +65,10 @@ const EmployeeForm: React.FC = () => {
     }
   };
 
-  const handleSubmit = async (e: React.FormEvent) => {
-    e.preventDefault();
+  const submitEmployee = async (onDuplicate: 'allow' | 'reject') => {
     setLoading(true);
     setError(null);
+    setDuplicate(false);
     setSuccess(false);
 
     try {
@@ -78,7 +79,7 @@ const EmployeeForm: React.FC = () => {
       if (!getApiBaseUrl()) {
         throw new Error('VITE_API_URL not configured; set it in public/config.json or in the build environment.');
       }
-      await employeeApi.addEmployee(employee);
+      await employeeApi.addEmployee(employee, onDuplicate);
       setSuccess(true);
       setEmployee({
         nom: '',
@@ -98,12 +99,22 @@ const EmployeeForm: React.FC = () => {
         setSuccess(false);
       }, 3000);
     } catch (err: any) {
-      setError(err.message || 'Erreur lors de l\'ajout de l\'employé');
+      if (err.response?.status === 409) {
+        // Même nom + prénom déjà enregistré : demander confirmation
+        setDuplicate(true);
+      } else {
+        setError(err.response?.data?.error || err.message || 'Erreur lors de l\'ajout de l\'employé');
+      }
     } finally {
       setLoading(false);
     }
   };
 
+  const handleSubmit = (e: React.FormEvent) => {
+    e.preventDefault();
+    submitEmployee('reject');
+  };
+
   const villesFrance = [
     'Paris', 'Lyon', 'Marseille', 'Toulouse', 'Bordeaux',
     'Lille', 'Nantes', 'Strasbourg', 'Montpellier', 'Nice',
@@ -136,6 +147,20 @@ const EmployeeForm: React.FC = () => {
         </Alert>
       )}
 
+      {duplicate && (
+        <Alert
+          severity="warning"
+          sx={{ mb: 3 }}
+          action={
+            <Button color="inherit" size="small" disabled={loading} onClick={() => submitEmployee('allow')}>
+              Ajouter quand même
+            </Button>
+          }
+        >
+          ⚠️ Un employé {employee.prenom} {employee.nom} existe déjà.
+        </Alert>
+      )}
+
       <form onSubmit={handleSubmit}>
         <Grid container spacing={3}>
           {/* Informations personnelles */}
@@ -53,54 +53,39 @@ const StatsDashboard: React.FC = () => {
       if (!getApiBaseUrl()) {
         throw new Error('VITE_API_URL not configured; set it in public/config.json or in the build environment (netlify.toml).');
       }
-      const employeesResponse = await employeeApi.getAllEmployees();
-      const employees = employeesResponse.data;
+      // Résumé calculé par le serveur : quelques Ko au lieu de la liste complète
+      const { data: dashboard } = await employeeApi.getDashboard();
       
-      // Calcul des statistiques
-      const totalEmployees = employees.length;
-      const totalSeniority = employees.reduce((sum: number, emp: any) => sum + (emp.anciennete || 0), 0);
-      const averageSeniority = totalEmployees > 0 ? totalSeniority / totalEmployees : 0;
+      const totalEmployees = dashboard.total;
+      const averageSeniority = dashboard.anciennete_moyenne || 0;
+      const totalCities = dashboard.villes.length;
+      const totalPrime = dashboard.prime_totale || 0;
+      const employeesWithPrime = dashboard.avec_prime;
+      const seniorEmployees = dashboard.seniors;
       
-      const cities = new Set(employees.map((emp: any) => emp.adresse?.ville).filter(Boolean));
-      const totalCities = cities.size;
-      
-      const totalPrime = employees.reduce((sum: number, emp: any) => sum + (emp.prime || 0), 0);
-      const employeesWithPrime = employees.filter((emp: any) => emp.prime > 0).length;
-      const seniorEmployees = employees.filter((emp: any) => emp.anciennete > 10).length;
-      
-      // Distribution par ville
-      const cityCounts: { [key: string]: number } = {};
-      employees.forEach((emp: any) => {
-        const city = emp.adresse?.ville || 'Non spécifiée';
-        cityCounts[city] = (cityCounts[city] || 0) + 1;
-      });
-      
-      const cityDistribution = Object.entries(cityCounts).map(([name, value]) => ({
-        name: name,
-        value: value,
-        percentage: Math.round((value / totalEmployees) * 100)
-      })).sort((a, b) => b.value - a.value).slice(0, 5);
-      
-      // Distribution par ancienneté
-      const seniorityRanges = [
-        { range: '0-2 ans', min: 0, max: 2 },
-        { range: '3-5 ans', min: 3, max: 5 },
-        { range: '6-10 ans', min: 6, max: 10 },
-        { range: '11-15 ans', min: 11, max: 15 },
-        { range: '15+ ans', min: 16, max: Infinity }
-      ];
-      
-      const seniorityDistribution = seniorityRanges.map(range => {
-        const count = employees.filter((emp: any) => 
-          emp.anciennete >= range.min && emp.anciennete <= range.max
-        ).length;
-        return {
-          name: range.range,
-          value: count,
-          percentage: Math.round((count / totalEmployees) * 100)
-        };
-      });
+      // Distribution par ville (villes déjà triées par effectif)
+      const cityDistribution = dashboard.villes.slice(0, 5).map((city: any) => ({
+        name: city.ville,
+        value: city.count,
+        percentage: totalEmployees > 0 ? Math.round((city.count / totalEmployees) * 100) : 0
+      }));
       
+      // Distribution par ancienneté : tranches [min, max) du serveur
+      const seniorityDistribution = dashboard.anciennete.map((range: any) => ({
+        name: range.max === null ? `${range.min}+ ans` : `${range.min}-${range.max - 1} ans`,
+        value: range.count,
+        percentage: totalEmployees > 0 ? Math.round((range.count / totalEmployees) * 100) : 0
+      }));
+      // Anciennetés négatives ou non numériques : comptées à part par le serveur
+      const invalidSeniority = dashboard.invalides?.anciennete || 0;
+      if (invalidSeniority > 0) {
+        seniorityDistribution.push({
+          name: 'Non valide',
+          value: invalidSeniority,
+          percentage: totalEmployees > 0 ? Math.round((invalidSeniority / totalEmployees) * 100) : 0
+        });
+      }
+
       setStats({
         totalEmployees,
         averageSeniority,
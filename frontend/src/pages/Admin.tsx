@@ -47,6 +47,7 @@ const Admin: React.FC = () => {
   const [editDialogOpen, setEditDialogOpen] = useState(false);
   const [deleteDialogOpen, setDeleteDialogOpen] = useState(false);
   const [addDialogOpen, setAddDialogOpen] = useState(false);
+  const [duplicateWarning, setDuplicateWarning] = useState(false);
   
   // États pour le formulaire d'édition/ajout
   const [formData, setFormData] = useState({
@@ -86,8 +87,9 @@ const Admin: React.FC = () => {
   }, []);
 
   // Gestion des employés - CRUD
-  const handleAddEmployee = async () => {
+  const handleAddEmployee = async (onDuplicate: 'allow' | 'reject' = 'reject') => {
     setLoading(true);
+    setDuplicateWarning(false);
     try {
       // Préparer les données (sans _id pour l'ajout)
       const { _id, ...employeeData } = formData;
@@ -104,12 +106,17 @@ const Admin: React.FC = () => {
         }
       };
 
-      await employeeApi.addEmployee(dataToSend);
+      await employeeApi.addEmployee(dataToSend, onDuplicate);
       setSuccess('Employé ajouté avec succès !');
       setAddDialogOpen(false);
       resetForm();
       fetchEmployees();
     } catch (err: any) {
+      if (err.response?.status === 409) {
+        // Doublon nom + prénom : confirmation dans le dialogue
+        setDuplicateWarning(true);
+        return;
+      }
       setError(err.response?.data?.error || 'Erreur lors de l\'ajout');
     } finally {
       setLoading(false);
@@ -203,6 +210,7 @@ const Admin: React.FC = () => {
 
   const openAddDialog = () => {
     resetForm();
+    setDuplicateWarning(false);
     setAddDialogOpen(true);
   };
 
@@ -393,6 +401,12 @@ const Admin: React.FC = () => {
           </Box>
         </DialogTitle>
         <DialogContent>
+          {duplicateWarning && (
+            <Alert severity="warning" sx={{ mt: 1 }}>
+              Un employé {formData.prenom} {formData.nom} existe déjà. Cliquez sur
+              « Ajouter quand même » pour confirmer le doublon.
+            </Alert>
+          )}
           <Box sx={{ pt: 2 }}>
             <Grid container spacing={2}>
               <Grid item xs={12} md={6}>
@@ -510,14 +524,14 @@ const Admin: React.FC = () => {
             Annuler
           </Button>
           <Button 
-            onClick={handleAddEmployee} 
+            onClick={() => handleAddEmployee(duplicateWarning ? 'allow' : 'reject')} 
             variant="contained" 
-            color="primary"
+            color={duplicateWarning ? 'warning' : 'primary'}
             startIcon={<SaveIcon />}
             disabled={!formData.nom || !formData.prenom || loading}
             sx={{ px: 3 }}
           >
-            {loading ? 'Ajout en cours...' : 'Ajouter'}
+            {loading ? 'Ajout en cours...' : duplicateWarning ? 'Ajouter quand même' : 'Ajouter'}
           </Button>
         </DialogActions>
       </Dialog>
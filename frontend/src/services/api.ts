@@ -30,19 +30,33 @@ export const employeeApi = {
     if (!getApiBaseUrl()) {
       return Promise.reject(new Error('VITE_API_URL is not configured'));
     }
-    return api.get(`${getApiBaseUrl()}/employees`).then((res) => {
+    // Suivre le curseur "next" de la pagination keyset jusqu'à la dernière page
+    const fetchPage = async (after?: string, previous: any[] = []): Promise<any> => {
+      const params = after ? { after } : undefined;
+      const res = await api.get(`${getApiBaseUrl()}/employees`, { params });
       // Normaliser la réponse : certains backend renvoient { employees: [...] }
-      const data = Array.isArray(res.data) ? res.data : (res.data.employees || res.data);
-      return { ...res, data };
-    });
+      const page = Array.isArray(res.data) ? res.data : (res.data.employees || res.data);
+      const data = previous.concat(page);
+      const next = Array.isArray(res.data) ? null : res.data.next;
+      return next ? fetchPage(next, data) : { ...res, data };
+    };
+    return fetchPage();
+  },
+  // Flux des modifications : sans jeton, renvoie la position actuelle
+  getChanges: (since?: string, limit?: number) => {
+    if (!getApiBaseUrl()) return Promise.reject(new Error('VITE_API_URL is not configured'));
+    return api.get(`${getApiBaseUrl()}/employees/changes`, { params: { since, limit } });
   },
   countEmployees: () => {
     if (!getApiBaseUrl()) return Promise.reject(new Error('VITE_API_URL is not configured'));
     return api.get(`${getApiBaseUrl()}/employees/count`);
   },
-  addEmployee: (employee: any) => {
+  // onDuplicate = 'reject' : réponse 409 (avec duplicate_id) si le nom + prénom existe déjà
+  addEmployee: (employee: any, onDuplicate?: 'allow' | 'reject') => {
     if (!getApiBaseUrl()) return Promise.reject(new Error('VITE_API_URL is not configured'));
-    return api.post(`${getApiBaseUrl()}/employees`, employee);
+    return api.post(`${getApiBaseUrl()}/employees`, employee, {
+      params: onDuplicate ? { on_duplicate: onDuplicate } : undefined
+    });
   },
 
   // Queries
@@ -73,14 +87,26 @@ export const employeeApi = {
     return api.post(`${getApiBaseUrl()}/employees/increment-prime`, { amount });
   },
 
+  // Exécution par lots en arrière-plan ; renvoyer le même jobId reprend le travail
+  startIncrementPrimeJob: (amount: number = 200, jobId?: string) => {
+    if (!getApiBaseUrl()) return Promise.reject(new Error('VITE_API_URL is not configured'));
+    return api.post(`${getApiBaseUrl()}/employees/increment-prime?mode=job`, { amount, job_id: jobId });
+  },
+
+  getJob: (jobId: string) => {
+    if (!getApiBaseUrl()) return Promise.reject(new Error('VITE_API_URL is not configured'));
+    return api.get(`${getApiBaseUrl()}/jobs/${encodeURIComponent(jobId)}`);
+  },
+
   getOldestEmployees: (limit: number = 10) => {
     if (!getApiBaseUrl()) return Promise.reject(new Error('VITE_API_URL is not configured'));
     return api.get(`${getApiBaseUrl()}/employees/oldest/${limit}`);
   },
 
-  groupByCity: (city: string) => {
+  // Effectif, statistiques et une page d'employés ; passer "next" en after pour la suite
+  groupByCity: (city: string, params?: { sort?: string; after?: string; limit?: number }) => {
     if (!getApiBaseUrl()) return Promise.reject(new Error('VITE_API_URL is not configured'));
-    return api.get(`${getApiBaseUrl()}/employees/city/${city}`);
+    return api.get(`${getApiBaseUrl()}/employees/city/${city}`, { params });
   },
 
   searchEmployees: (namePattern: string, cities: string[]) => {
@@ -93,6 +119,11 @@ export const employeeApi = {
     if (!getApiBaseUrl()) return Promise.reject(new Error('VITE_API_URL not configured; set it in public/config.json or in the build environment.'));
     return api.get(`${getApiBaseUrl()}/analytics/ville-stats`);
   },
+  // Résumé du tableau de bord calculé côté serveur (une seule agrégation)
+  getDashboard: (top: number = 10) => {
+    if (!getApiBaseUrl()) return Promise.reject(new Error('VITE_API_URL not configured; set it in public/config.json or in the build environment.'));
+    return api.get(`${getApiBaseUrl()}/analytics/dashboard`, { params: { top } });
+  },
   getDoublons: () => {
     if (!getApiBaseUrl()) return Promise.reject(new Error('VITE_API_URL not configured; set it in public/config.json or in the build environment.'));
     return api.get(`${getApiBaseUrl()}/analytics/doublons`);